@@ -127,6 +127,58 @@ STATIC_URL = "static/"
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "media/"
 
+# Vector index (retrieval_qa_with_source)
+VECTORSTORE_ROOT = BASE_DIR / "vectorstore"
+# 指定するとこのディレクトリ配下の全PDFを検索対象にする（manage.py ingest_corpus で事前に取り込む）
+RETRIEVAL_CORPUS_DIR = os.getenv("RETRIEVAL_CORPUS_DIR")
+# 埋め込みモデル（"local-hashing" で始まる値にするとAPIを呼ばないローカルの埋め込みになる）
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# 埋め込みキャッシュ（ディスク上のSQLiteと、プロセス内LRUの上限バイト数）
+EMBEDDING_CACHE_PATH = VECTORSTORE_ROOT / "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_BYTES = int(
+    os.getenv("EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+# 解析済みPDFのプロセス内キャッシュの上限（バイト）
+DATALOADER_CACHE_MAX_BYTES = int(
+    os.getenv("DATALOADER_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+)
+# ベクトル検索の実装（"chroma" または "numpy"）
+VECTORSTORE_BACKEND = os.getenv("VECTORSTORE_BACKEND", "chroma")
+# numpy のときのIVFのリスト数（0なら総当たり）と、検索時に探すリスト数
+VECTORSTORE_IVF_LISTS = int(os.getenv("VECTORSTORE_IVF_LISTS", 0))
+VECTORSTORE_IVF_PROBES = int(os.getenv("VECTORSTORE_IVF_PROBES", 8))
+# 回答キャッシュ（有効期限が0ならキャッシュしない。類似度はほぼ同じ質問とみなすコサイン類似度の下限）
+ANSWER_CACHE_PATH = VECTORSTORE_ROOT / "answer_cache.sqlite3"
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 24 * 60 * 60))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+
+# LLM APIのHTTP接続プール（line_qa_with_gpt_and_dalle）。タイムアウトは秒
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100))
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 30))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", 600))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", 5))
+# 会話履歴のプロセス内キャッシュ（保持するユーザ数と、使われなくなってから捨てるまでの秒数）
+CHAT_HISTORY_CACHE_MAX_USERS = int(os.getenv("CHAT_HISTORY_CACHE_MAX_USERS", 1000))
+CHAT_HISTORY_CACHE_IDLE_SECONDS = float(
+    os.getenv("CHAT_HISTORY_CACHE_IDLE_SECONDS", 30 * 60)
+)
+# 会話ログの画面に1ページで表示する件数（両アプリ共通）
+CHAT_LOG_PAGE_SIZE = int(os.getenv("CHAT_LOG_PAGE_SIZE", 50))
+# 画像・音声の生成となぞなぞの評価のジョブ（run_media_worker）。種類ごとの同時実行数、キューを見に行く間隔（秒）、
+# running のまま放置されたジョブをキューに戻すまでの秒数、失敗したときに試す回数の上限
+MEDIA_JOB_CONCURRENCY = {
+    "dalle": int(os.getenv("MEDIA_JOB_DALLE_CONCURRENCY", 2)),
+    "tts": int(os.getenv("MEDIA_JOB_TTS_CONCURRENCY", 4)),
+    "stt": int(os.getenv("MEDIA_JOB_STT_CONCURRENCY", 2)),
+    "evaluation": int(os.getenv("MEDIA_JOB_EVALUATION_CONCURRENCY", 2)),
+}
+MEDIA_JOB_POLL_SECONDS = float(os.getenv("MEDIA_JOB_POLL_SECONDS", 1))
+MEDIA_JOB_TIMEOUT_SECONDS = int(os.getenv("MEDIA_JOB_TIMEOUT_SECONDS", 10 * 60))
+MEDIA_JOB_MAX_ATTEMPTS = int(os.getenv("MEDIA_JOB_MAX_ATTEMPTS", 3))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,3 @@
+# line_qa_with_gpt_and_dalle のテストはDBを使う django.test.TestCase なので、pytest では集めない
+# （python manage.py test line_qa_with_gpt_and_dalle で動かす）
+collect_ignore = ["line_qa_with_gpt_and_dalle"]
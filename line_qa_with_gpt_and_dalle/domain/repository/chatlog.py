@@ -1,5 +1,21 @@
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from config.settings import CHAT_LOG_PAGE_SIZE
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog_cache import (
+    chat_history_cache,
+)
 from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
-from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+from line_qa_with_gpt_and_dalle.domain.valueobject.page import (
+    ChatLogCursor,
+    ChatLogPage,
+)
+from line_qa_with_gpt_and_dalle.models import (
+    ChatHistoryVersionWithLine,
+    ChatLogsWithLine,
+    ChatSummaryWithLine,
+)
 
 
 class ChatLogRepository:
@@ -12,33 +28,295 @@ class ChatLogRepository:
 
     @staticmethod
     def find_chatlog_by_user_id(user_id: int) -> list[ChatLogsWithLine]:
-        return ChatLogsWithLine.objects.filter(user_id=user_id)
+        """
+        Note: 前回読んだ行より新しいものだけを DB から読み足す（chat_history_cache）
+        """
+        return chat_history_cache.get(
+            user_id,
+            lambda last_pk: ChatLogRepository._find_newer(user_id, last_pk),
+            lambda: ChatLogRepository._find_version(user_id),
+        ).rows
+
+    @staticmethod
+    def find_chatlog_page_by_user_id(
+        user_id: int,
+        before: ChatLogCursor | None = None,
+        limit: int = CHAT_LOG_PAGE_SIZE,
+    ) -> ChatLogPage:
+        """
+        新しい順に limit 件を読む（キーセットページング）。before を渡すとそれより古い行を読む
+        OFFSET と違って読み飛ばす行を数えないので、古いページでも (user, created_at, id) のインデックスを limit 件なめるだけで済む
+        """
+        queryset = ChatLogsWithLine.objects.filter(user_id=user_id)
+        if before is not None:
+            # 範囲の条件（created_at <=）を別に書いておくと、OR があってもインデックスで位置を探せる
+            queryset = queryset.filter(created_at__lte=before.created_at).filter(
+                Q(created_at__lt=before.created_at) | Q(pk__lt=before.pk)
+            )
+        # 1件多く読んで、さらに古い行があるかを判定する
+        rows = list(queryset.order_by("-created_at", "-pk")[: limit + 1])
+        older = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            older = ChatLogCursor(created_at=rows[-1].created_at, pk=rows[-1].pk)
+
+        return ChatLogPage(rows=rows[::-1], older=older)
+
+    @staticmethod
+    def find_chat_history_by_user_id(user_id: int) -> list[MyChatCompletionMessage]:
+        return chat_history_cache.get(
+            user_id,
+            lambda last_pk: ChatLogRepository._find_newer(user_id, last_pk),
+            lambda: ChatLogRepository._find_version(user_id),
+        ).messages
+
+    @staticmethod
+    def _find_newer(user_id: int, last_pk: int) -> list[ChatLogsWithLine]:
+        return list(
+            ChatLogsWithLine.objects.filter(user_id=user_id, pk__gt=last_pk)
+            .select_related("user")
+            .order_by("pk")
+        )
+
+    @staticmethod
+    def _find_version(user_id: int) -> int:
+        return (
+            ChatHistoryVersionWithLine.objects.filter(user_id=user_id)
+            .values_list("version", flat=True)
+            .first()
+            or 0
+        )
+
+    @staticmethod
+    def _bump_version(user_id: int):
+        """
+        既存の行を書き換えたことを、ほかのプロセスの会話履歴のキャッシュに知らせる
+        """
+        _, created = ChatHistoryVersionWithLine.objects.get_or_create(
+            user_id=user_id, defaults={"version": 1}
+        )
+        if not created:
+            ChatHistoryVersionWithLine.objects.filter(user_id=user_id).update(
+                version=F("version") + 1
+            )
 
     @staticmethod
     def insert(my_chat_completion_message: MyChatCompletionMessage):
-        ChatLogsWithLine.objects.create(
+        entity = ChatLogsWithLine.objects.create(
             user=my_chat_completion_message.user,
             role=my_chat_completion_message.role,
             content=my_chat_completion_message.content,
             file_path=my_chat_completion_message.file_path,
+            media_type=my_chat_completion_message.media_type,
             invisible=my_chat_completion_message.invisible,
         )
+        my_chat_completion_message.id = entity.pk
 
     @staticmethod
-    def bulk_insert(my_chat_completion_message_list: list[MyChatCompletionMessage]):
-        ChatLogsWithLine.objects.bulk_create(
-            [x.to_entity() for x in my_chat_completion_message_list]
-        )
+    def bulk_insert(
+        my_chat_completion_message_list: list[MyChatCompletionMessage],
+    ) -> list[int]:
+        """
+        1つのトランザクションでまとめて保存し、採番された pk を各メッセージの id に入れて返す
+        """
+        with transaction.atomic():
+            return ChatLogRepository._create_all(my_chat_completion_message_list)
+
+    @staticmethod
+    def _create_all(messages: list[MyChatCompletionMessage]) -> list[int]:
+        entities = [x.to_entity() for x in messages]
+        if connection.features.can_return_rows_from_bulk_insert:
+            ChatLogsWithLine.objects.bulk_create(entities)
+        else:
+            # MySQL は bulk_create で pk を返せないので、1件ずつ insert する（呼び出し側のトランザクションでコミットは1回）
+            for entity in entities:
+                entity.save(force_insert=True)
+        for message, entity in zip(messages, entities):
+            message.id = entity.pk
+
+        return [x.pk for x in entities]
+
+    @staticmethod
+    def unit_of_work() -> "ChatLogUnitOfWork":
+        return ChatLogUnitOfWork()
 
     @staticmethod
     def upsert(my_chat_completion_message: MyChatCompletionMessage):
-        ChatLogsWithLine.objects.update_or_create(
-            id=my_chat_completion_message.id,
-            defaults={
-                "user": my_chat_completion_message.user,
-                "role": my_chat_completion_message.role,
-                "content": my_chat_completion_message.content,
-                "file_path": my_chat_completion_message.file_path,
-                "invisible": my_chat_completion_message.invisible,
-            },
+        """
+        Note: update_or_create は SELECT してから書き込むので、先に UPDATE して対象がなかったときだけ INSERT する
+        """
+        fields = ChatLogRepository._to_fields(my_chat_completion_message)
+        if my_chat_completion_message.id is None or not ChatLogsWithLine.objects.filter(
+            pk=my_chat_completion_message.id
+        ).update(**fields):
+            entity = ChatLogsWithLine.objects.create(
+                id=my_chat_completion_message.id, **fields
+            )
+            my_chat_completion_message.id = entity.pk
+        # 既存の行が書き換わるので、読み足しでは拾えない。どのプロセスの履歴も捨てられるよう番号を上げる
+        ChatLogRepository._bump_version(my_chat_completion_message.user.pk)
+        chat_history_cache.invalidate(my_chat_completion_message.user.pk)
+
+    @staticmethod
+    async def afind_chatlog_by_user_id(user_id: int) -> list[ChatLogsWithLine]:
+        history = await chat_history_cache.aget(
+            user_id,
+            lambda last_pk: ChatLogRepository._afind_newer(user_id, last_pk),
+            lambda: ChatLogRepository._afind_version(user_id),
+        )
+        return history.rows
+
+    @staticmethod
+    async def afind_chat_history_by_user_id(
+        user_id: int,
+    ) -> list[MyChatCompletionMessage]:
+        history = await chat_history_cache.aget(
+            user_id,
+            lambda last_pk: ChatLogRepository._afind_newer(user_id, last_pk),
+            lambda: ChatLogRepository._afind_version(user_id),
+        )
+        return history.messages
+
+    @staticmethod
+    async def _afind_newer(user_id: int, last_pk: int) -> list[ChatLogsWithLine]:
+        """
+        Note: 非同期のコンテキストでは遅延読み込みができないので、user も一緒に読んでおく
+        """
+        return [
+            x
+            async for x in ChatLogsWithLine.objects.filter(
+                user_id=user_id, pk__gt=last_pk
+            )
+            .select_related("user")
+            .order_by("pk")
+        ]
+
+    @staticmethod
+    async def _afind_version(user_id: int) -> int:
+        return (
+            await ChatHistoryVersionWithLine.objects.filter(user_id=user_id)
+            .values_list("version", flat=True)
+            .afirst()
+            or 0
+        )
+
+    @staticmethod
+    async def _abump_version(user_id: int):
+        _, created = await ChatHistoryVersionWithLine.objects.aget_or_create(
+            user_id=user_id, defaults={"version": 1}
+        )
+        if not created:
+            await ChatHistoryVersionWithLine.objects.filter(user_id=user_id).aupdate(
+                version=F("version") + 1
+            )
+
+    @staticmethod
+    async def ainsert(my_chat_completion_message: MyChatCompletionMessage):
+        entity = await ChatLogsWithLine.objects.acreate(
+            user=my_chat_completion_message.user,
+            role=my_chat_completion_message.role,
+            content=my_chat_completion_message.content,
+            file_path=my_chat_completion_message.file_path,
+            media_type=my_chat_completion_message.media_type,
+            invisible=my_chat_completion_message.invisible,
+        )
+        my_chat_completion_message.id = entity.pk
+
+    @staticmethod
+    async def abulk_insert(
+        my_chat_completion_message_list: list[MyChatCompletionMessage],
+    ) -> list[int]:
+        # transaction.atomic は非同期のコンテキストでは使えないので、同期版をスレッドで動かす
+        return await sync_to_async(ChatLogRepository.bulk_insert)(
+            my_chat_completion_message_list
         )
+
+    @staticmethod
+    async def aupsert(my_chat_completion_message: MyChatCompletionMessage):
+        fields = ChatLogRepository._to_fields(my_chat_completion_message)
+        if (
+            my_chat_completion_message.id is None
+            or not await ChatLogsWithLine.objects.filter(
+                pk=my_chat_completion_message.id
+            ).aupdate(**fields)
+        ):
+            entity = await ChatLogsWithLine.objects.acreate(
+                id=my_chat_completion_message.id, **fields
+            )
+            my_chat_completion_message.id = entity.pk
+        # 既存の行が書き換わるので、読み足しでは拾えない。どのプロセスの履歴も捨てられるよう番号を上げる
+        await ChatLogRepository._abump_version(my_chat_completion_message.user.pk)
+        chat_history_cache.invalidate(my_chat_completion_message.user.pk)
+
+    @staticmethod
+    def _to_fields(my_chat_completion_message: MyChatCompletionMessage) -> dict:
+        return {
+            "user": my_chat_completion_message.user,
+            "role": my_chat_completion_message.role,
+            "content": my_chat_completion_message.content,
+            "file_path": my_chat_completion_message.file_path,
+            "media_type": my_chat_completion_message.media_type,
+            "invisible": my_chat_completion_message.invisible,
+        }
+
+    @staticmethod
+    def find_summary_by_user_id(user_id: int) -> ChatSummaryWithLine | None:
+        return ChatSummaryWithLine.objects.filter(user_id=user_id).first()
+
+    @staticmethod
+    def upsert_summary(user_id: int, content: str, last_chatlog_id: int):
+        ChatSummaryWithLine.objects.update_or_create(
+            user_id=user_id,
+            defaults={"content": content, "last_chatlog_id": last_chatlog_id},
+        )
+
+    @staticmethod
+    async def afind_summary_by_user_id(user_id: int) -> ChatSummaryWithLine | None:
+        return await ChatSummaryWithLine.objects.filter(user_id=user_id).afirst()
+
+    @staticmethod
+    async def aupsert_summary(user_id: int, content: str, last_chatlog_id: int):
+        await ChatSummaryWithLine.objects.aupdate_or_create(
+            user_id=user_id,
+            defaults={"content": content, "last_chatlog_id": last_chatlog_id},
+        )
+
+
+class ChatLogUnitOfWork:
+    """
+    1ターンぶんの会話ログをためておき、flush で1つのトランザクションにまとめて保存する
+    1件ずつ insert すると、そのたびに自動コミットの往復が発生するため
+
+    Note: flush するまでメッセージの id は None のまま
+    """
+
+    def __init__(self):
+        self.pending: list[MyChatCompletionMessage] = []
+
+    def add(
+        self, messages: MyChatCompletionMessage | list[MyChatCompletionMessage]
+    ) -> MyChatCompletionMessage | list[MyChatCompletionMessage]:
+        if isinstance(messages, list):
+            self.pending.extend(messages)
+        else:
+            self.pending.append(messages)
+
+        return messages
+
+    def flush(self) -> list[int]:
+        """
+        Returns:
+            list[int]: 採番された pk（add した順）。各メッセージの id にも入る
+        """
+        if not self.pending:
+            return []
+        messages, self.pending = self.pending, []
+
+        return ChatLogRepository.bulk_insert(messages)
+
+    async def aflush(self) -> list[int]:
+        if not self.pending:
+            return []
+        messages, self.pending = self.pending, []
+
+        return await ChatLogRepository.abulk_insert(messages)
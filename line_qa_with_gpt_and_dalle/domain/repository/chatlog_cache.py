@@ -0,0 +1,177 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from config.settings import (
+    CHAT_HISTORY_CACHE_MAX_USERS,
+    CHAT_HISTORY_CACHE_IDLE_SECONDS,
+)
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+
+
+@dataclass
+class ChatHistory:
+    """
+    ユーザごとの読み込み済みの会話履歴
+
+    Attributes:
+        last_pk (int): 読み込み済みの最大の pk。次はこれより新しい行だけを読む。
+        version (int): 読み込みを始めたときの ChatHistoryVersionWithLine.version。DB の値と違えば捨てる。
+        rows (list[ChatLogsWithLine]): 画面表示用の行（pk順）。
+        messages (list[MyChatCompletionMessage]): LLM に渡す形に変換した履歴（rows と同じ順）。
+        last_access (float): 最後に使われた時刻（time.monotonic）。
+    """
+
+    last_pk: int = 0
+    version: int = 0
+    rows: list[ChatLogsWithLine] = field(default_factory=list)
+    messages: list[MyChatCompletionMessage] = field(default_factory=list)
+    last_access: float = 0.0
+
+
+class ChatHistoryCache:
+    """
+    ユーザごとの会話履歴をプロセス内に持ち、毎ターン「前回読んだ pk より新しい行」だけを読み足す
+
+    - 行の追加（insert）は次の読み込みで拾えるので何もしない
+    - 既存の行の更新（upsert）は ChatLogRepository が DB の番号（ChatHistoryVersionWithLine）を上げる。
+      読むたびにこの番号を確かめ、変わっていたら履歴を読み直す（run_media_worker など別のプロセスの更新も拾える）
+    - 使われていないユーザは idle_seconds で、ユーザ数が max_users を超えたら古い順に追い出す
+
+    Note: 読み足しは「pk の順にコミットされる」ことを前提にしている。SQLite は書き込みが1つずつなので必ずそうなるが、
+    PostgreSQL / MySQL で同じユーザの行を2つのトランザクションが並行して insert すると、後から採番された行が
+    先にコミットされることがある。その間に読むと last_pk が先に進み、遅れてコミットされた行はこのキャッシュからは
+    見えなくなる（番号が上がるか、追い出されて読み直すまで）。このアプリでは1人のユーザの会話は1ターンずつ進むので
+    起きない想定だが、同じユーザの行を並行して insert するようにするなら、insert でも番号を上げること
+    """
+
+    def __init__(self, max_users: int, idle_seconds: float):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._histories: OrderedDict[int, ChatHistory] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        user_id: int,
+        find_newer: Callable[[int], list[ChatLogsWithLine]],
+        find_version: Callable[[], int],
+    ) -> ChatHistory:
+        """
+        Args:
+            user_id (int): ユーザID
+            find_newer (Callable[[int], list[ChatLogsWithLine]]): pk がこれより大きい行を pk 順に返す
+            find_version (Callable[[], int]): DB にあるそのユーザの履歴の番号を返す
+
+        Returns:
+            ChatHistory: 呼び出し側が変更してもキャッシュに影響しないコピー
+        """
+        while True:
+            # 番号は行より先に読む（行を読んでいる間に書き換えられても、次の読み込みで番号の違いに気づける）
+            version = find_version()
+            history = self._current(user_id, version)
+            rows = find_newer(history.last_pk if history else 0)
+            merged = self._merge(user_id, history, rows, version)
+            if merged is not None:
+                return merged
+
+    async def aget(
+        self,
+        user_id: int,
+        find_newer: Callable[[int], Awaitable[list[ChatLogsWithLine]]],
+        find_version: Callable[[], Awaitable[int]],
+    ) -> ChatHistory:
+        while True:
+            version = await find_version()
+            history = self._current(user_id, version)
+            rows = await find_newer(history.last_pk if history else 0)
+            merged = self._merge(user_id, history, rows, version)
+            if merged is not None:
+                return merged
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._histories.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._histories.clear()
+
+    def _current(self, user_id: int, version: int) -> ChatHistory | None:
+        """
+        番号が違う（ほかのプロセスが既存の行を書き換えた）履歴は使わない
+        """
+        with self._lock:
+            history = self._histories.get(user_id)
+            return (
+                history if history is not None and history.version == version else None
+            )
+
+    def _merge(
+        self,
+        user_id: int,
+        base: ChatHistory | None,
+        rows: list[ChatLogsWithLine],
+        version: int,
+    ) -> ChatHistory | None:
+        """
+        読み足した行を履歴に加える。読み込み中に履歴が捨てられていたら None を返す（呼び出し側で読み直す）
+        """
+        now = time.monotonic()
+        with self._lock:
+            history = self._histories.get(user_id)
+            if base is not None and history is not base:
+                return None
+            if history is None or history.version != version:
+                # 初めて読んだか、番号が変わったので最初から読み直した
+                history = self._histories[user_id] = ChatHistory(version=version)
+            self._histories.move_to_end(user_id)
+            # 同じユーザを並行して読み込んだ場合に、同じ行を二重に足さない
+            for row in rows:
+                if row.pk > history.last_pk:
+                    history.rows.append(row)
+                    history.messages.append(to_message(row))
+                    history.last_pk = row.pk
+            history.last_access = now
+            self._evict(now)
+
+            # 呼び出し側は行やメッセージの content / file_path を書き換えるので、要素ごとにコピーして渡す
+            return ChatHistory(
+                last_pk=history.last_pk,
+                version=history.version,
+                rows=[copy.copy(x) for x in history.rows],
+                messages=[copy.copy(x) for x in history.messages],
+                last_access=now,
+            )
+
+    def _evict(self, now: float):
+        while self._histories:
+            user_id, history = next(iter(self._histories.items()))
+            if (
+                len(self._histories) <= self.max_users
+                and now - history.last_access <= self.idle_seconds
+            ):
+                break
+            del self._histories[user_id]
+
+
+def to_message(chatlog: ChatLogsWithLine) -> MyChatCompletionMessage:
+    return MyChatCompletionMessage(
+        pk=chatlog.pk,
+        user=chatlog.user,
+        role=chatlog.role,
+        content=chatlog.content,
+        invisible=False,
+        file_path=chatlog.file_path,
+        media_type=chatlog.media_type,
+    )
+
+
+chat_history_cache = ChatHistoryCache(
+    max_users=CHAT_HISTORY_CACHE_MAX_USERS,
+    idle_seconds=CHAT_HISTORY_CACHE_IDLE_SECONDS,
+)
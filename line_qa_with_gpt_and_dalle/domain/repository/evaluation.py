@@ -0,0 +1,35 @@
+from django.db import transaction
+
+from line_qa_with_gpt_and_dalle.domain.valueobject.evaluation import SkillEvaluation
+from line_qa_with_gpt_and_dalle.models import ChatEvaluationWithLine
+
+
+class ChatEvaluationRepository:
+    @staticmethod
+    def replace(
+        user_id: int, chatlog_id: int, evaluations: list[SkillEvaluation]
+    ) -> list[ChatEvaluationWithLine]:
+        """
+        最後の回答（chatlog_id）に対する判定結果を入れ替える
+        評価のジョブは失敗するとやり直すので、同じ回答の判定結果が重ならないように消してから入れる
+        """
+        with transaction.atomic():
+            ChatEvaluationWithLine.objects.filter(chatlog_id=chatlog_id).delete()
+            return ChatEvaluationWithLine.objects.bulk_create(
+                [
+                    ChatEvaluationWithLine(
+                        user_id=user_id,
+                        chatlog_id=chatlog_id,
+                        skill=x.skill,
+                        score=x.score,
+                        judge=x.judge,
+                    )
+                    for x in evaluations
+                ]
+            )
+
+    @staticmethod
+    def find_by_user_id(user_id: int) -> list[ChatEvaluationWithLine]:
+        return list(
+            ChatEvaluationWithLine.objects.filter(user_id=user_id).order_by("pk")
+        )
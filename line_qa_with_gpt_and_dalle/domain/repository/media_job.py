@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from line_qa_with_gpt_and_dalle.models import MediaJob
+
+
+class MediaJobRepository:
+    @staticmethod
+    def enqueue(chatlog_id: int, kind: str) -> MediaJob:
+        return MediaJob.objects.create(chatlog_id=chatlog_id, kind=kind)
+
+    @staticmethod
+    async def aenqueue(chatlog_id: int, kind: str) -> MediaJob:
+        return await MediaJob.objects.acreate(chatlog_id=chatlog_id, kind=kind)
+
+    @staticmethod
+    def find_by_id(pk: int) -> MediaJob | None:
+        return MediaJob.objects.select_related("chatlog").filter(pk=pk).first()
+
+    @staticmethod
+    def find_pending_by_chatlog_ids(chatlog_ids: list[int]) -> dict[int, MediaJob]:
+        """
+        画面に表示する行のうち、まだ生成中のもの（chatlog_id -> ジョブ）
+        評価のジョブは行の表示を変えないので含めない
+        """
+        jobs = MediaJob.objects.filter(
+            chatlog_id__in=chatlog_ids,
+            status__in=[MediaJob.Status.QUEUED, MediaJob.Status.RUNNING],
+        ).exclude(kind=MediaJob.Kind.EVALUATION)
+        return {x.chatlog_id: x for x in jobs}
+
+    @staticmethod
+    def claim(kind: str, limit: int) -> list[MediaJob]:
+        """
+        キューから古い順に最大 limit 件を取り出して running にする
+        ワーカーが複数いても、status が queued のときだけ書き換える UPDATE に勝ったほうだけが取り出せる
+        （SELECT ... FOR UPDATE SKIP LOCKED がない SQLite でも同じように動く）
+        """
+        candidates = list(
+            MediaJob.objects.filter(status=MediaJob.Status.QUEUED, kind=kind)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:limit]
+        )
+        claimed = [
+            pk
+            for pk in candidates
+            if MediaJob.objects.filter(pk=pk, status=MediaJob.Status.QUEUED).update(
+                status=MediaJob.Status.RUNNING,
+                started_at=timezone.now(),
+                attempts=F("attempts") + 1,
+            )
+        ]
+        return list(
+            MediaJob.objects.filter(pk__in=claimed)
+            .select_related("chatlog__user")
+            .order_by("pk")
+        )
+
+    @staticmethod
+    def succeed(job: MediaJob):
+        MediaJob.objects.filter(pk=job.pk).update(
+            status=MediaJob.Status.SUCCEEDED, error=None, finished_at=timezone.now()
+        )
+
+    @staticmethod
+    def fail(job: MediaJob, error: str, max_attempts: int):
+        """
+        試した回数が max_attempts に満たなければキューに戻す
+        """
+        MediaJob.objects.filter(pk=job.pk).update(
+            status=(
+                MediaJob.Status.QUEUED
+                if job.attempts < max_attempts
+                else MediaJob.Status.FAILED
+            ),
+            error=error,
+            finished_at=timezone.now(),
+        )
+
+    @staticmethod
+    def requeue_stale(timeout_seconds: int) -> int:
+        """
+        ワーカーが落ちるなどして running のまま残ったジョブをキューに戻す
+
+        Returns:
+            int: キューに戻した件数
+        """
+        return MediaJob.objects.filter(
+            status=MediaJob.Status.RUNNING,
+            started_at__lt=timezone.now() - timedelta(seconds=timeout_seconds),
+        ).update(status=MediaJob.Status.QUEUED)
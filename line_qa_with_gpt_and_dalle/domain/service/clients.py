@@ -0,0 +1,110 @@
+"""
+プロセス内で共有するAPIクライアント
+リクエストのたびにクライアントを作ると接続プールが捨てられ、毎回TLSハンドシェイクからやり直しになる
+
+- 同期クライアント（httpx.Client）はスレッドセーフなので、プロセスに1つ
+- 非同期クライアント（httpx.AsyncClient）の接続はイベントループに紐づくので、イベントループごとに1つ
+  （ASGIならプロセスに1つ。async_to_sync などで別のループから呼ばれても壊れない）
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+from google import generativeai
+from openai import AsyncOpenAI, OpenAI
+
+from config.settings import (
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_TIMEOUT,
+    LLM_HTTP_CONNECT_TIMEOUT,
+)
+
+_lock = threading.Lock()
+_openai_client: OpenAI | None = None
+_http_client: httpx.Client | None = None
+_async_openai_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_async_http_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_gemini_configured = False
+_gemini_models: dict[str, generativeai.GenerativeModel] = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+
+
+def get_http_client() -> httpx.Client:
+    """
+    画像のダウンロードなど、APIクライアント以外のHTTPアクセス用
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+        return _http_client
+
+
+def get_openai_client() -> OpenAI:
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+        return _openai_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    return _for_running_loop(
+        _async_http_clients,
+        lambda: httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+    )
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    return _for_running_loop(
+        _async_openai_clients,
+        lambda: AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+        ),
+    )
+
+
+def _for_running_loop(clients: weakref.WeakKeyDictionary, factory):
+    """
+    実行中のイベントループに対応するクライアントを返す（ループが破棄されるとクライアントも手放す）
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = clients.get(loop)
+        if client is None:
+            client = clients[loop] = factory()
+        return client
+
+
+def get_gemini_model(model_name: str) -> generativeai.GenerativeModel:
+    """
+    generativeai.configure はプロセスで1回だけ呼び、モデルもモデル名ごとに使い回す
+    """
+    global _gemini_configured
+    with _lock:
+        if not _gemini_configured:
+            generativeai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _gemini_configured = True
+        if model_name not in _gemini_models:
+            _gemini_models[model_name] = generativeai.GenerativeModel(model_name)
+        return _gemini_models[model_name]
@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+import tiktoken
+
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.domain.valueobject.context import (
+    ChatContextPlan,
+    ChatContextPolicy,
+)
+
+
+@lru_cache(maxsize=64)
+def count_static_tokens(encoding_name: str, content: str) -> int:
+    """
+    system プロンプトのように毎ターン同じ文字列のトークン数。1回だけ数えて使い回す
+    """
+    return len(tiktoken.get_encoding(encoding_name).encode_ordinary(content))
+
+
+class ChatContextBuilder:
+    """
+    会話履歴を、トークン数の上限に収まる「system プロンプト + 古い会話の要約 + 直近の会話」に組み立てる
+    履歴をすべて送ると、ターンを重ねるほどプロンプトのトークン数・レイテンシ・料金が増え続けるため
+    """
+
+    # メッセージ1件ごとにかかる書式のトークン（role や区切り）
+    _TOKENS_PER_MESSAGE = 4
+
+    def __init__(self, policy: ChatContextPolicy):
+        self.policy = policy
+        self.encoding = tiktoken.get_encoding(policy.encoding_name)
+
+    def count_tokens(self, message: MyChatCompletionMessage) -> int:
+        if message.role == "system":
+            tokens = count_static_tokens(
+                self.policy.encoding_name, message.content or ""
+            )
+        else:
+            tokens = len(self.encoding.encode_ordinary(message.content or ""))
+        return tokens + self._TOKENS_PER_MESSAGE
+
+    def plan(self, chat_history: list[MyChatCompletionMessage]) -> ChatContextPlan:
+        """
+        新しいメッセージから順に、件数と予算（要約のぶんを差し引いたトークン数）に収まるだけ残す
+        古いほうから数えないので、履歴が長くなってもトークナイズするのは送るぶんだけで済む
+        最新のメッセージは予算を超えていても必ず残す
+        """
+        n_system = 0
+        while n_system < len(chat_history) and chat_history[n_system].role == "system":
+            n_system += 1
+        system, conversation = chat_history[:n_system], chat_history[n_system:]
+
+        budget = (
+            self.policy.max_prompt_tokens
+            - sum(self.count_tokens(x) for x in system)
+            - self.policy.summary_max_tokens
+        )
+        start, used = len(conversation), 0
+        while start > 0 and len(conversation) - start < self.policy.max_recent_messages:
+            tokens = self.count_tokens(conversation[start - 1])
+            if used + tokens > budget and start < len(conversation):
+                break
+            used += tokens
+            start -= 1
+        # 先頭を window_step 件単位で進めて、数ターンのあいだ送る前置き（要約も含む）を変えない
+        if start > 0:
+            step = self.policy.window_step
+            start = min(-(-start // step) * step, len(conversation) - 1)
+        # 往復の途中（assistant の返答）から始めず、ターンの区切りにそろえる
+        while start < len(conversation) - 1 and conversation[start].role == "assistant":
+            start += 1
+
+        return ChatContextPlan(
+            system=system,
+            to_summarize=conversation[:start],
+            recent=conversation[start:],
+        )
+
+    @staticmethod
+    def compose(
+        plan: ChatContextPlan, summary: str | None
+    ) -> list[MyChatCompletionMessage]:
+        if not summary:
+            return plan.system + plan.recent
+        summary_message = MyChatCompletionMessage(
+            user=(plan.recent or plan.to_summarize)[-1].user,
+            role="system",
+            content=f"これまでの会話の要約:\n{summary}",
+            invisible=True,
+        )
+        return plan.system + [summary_message] + plan.recent
+
+    @staticmethod
+    def summary_prompt(
+        previous_summary: str | None, messages: list[MyChatCompletionMessage]
+    ) -> list[dict]:
+        """
+        これまでの要約に、新たに畳み込む会話を足して要約し直すためのプロンプト
+        """
+        conversation = "\n".join(f"{x.role}: {x.content}" for x in messages)
+        return [
+            {
+                "role": "system",
+                "content": "あなたは会話の要約係です。これまでの要約に新しい会話を加えて、"
+                "出題・回答・評価に関わる事実を落とさずに日本語で簡潔に要約してください。",
+            },
+            {
+                "role": "user",
+                "content": f"これまでの要約:\n{previous_summary or 'なし'}\n\n"
+                f"新しい会話:\n{conversation}",
+            },
+        ]
@@ -1,47 +1,71 @@
-import os
+import asyncio
 import secrets
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
+from typing import AsyncIterator, Iterator
 
-import requests.exceptions
+import httpx
 from PIL import Image
 from django.contrib.auth.models import User
-from google import generativeai
 from google.generativeai.types import GenerateContentResponse
-from openai import OpenAI
+from openai import AsyncOpenAI
 from openai.types.chat import (
     ChatCompletion,
 )
 
-from config.settings import MEDIA_ROOT
+from config.settings import MEDIA_ROOT, MEDIA_URL
+from line_qa_with_gpt_and_dalle.models import (
+    ChatLogsWithLine,
+    ChatSummaryWithLine,
+    MediaJob,
+)
 from line_qa_with_gpt_and_dalle.domain.repository.chatlog import (
     ChatLogRepository,
+    ChatLogUnitOfWork,
+)
+from line_qa_with_gpt_and_dalle.domain.repository.evaluation import (
+    ChatEvaluationRepository,
+)
+from line_qa_with_gpt_and_dalle.domain.repository.media_job import (
+    MediaJobRepository,
 )
+from line_qa_with_gpt_and_dalle.domain.service.clients import (
+    get_async_http_client,
+    get_async_openai_client,
+    get_gemini_model,
+    get_http_client,
+    get_openai_client,
+)
+from line_qa_with_gpt_and_dalle.domain.service.context import ChatContextBuilder
+from line_qa_with_gpt_and_dalle.domain.service.usage import prompt_usage
 from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.domain.valueobject.context import (
+    ChatContextPlan,
+    ChatContextPolicy,
+)
+from line_qa_with_gpt_and_dalle.domain.valueobject.evaluation import SkillEvaluation
 from line_qa_with_gpt_and_dalle.domain.valueobject.gender import Gender
 
+# なぞなぞの最後の回答に含まれる文言（get_prompt の制約条件を参照）
+FINISHED_MARKER = "本日はなぞなぞにご参加いただき"
+
 
 def get_stored_chat_history(
     user_id: int, chatlog_repository: ChatLogRepository
 ) -> list[MyChatCompletionMessage]:
-    chatlog_list = chatlog_repository.find_chatlog_by_user_id(user_id)
-    history = [
-        MyChatCompletionMessage(
-            pk=chatlog.pk,
-            user=chatlog.user,
-            role=chatlog.role,
-            content=chatlog.content,
-            invisible=False,
-            file_path=chatlog.file_path,
-        )
-        for chatlog in chatlog_list
-    ]
-    return history
+    return chatlog_repository.find_chat_history_by_user_id(user_id)
 
 
-def get_prompt(gender: Gender) -> str:
-    return f"""
+async def aget_stored_chat_history(
+    user_id: int, chatlog_repository: ChatLogRepository
+) -> list[MyChatCompletionMessage]:
+    return await chatlog_repository.afind_chat_history_by_user_id(user_id)
+
+
+# なぞなぞの system プロンプト。口調のほかは固定なので、口調ごとに1回だけ組み立てる
+_PROMPT_TEMPLATE = """
         あなたはなぞなぞコーナーの担当者です。
 
         #制約条件
@@ -50,7 +74,7 @@ def get_prompt(gender: Gender) -> str:
         - 質問1は「論理的思考力」評価します
         - 質問2は「洞察力」を評価します
         - scoreが70を超えたら、judgeが「合格」になる
-        - {gender.name} の口調で会話を行う
+        - {gender_name} の口調で会話を行う
         - 「評価結果をjsonで出力してください」と入力されたら、判定結果例のように判定結果を出力する
 
         #質問1
@@ -64,6 +88,19 @@ def get_prompt(gender: Gender) -> str:
     """
 
 
+@lru_cache(maxsize=None)
+def _compile_prompt(gender_name: str) -> str:
+    return _PROMPT_TEMPLATE.format(gender_name=gender_name)
+
+
+def get_prompt(gender: Gender) -> str:
+    """
+    口調ごとにメモ化した system プロンプト
+    同じ口調なら毎回同じ文字列なので、会話の先頭が一致してプロバイダ側のプロンプトキャッシュが効く
+    """
+    return _compile_prompt(gender.name)
+
+
 def create_initial_prompt(user: User, gender: Gender) -> list[MyChatCompletionMessage]:
     history = [
         MyChatCompletionMessage(
@@ -98,6 +135,21 @@ class LLMService(ABC):
     def save(self, **kwargs):
         pass
 
+    @abstractmethod
+    async def agenerate(self, **kwargs):
+        """
+        generate の非同期版。API の応答を待つ間スレッドを占有しないので、ASGI では1プロセスで多数の呼び出しを並行できる
+        """
+        pass
+
+    @abstractmethod
+    async def apost_to_gpt(self, **kwargs):
+        pass
+
+    @abstractmethod
+    async def asave(self, **kwargs):
+        pass
+
 
 class GeminiService(LLMService):
     def __init__(self):
@@ -138,12 +190,47 @@ class GeminiService(LLMService):
     def post_to_gpt(
         self, chat_history: list[MyChatCompletionMessage]
     ) -> GenerateContentResponse:
-        generativeai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = generativeai.GenerativeModel("gemini-1.5-flash")
+        model = get_gemini_model("gemini-1.5-flash")
         # TODO: 「会話」にしたいね
         response = model.generate_content(chat_history[-1].content)
         return response
 
+    async def agenerate(
+        self, my_chat_completion_message: MyChatCompletionMessage, gender: str
+    ) -> list[MyChatCompletionMessage]:
+        if my_chat_completion_message.content is None:
+            raise Exception("content is None")
+
+        chat_history = await aget_stored_chat_history(
+            user_id=my_chat_completion_message.user.pk,
+            chatlog_repository=self.chatlog_repository,
+        )
+        chat_history.append(
+            await self.asave(
+                MyChatCompletionMessage(
+                    user=my_chat_completion_message.user,
+                    role=my_chat_completion_message.role,
+                    content=my_chat_completion_message.content,
+                    invisible=False,
+                )
+            )
+        )
+        response = await self.apost_to_gpt(chat_history)
+        latest_assistant = MyChatCompletionMessage(
+            user=my_chat_completion_message.user,
+            role="assistant",
+            content=response.text,
+            invisible=False,
+        )
+        chat_history.append(await self.asave(latest_assistant))
+        return chat_history
+
+    async def apost_to_gpt(
+        self, chat_history: list[MyChatCompletionMessage]
+    ) -> GenerateContentResponse:
+        model = get_gemini_model("gemini-1.5-flash")
+        return await model.generate_content_async(chat_history[-1].content)
+
     def save(
         self, messages: MyChatCompletionMessage | list[MyChatCompletionMessage]
     ) -> MyChatCompletionMessage | list[MyChatCompletionMessage]:
@@ -158,14 +245,107 @@ class GeminiService(LLMService):
 
         return messages
 
+    async def asave(
+        self, messages: MyChatCompletionMessage | list[MyChatCompletionMessage]
+    ) -> MyChatCompletionMessage | list[MyChatCompletionMessage]:
+        if isinstance(messages, list):
+            await self.chatlog_repository.abulk_insert(messages)
+        elif isinstance(messages, MyChatCompletionMessage):
+            await self.chatlog_repository.ainsert(messages)
+        else:
+            raise ValueError(
+                f"Unexpected type {type(messages)}. Expected MyChatCompletionMessage or list[MyChatCompletionMessage]."
+            )
+
+        return messages
+
+
+class OpenAIService(LLMService, ABC):
+    """
+    OpenAI のクライアントは接続プールごとプロセスで共有する（clients.py を参照）
+    """
 
-class OpenAIGptService(LLMService):
     def __init__(self):
         super().__init__()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_openai_client()
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return get_async_openai_client()
+
+
+class OpenAIGptService(OpenAIService):
+    model = "gpt-4-turbo"
+
+    def __init__(self, context_policy: ChatContextPolicy | None = None):
+        """
+        Args:
+            context_policy (ChatContextPolicy | None): 会話履歴の組み立て方。Noneなら既定値
+        """
+        super().__init__()
+        self.context_builder = ChatContextBuilder(context_policy or ChatContextPolicy())
 
     def generate(
         self, my_chat_completion_message: MyChatCompletionMessage, gender: str
+    ) -> list[MyChatCompletionMessage]:
+        # 1ターンで保存するメッセージ（最大4件）は、最後に1回のトランザクションでまとめて保存する
+        turn = self.chatlog_repository.unit_of_work()
+        chat_history = self._prepare_chat_history(
+            my_chat_completion_message, gender, turn
+        )
+        response = self.post_to_gpt(chat_history)
+
+        latest_assistant = MyChatCompletionMessage(
+            user=my_chat_completion_message.user,
+            role=response.choices[0].message.role,
+            content=response.choices[0].message.content,
+            invisible=False,
+        )
+        chat_history.append(turn.add(latest_assistant))
+        turn.flush()
+        self._enqueue_evaluation_if_finished(latest_assistant)
+
+        return chat_history
+
+    def generate_stream(
+        self, my_chat_completion_message: MyChatCompletionMessage, gender: str
+    ) -> Iterator[str]:
+        """
+        generate のストリーミング版。回答をトークンが届いた順に（差分の文字列として）返す
+        このターンの保存はストリームが最後まで流れたときに1回だけ行う（途中で切断されたら保存しない）
+
+        Args:
+            my_chat_completion_message (MyChatCompletionMessage): ユーザの入力
+            gender (str): 口調（"man" または "woman"）
+
+        Yields:
+            str: 回答の差分
+        """
+        turn = self.chatlog_repository.unit_of_work()
+        chat_history = self._prepare_chat_history(
+            my_chat_completion_message, gender, turn
+        )
+
+        deltas = []
+        for delta in self.post_to_gpt_stream(chat_history):
+            deltas.append(delta)
+            yield delta
+
+        latest_assistant = MyChatCompletionMessage(
+            user=my_chat_completion_message.user,
+            role="assistant",
+            content="".join(deltas),
+            invisible=False,
+        )
+        chat_history.append(turn.add(latest_assistant))
+        turn.flush()
+        self._enqueue_evaluation_if_finished(latest_assistant)
+
+    def _prepare_chat_history(
+        self,
+        my_chat_completion_message: MyChatCompletionMessage,
+        gender: str,
+        turn: ChatLogUnitOfWork,
     ) -> list[MyChatCompletionMessage]:
         if my_chat_completion_message.content is None:
             raise Exception("content is None")
@@ -178,14 +358,14 @@ class OpenAIGptService(LLMService):
             chat_history = create_initial_prompt(
                 user=my_chat_completion_message.user, gender=Gender(gender)
             )
-            self.save(chat_history)
+            turn.add(chat_history)
 
         # 初回はユーザのボタン押下などのトリガーで「プロンプト」と「なぞなぞスタート」の2行がinsertされる
         # 会話が始まっているならユーザの入力したチャットをinsertしてからChatGPTに全投げする
         # つまり、3以上あれば会話が始まっているだろうとみなせる
         if len(chat_history) > 2:
             chat_history.append(
-                self.save(
+                turn.add(
                     MyChatCompletionMessage(
                         user=my_chat_completion_message.user,
                         role=my_chat_completion_message.role,
@@ -194,7 +374,107 @@ class OpenAIGptService(LLMService):
                     )
                 )
             )
-        response = self.post_to_gpt(chat_history)
+
+        return chat_history
+
+    def _enqueue_evaluation_if_finished(
+        self, latest_assistant: MyChatCompletionMessage
+    ):
+        """
+        なぞなぞが終わったら、評価をジョブとして投入する（run_media_worker が evaluate を呼ぶ）
+        評価を待たずに最後の回答を返せるので、最後のターンの応答時間は他のターンと変わらない
+        """
+        if FINISHED_MARKER in latest_assistant.content:
+            MediaJobRepository.enqueue(latest_assistant.id, MediaJob.Kind.EVALUATION)
+
+    def evaluate(
+        self, latest_assistant: MyChatCompletionMessage
+    ) -> list[SkillEvaluation]:
+        """
+        最後の回答までの会話を JSON モードで評価して、判定結果を保存する
+        評価の依頼と応答は会話ログには残さない
+
+        Args:
+            latest_assistant (MyChatCompletionMessage): なぞなぞを終えた最後の回答（保存済みのもの）
+
+        Raises:
+            ValueError: 応答が判定結果として読めないとき
+
+        Returns:
+            list[SkillEvaluation]: スキルごとの判定結果
+        """
+        chat_history = [
+            x
+            for x in get_stored_chat_history(
+                user_id=latest_assistant.user.pk,
+                chatlog_repository=self.chatlog_repository,
+            )
+            if x.id is None or x.id <= latest_assistant.id
+        ]
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[x.to_origin() for x in self.build_context(chat_history)]
+            + [self._evaluation_request(latest_assistant.user).to_origin()],
+            temperature=0,
+            response_format={"type": "json_object"},
+        )
+        prompt_usage.record(self.model, response.usage)
+        evaluations = SkillEvaluation.from_json(response.choices[0].message.content)
+        ChatEvaluationRepository.replace(
+            latest_assistant.user.pk, latest_assistant.id, evaluations
+        )
+
+        return evaluations
+
+    @staticmethod
+    def _evaluation_request(user: User) -> MyChatCompletionMessage:
+        # JSON モードはオブジェクトしか返さないので、判定結果例の配列を results の下に入れてもらう
+        return MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=(
+                "評価結果をjsonで出力してください。"
+                '判定結果例の配列を {"results": [...]} の形で出力してください'
+            ),
+            invisible=True,
+        )
+
+    def post_to_gpt(
+        self, chat_history: list[MyChatCompletionMessage]
+    ) -> ChatCompletion:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[x.to_origin() for x in self.build_context(chat_history)],
+            temperature=0.5,
+        )
+        prompt_usage.record(self.model, response.usage)
+        return response
+
+    def post_to_gpt_stream(
+        self, chat_history: list[MyChatCompletionMessage]
+    ) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=[x.to_origin() for x in self.build_context(chat_history)],
+            temperature=0.5,
+            stream=True,
+            # 最後のチャンクで usage を受け取る（いまの openai の型には stream_options がない）
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                prompt_usage.record(self.model, chunk.usage)
+
+    async def agenerate(
+        self, my_chat_completion_message: MyChatCompletionMessage, gender: str
+    ) -> list[MyChatCompletionMessage]:
+        turn = self.chatlog_repository.unit_of_work()
+        chat_history = await self._aprepare_chat_history(
+            my_chat_completion_message, gender, turn
+        )
+        response = await self.apost_to_gpt(chat_history)
 
         latest_assistant = MyChatCompletionMessage(
             user=my_chat_completion_message.user,
@@ -202,39 +482,178 @@ class OpenAIGptService(LLMService):
             content=response.choices[0].message.content,
             invisible=False,
         )
-        chat_history.append(self.save(latest_assistant))
+        chat_history.append(turn.add(latest_assistant))
+        await turn.aflush()
+        await self._aenqueue_evaluation_if_finished(latest_assistant)
+
+        return chat_history
+
+    async def agenerate_stream(
+        self, my_chat_completion_message: MyChatCompletionMessage, gender: str
+    ) -> AsyncIterator[str]:
+        """
+        generate_stream の非同期版。ASGI では同期のイテレータを最後まで読んでから返してしまうので、こちらを使う
+        """
+        turn = self.chatlog_repository.unit_of_work()
+        chat_history = await self._aprepare_chat_history(
+            my_chat_completion_message, gender, turn
+        )
+
+        deltas = []
+        async for delta in self.apost_to_gpt_stream(chat_history):
+            deltas.append(delta)
+            yield delta
+
+        latest_assistant = MyChatCompletionMessage(
+            user=my_chat_completion_message.user,
+            role="assistant",
+            content="".join(deltas),
+            invisible=False,
+        )
+        chat_history.append(turn.add(latest_assistant))
+        await turn.aflush()
+        await self._aenqueue_evaluation_if_finished(latest_assistant)
+
+    async def _aprepare_chat_history(
+        self,
+        my_chat_completion_message: MyChatCompletionMessage,
+        gender: str,
+        turn: ChatLogUnitOfWork,
+    ) -> list[MyChatCompletionMessage]:
+        if my_chat_completion_message.content is None:
+            raise Exception("content is None")
+
+        chat_history = await aget_stored_chat_history(
+            user_id=my_chat_completion_message.user.pk,
+            chatlog_repository=self.chatlog_repository,
+        )
+        if not chat_history:
+            chat_history = create_initial_prompt(
+                user=my_chat_completion_message.user, gender=Gender(gender)
+            )
+            turn.add(chat_history)
 
-        if "本日はなぞなぞにご参加いただき" in latest_assistant.content:
+        # 3以上あれば会話が始まっているだろうとみなせる（_prepare_chat_history を参照）
+        if len(chat_history) > 2:
             chat_history.append(
-                self.save(
+                turn.add(
                     MyChatCompletionMessage(
-                        user=latest_assistant.user,
-                        role="user",
-                        content="評価結果をjsonで出力してください",
-                        invisible=True,
+                        user=my_chat_completion_message.user,
+                        role=my_chat_completion_message.role,
+                        content=my_chat_completion_message.content,
+                        invisible=False,
                     )
                 )
             )
-            response = self.post_to_gpt(chat_history)
 
-            latest_assistant = MyChatCompletionMessage(
-                user=my_chat_completion_message.user,
-                role=response.choices[0].message.role,
-                content=response.choices[0].message.content,
-                invisible=True,
+        return chat_history
+
+    async def _aenqueue_evaluation_if_finished(
+        self, latest_assistant: MyChatCompletionMessage
+    ):
+        if FINISHED_MARKER in latest_assistant.content:
+            await MediaJobRepository.aenqueue(
+                latest_assistant.id, MediaJob.Kind.EVALUATION
+            )
+
+    def build_context(
+        self, chat_history: list[MyChatCompletionMessage]
+    ) -> list[MyChatCompletionMessage]:
+        """
+        実際に送るメッセージ（system プロンプト + 古い会話の要約 + 直近の会話）
+        要約はユーザごとに保存しておき、新たに予算からあふれた会話だけを足して更新する
+        """
+        plan = self.context_builder.plan(chat_history)
+        if not plan.to_summarize:
+            return self.context_builder.compose(plan, None)
+
+        user = plan.to_summarize[0].user
+        stored = self.chatlog_repository.find_summary_by_user_id(user.pk)
+        summary = stored.content if stored else None
+        new_messages = self._not_summarized(plan, stored)
+        if new_messages:
+            response = self.client.chat.completions.create(
+                model=self.context_builder.policy.summary_model,
+                messages=self.context_builder.summary_prompt(summary, new_messages),
+                max_tokens=self.context_builder.policy.summary_max_tokens,
+                temperature=0,
+            )
+            prompt_usage.record(
+                self.context_builder.policy.summary_model, response.usage
+            )
+            summary = response.choices[0].message.content
+            self.chatlog_repository.upsert_summary(
+                user.pk, summary, max(x.id for x in new_messages)
+            )
+
+        return self.context_builder.compose(plan, summary)
+
+    async def abuild_context(
+        self, chat_history: list[MyChatCompletionMessage]
+    ) -> list[MyChatCompletionMessage]:
+        plan = self.context_builder.plan(chat_history)
+        if not plan.to_summarize:
+            return self.context_builder.compose(plan, None)
+
+        user = plan.to_summarize[0].user
+        stored = await self.chatlog_repository.afind_summary_by_user_id(user.pk)
+        summary = stored.content if stored else None
+        new_messages = self._not_summarized(plan, stored)
+        if new_messages:
+            response = await self.async_client.chat.completions.create(
+                model=self.context_builder.policy.summary_model,
+                messages=self.context_builder.summary_prompt(summary, new_messages),
+                max_tokens=self.context_builder.policy.summary_max_tokens,
+                temperature=0,
+            )
+            prompt_usage.record(
+                self.context_builder.policy.summary_model, response.usage
+            )
+            summary = response.choices[0].message.content
+            await self.chatlog_repository.aupsert_summary(
+                user.pk, summary, max(x.id for x in new_messages)
             )
-            chat_history.append(self.save(latest_assistant))
 
-        return chat_history
+        return self.context_builder.compose(plan, summary)
 
-    def post_to_gpt(
+    @staticmethod
+    def _not_summarized(
+        plan: ChatContextPlan, stored: ChatSummaryWithLine | None
+    ) -> list[MyChatCompletionMessage]:
+        """
+        要約に畳み込む会話のうち、まだ要約に入っていないもの（保存済みのものだけ）
+        """
+        last_chatlog_id = stored.last_chatlog_id if stored else 0
+        return [
+            x for x in plan.to_summarize if x.id is not None and x.id > last_chatlog_id
+        ]
+
+    async def apost_to_gpt(
         self, chat_history: list[MyChatCompletionMessage]
     ) -> ChatCompletion:
-        return self.client.chat.completions.create(
-            model="gpt-4-turbo",
-            messages=[x.to_origin() for x in chat_history],
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[x.to_origin() for x in await self.abuild_context(chat_history)],
+            temperature=0.5,
+        )
+        prompt_usage.record(self.model, response.usage)
+        return response
+
+    async def apost_to_gpt_stream(
+        self, chat_history: list[MyChatCompletionMessage]
+    ) -> AsyncIterator[str]:
+        stream = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[x.to_origin() for x in await self.abuild_context(chat_history)],
             temperature=0.5,
+            stream=True,
+            extra_body={"stream_options": {"include_usage": True}},
         )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                prompt_usage.record(self.model, chunk.usage)
 
     def save(
         self, messages: MyChatCompletionMessage | list[MyChatCompletionMessage]
@@ -250,12 +669,22 @@ class OpenAIGptService(LLMService):
 
         return messages
 
+    async def asave(
+        self, messages: MyChatCompletionMessage | list[MyChatCompletionMessage]
+    ) -> MyChatCompletionMessage | list[MyChatCompletionMessage]:
+        if isinstance(messages, list):
+            await self.chatlog_repository.abulk_insert(messages)
+        elif isinstance(messages, MyChatCompletionMessage):
+            await self.chatlog_repository.ainsert(messages)
+        else:
+            raise ValueError(
+                f"Unexpected type {type(messages)}. Expected MyChatCompletionMessage or list[MyChatCompletionMessage]."
+            )
 
-class OpenAIDalleService(LLMService):
-    def __init__(self):
-        super().__init__()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return messages
 
+
+class OpenAIDalleService(OpenAIService):
     def generate(self, my_chat_completion_message: MyChatCompletionMessage):
         """
         画像urlの有効期限は1時間。それ以上使いたいときは保存する。
@@ -266,16 +695,16 @@ class OpenAIDalleService(LLMService):
         response = self.post_to_gpt(my_chat_completion_message.content)
         image_url = response.data[0].url
         try:
-            response = requests.get(image_url)
+            response = get_http_client().get(image_url)
             response.raise_for_status()
             resized_picture = self.resize(picture=Image.open(BytesIO(response.content)))
             my_chat_completion_message = self.save(
                 resized_picture,
                 my_chat_completion_message,
             )
-        except requests.exceptions.HTTPError as http_error:
+        except httpx.HTTPStatusError as http_error:
             raise Exception(http_error)
-        except requests.exceptions.ConnectionError as connection_error:
+        except httpx.TransportError as connection_error:
             raise Exception(connection_error)
         except Exception as e:
             raise Exception(e)
@@ -298,21 +727,61 @@ class OpenAIDalleService(LLMService):
         relative_path_str = "/media/images/" + random_filename
         full_path = folder_path / random_filename
         my_chat_completion_message.file_path = relative_path_str
+        my_chat_completion_message.media_type = ChatLogsWithLine.MediaType.IMAGE
         picture.save(full_path)
         self.chatlog_repository.upsert(my_chat_completion_message)
 
         return my_chat_completion_message
 
+    async def agenerate(self, my_chat_completion_message: MyChatCompletionMessage):
+        if my_chat_completion_message.content is None:
+            raise Exception("content is None")
+        response = await self.apost_to_gpt(my_chat_completion_message.content)
+        image_url = response.data[0].url
+        try:
+            response = await get_async_http_client().get(image_url)
+            response.raise_for_status()
+            resized_picture = self.resize(picture=Image.open(BytesIO(response.content)))
+            my_chat_completion_message = await self.asave(
+                resized_picture,
+                my_chat_completion_message,
+            )
+        except httpx.HTTPError as http_error:
+            raise Exception(http_error)
+        except Exception as e:
+            raise Exception(e)
+
+        return my_chat_completion_message
+
+    async def apost_to_gpt(self, prompt: str):
+        return await self.async_client.images.generate(
+            model="dall-e-3", prompt=prompt, size="1024x1024", quality="standard", n=1
+        )
+
+    async def asave(
+        self, picture: Image, my_chat_completion_message: MyChatCompletionMessage
+    ) -> MyChatCompletionMessage:
+        folder_path = Path(MEDIA_ROOT) / "images"
+        if not folder_path.exists():
+            folder_path.mkdir(parents=True, exist_ok=True)
+        # This generates a random string of 10 characters
+        random_filename = secrets.token_hex(5) + ".jpg"
+        relative_path_str = "/media/images/" + random_filename
+        full_path = folder_path / random_filename
+        my_chat_completion_message.file_path = relative_path_str
+        my_chat_completion_message.media_type = ChatLogsWithLine.MediaType.IMAGE
+        # ファイルの書き込みでイベントループを止めない
+        await asyncio.to_thread(picture.save, full_path)
+        await self.chatlog_repository.aupsert(my_chat_completion_message)
+
+        return my_chat_completion_message
+
     @staticmethod
     def resize(picture: Image) -> Image:
         return picture.resize((128, 128))
 
 
-class OpenAITextToSpeechService(LLMService):
-    def __init__(self):
-        super().__init__()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
+class OpenAITextToSpeechService(OpenAIService):
     def generate(self, my_chat_completion_message: MyChatCompletionMessage):
         if my_chat_completion_message.content is None:
             raise Exception("content is None")
@@ -333,32 +802,103 @@ class OpenAITextToSpeechService(LLMService):
         relative_path_str = "/media/audios/" + random_filename
         full_path = folder_path / random_filename
         my_chat_completion_message.file_path = relative_path_str
+        my_chat_completion_message.media_type = ChatLogsWithLine.MediaType.AUDIO
         response.write_to_file(full_path)
         self.chatlog_repository.upsert(my_chat_completion_message)
 
         return my_chat_completion_message
 
+    async def agenerate(self, my_chat_completion_message: MyChatCompletionMessage):
+        if my_chat_completion_message.content is None:
+            raise Exception("content is None")
+        response = await self.apost_to_gpt(my_chat_completion_message.content)
+        await self.asave(response, my_chat_completion_message)
 
-class OpenAISpeechToTextService(LLMService):
-    def __init__(self):
-        super().__init__()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    async def apost_to_gpt(self, text: str):
+        return await self.async_client.audio.speech.create(
+            model="tts-1", voice="alloy", input=text, response_format="mp3"
+        )
+
+    async def asave(
+        self, response, my_chat_completion_message: MyChatCompletionMessage
+    ):
+        folder_path = Path(MEDIA_ROOT) / "audios"
+        if not folder_path.exists():
+            folder_path.mkdir(parents=True, exist_ok=True)
+        # This generates a random string of 10 characters
+        random_filename = secrets.token_hex(5) + ".mp3"
+        relative_path_str = "/media/audios/" + random_filename
+        full_path = folder_path / random_filename
+        my_chat_completion_message.file_path = relative_path_str
+        my_chat_completion_message.media_type = ChatLogsWithLine.MediaType.AUDIO
+        # 音声は受信済みなので、ファイルの書き込みだけをスレッドに逃がす
+        await asyncio.to_thread(response.write_to_file, full_path)
+        await self.chatlog_repository.aupsert(my_chat_completion_message)
 
+        return my_chat_completion_message
+
+
+class OpenAISpeechToTextService(OpenAIService):
     def generate(self, my_chat_completion_message: MyChatCompletionMessage):
         if my_chat_completion_message.file_path is None:
             raise Exception("file_path is None")
-        full_path = Path(MEDIA_ROOT) / my_chat_completion_message.file_path
-        if full_path.exists():
-            response = self.post_to_gpt(str(full_path))
-            my_chat_completion_message.content = response.text
-            print(f"\n音声ファイルは「{response.text}」とテキスト化されました\n")
-            self.save(my_chat_completion_message)
-        else:
-            print(f"音声ファイル {my_chat_completion_message.file_path} は存在しません")
+        full_path = self.to_full_path(my_chat_completion_message.file_path)
+        if not full_path.exists():
+            # ジョブとして動くときは、ここで例外にしないと成功として記録される
+            raise FileNotFoundError(
+                f"音声ファイル {my_chat_completion_message.file_path} は存在しません"
+            )
+        response = self.post_to_gpt(str(full_path))
+        my_chat_completion_message.content = response.text
+        print(f"\n音声ファイルは「{response.text}」とテキスト化されました\n")
+        self.save(my_chat_completion_message)
 
     def post_to_gpt(self, path_to_audio: str):
-        audio = open(path_to_audio, "rb")
-        return self.client.audio.transcriptions.create(model="whisper-1", file=audio)
+        with open(path_to_audio, "rb") as audio:
+            return self.client.audio.transcriptions.create(
+                model="whisper-1", file=audio
+            )
 
     def save(self, my_chat_completion_message: MyChatCompletionMessage):
         self.chatlog_repository.upsert(my_chat_completion_message)
+
+    async def agenerate(self, my_chat_completion_message: MyChatCompletionMessage):
+        if my_chat_completion_message.file_path is None:
+            raise Exception("file_path is None")
+        full_path = self.to_full_path(my_chat_completion_message.file_path)
+        if not full_path.exists():
+            # ジョブとして動くときは、ここで例外にしないと成功として記録される
+            raise FileNotFoundError(
+                f"音声ファイル {my_chat_completion_message.file_path} は存在しません"
+            )
+        response = await self.apost_to_gpt(str(full_path))
+        my_chat_completion_message.content = response.text
+        print(f"\n音声ファイルは「{response.text}」とテキスト化されました\n")
+        await self.asave(my_chat_completion_message)
+
+    async def apost_to_gpt(self, path_to_audio: str):
+        audio = await asyncio.to_thread(Path(path_to_audio).read_bytes)
+        return await self.async_client.audio.transcriptions.create(
+            model="whisper-1", file=(Path(path_to_audio).name, audio)
+        )
+
+    async def asave(self, my_chat_completion_message: MyChatCompletionMessage):
+        await self.chatlog_repository.aupsert(my_chat_completion_message)
+
+    @staticmethod
+    def to_full_path(file_path: str) -> Path:
+        """
+        file_path は OpenAITextToSpeechService が保存する "/media/audios/xxx.mp3" のような URL のパスなので、
+        先頭の MEDIA_URL を外して MEDIA_ROOT の下のパスにする（そのまま "/" で繋ぐと絶対パスとして扱われる）
+
+        Args:
+            file_path (str): 会話ログの行の file_path
+
+        Returns:
+            Path: 音声ファイルの実際のパス
+        """
+        relative_path = file_path.lstrip("/")
+        media_prefix = MEDIA_URL.strip("/") + "/"
+        if relative_path.startswith(media_prefix):
+            relative_path = relative_path[len(media_prefix) :]
+        return Path(MEDIA_ROOT) / relative_path
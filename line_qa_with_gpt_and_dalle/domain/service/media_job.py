@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog import ChatLogRepository
+from line_qa_with_gpt_and_dalle.domain.repository.media_job import (
+    MediaJobRepository,
+)
+from line_qa_with_gpt_and_dalle.domain.service.llm import (
+    OpenAIDalleService,
+    OpenAIGptService,
+    OpenAISpeechToTextService,
+    OpenAITextToSpeechService,
+)
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.models import MediaJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_media_job(
+    my_chat_completion_message: MyChatCompletionMessage, kind: str
+) -> MediaJob:
+    """
+    会話ログの行がまだなければ作り、その行を埋めるジョブを投入する（行とジョブは同じトランザクションで保存する）
+    """
+    with transaction.atomic():
+        if my_chat_completion_message.id is None:
+            ChatLogRepository.insert(my_chat_completion_message)
+        return MediaJobRepository.enqueue(my_chat_completion_message.id, kind)
+
+
+async def aenqueue_media_job(
+    my_chat_completion_message: MyChatCompletionMessage, kind: str
+) -> MediaJob:
+    # transaction.atomic は非同期のコンテキストでは使えないので、同期版をスレッドで動かす
+    return await sync_to_async(enqueue_media_job)(my_chat_completion_message, kind)
+
+
+def run_media_job(job: MediaJob):
+    """
+    ジョブの種類に応じて生成し、会話ログの行を埋める（各サービスが upsert する）
+    評価のジョブは会話ログの行を書き換えず、判定結果を ChatEvaluationWithLine に保存する
+    """
+    chatlog = job.chatlog
+    my_chat_completion_message = MyChatCompletionMessage(
+        pk=chatlog.pk,
+        user=chatlog.user,
+        role=chatlog.role,
+        content=chatlog.content,
+        file_path=chatlog.file_path,
+        media_type=chatlog.media_type,
+        invisible=chatlog.invisible,
+    )
+    if job.kind == MediaJob.Kind.DALLE:
+        OpenAIDalleService().generate(my_chat_completion_message)
+    elif job.kind == MediaJob.Kind.TEXT_TO_SPEECH:
+        OpenAITextToSpeechService().generate(my_chat_completion_message)
+    elif job.kind == MediaJob.Kind.SPEECH_TO_TEXT:
+        OpenAISpeechToTextService().generate(my_chat_completion_message)
+    elif job.kind == MediaJob.Kind.EVALUATION:
+        OpenAIGptService().evaluate(my_chat_completion_message)
+    else:
+        raise ValueError(f"unknown media job kind: {job.kind}")
+
+
+class MediaJobWorker:
+    """
+    生成ジョブを処理するワーカープール
+    プロバイダごとにレート制限が違うので、同時に実行するジョブの数は種類ごとに上限を持つ
+    """
+
+    # running のまま残ったジョブを探しに行く間隔（秒）
+    STALE_CHECK_SECONDS = 60
+
+    def __init__(
+        self,
+        concurrency: dict[str, int],
+        poll_seconds: float,
+        timeout_seconds: int,
+        max_attempts: int,
+        handler: Callable[[MediaJob], None] = run_media_job,
+    ):
+        """
+        Args:
+            concurrency (dict[str, int]): 種類（MediaJob.Kind）ごとの同時実行数
+            poll_seconds (float): 空いているときにキューを見に行く間隔
+            timeout_seconds (int): running のまま放置されたジョブをキューに戻すまでの秒数
+            max_attempts (int): 失敗したときに試す回数の上限
+            handler (Callable[[MediaJob], None]): ジョブを処理する関数
+        """
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self.handler = handler
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(sum(concurrency.values()), 1),
+            thread_name_prefix="media-job",
+        )
+        self.running = {kind: 0 for kind in concurrency}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_stale_check = 0.0
+
+    def run_forever(self):
+        try:
+            while not self._stop.is_set():
+                if self.run_once() == 0:
+                    self._stop.wait(self.poll_seconds)
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def run_once(self) -> int:
+        """
+        空いている枠のぶんだけジョブを取り出して、スレッドプールに渡す
+
+        Returns:
+            int: 取り出したジョブの数
+        """
+        now = time.monotonic()
+        if now - self._last_stale_check >= self.STALE_CHECK_SECONDS:
+            self._last_stale_check = now
+            requeued = MediaJobRepository.requeue_stale(self.timeout_seconds)
+            if requeued:
+                logger.warning("requeued %d stale media jobs", requeued)
+
+        submitted = 0
+        for kind, limit in self.concurrency.items():
+            with self._lock:
+                free = limit - self.running[kind]
+            if free <= 0:
+                continue
+            for job in MediaJobRepository.claim(kind, free):
+                with self._lock:
+                    self.running[kind] += 1
+                self.executor.submit(self._run, job)
+                submitted += 1
+
+        return submitted
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, job: MediaJob):
+        close_old_connections()
+        try:
+            self.handler(job)
+            MediaJobRepository.succeed(job)
+        except Exception as e:
+            logger.exception("media job %d failed", job.pk)
+            MediaJobRepository.fail(job, repr(e), self.max_attempts)
+        finally:
+            with self._lock:
+                self.running[job.kind] -= 1
+            close_old_connections()
@@ -0,0 +1,63 @@
+import logging
+import threading
+from dataclasses import replace
+
+from openai.types import CompletionUsage
+
+from line_qa_with_gpt_and_dalle.domain.valueobject.usage import PromptUsage
+
+logger = logging.getLogger(__name__)
+
+
+class PromptUsageRecorder:
+    """
+    Chat Completions の応答の usage を、モデルごとにプロセス内で累計する
+    """
+
+    def __init__(self):
+        self._usages: dict[str, PromptUsage] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, usage: CompletionUsage | dict | None):
+        """
+        Args:
+            model (str): モデル名
+            usage (CompletionUsage | dict | None): 応答の usage（ストリームの最後のチャンクでは辞書のまま届く）
+        """
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            usage = CompletionUsage(**usage)
+        cached_tokens = self.cached_tokens(usage)
+        with self._lock:
+            total = self._usages.setdefault(model, PromptUsage())
+            total.requests += 1
+            total.prompt_tokens += usage.prompt_tokens
+            total.cached_tokens += cached_tokens
+            total.completion_tokens += usage.completion_tokens
+        logger.info(
+            "%s: prompt_tokens=%d cached_tokens=%d completion_tokens=%d",
+            model,
+            usage.prompt_tokens,
+            cached_tokens,
+            usage.completion_tokens,
+        )
+
+    @staticmethod
+    def cached_tokens(usage: CompletionUsage) -> int:
+        """
+        Note: usage.prompt_tokens_details はいまの openai の型にないので、辞書のまま届く
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is None:
+            return 0
+        if isinstance(details, dict):
+            return details.get("cached_tokens") or 0
+        return getattr(details, "cached_tokens", None) or 0
+
+    def stats(self) -> dict[str, PromptUsage]:
+        with self._lock:
+            return {model: replace(x) for model, x in self._usages.items()}
+
+
+prompt_usage = PromptUsageRecorder()
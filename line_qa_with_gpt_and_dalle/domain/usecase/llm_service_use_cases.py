@@ -1,20 +1,23 @@
 from abc import ABC, abstractmethod
-from pathlib import Path
+from typing import AsyncIterator, Iterator
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db.models import Q, QuerySet
 
-from config import settings
+from line_qa_with_gpt_and_dalle.domain.repository.media_job import (
+    MediaJobRepository,
+)
 from line_qa_with_gpt_and_dalle.domain.service.llm import (
     GeminiService,
     OpenAIGptService,
-    OpenAIDalleService,
-    OpenAITextToSpeechService,
-    OpenAISpeechToTextService,
+)
+from line_qa_with_gpt_and_dalle.domain.service.media_job import (
+    aenqueue_media_job,
+    enqueue_media_job,
 )
 from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
-from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine, MediaJob
 
 
 class UseCase(ABC):
@@ -22,6 +25,13 @@ class UseCase(ABC):
     def execute(self, user: User, content: str | None):
         pass
 
+    @abstractmethod
+    async def aexecute(self, user: User, content: str | None):
+        """
+        execute の非同期版。ASGI の非同期ビューから呼ぶ
+        """
+        pass
+
 
 class GeminiUseCase(UseCase):
     def execute(self, user: User, content: str | None):
@@ -50,6 +60,18 @@ class GeminiUseCase(UseCase):
         )
         return llm_service.generate(my_chat_completion_message, gender="man")
 
+    async def aexecute(self, user: User, content: str | None):
+        if content is None:
+            raise ValueError("content cannot be None for GeminiUseCase")
+        llm_service = GeminiService()
+        my_chat_completion_message = MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=content,
+            invisible=False,
+        )
+        return await llm_service.agenerate(my_chat_completion_message, gender="man")
+
 
 class OpenAIGptUseCase(UseCase):
     def execute(self, user: User, content: str | None):
@@ -78,11 +100,64 @@ class OpenAIGptUseCase(UseCase):
         )
         return llm_service.generate(my_chat_completion_message, gender="man")
 
+    async def aexecute(self, user: User, content: str | None):
+        if content is None:
+            raise ValueError("content cannot be None for OpenAIGptUseCase")
+        llm_service = OpenAIGptService()
+        my_chat_completion_message = MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=content,
+            invisible=False,
+        )
+        return await llm_service.agenerate(my_chat_completion_message, gender="man")
+
+    def execute_stream(self, user: User, content: str | None) -> Iterator[str]:
+        """
+        execute のストリーミング版。回答の差分をトークンが届いた順に返します。
+        回答はストリームが最後まで流れた時点で1回だけ保存されます。
+
+        Args:
+            user (User): DjangoのUserモデルのインスタンス
+            content (str | None): ユーザーからの入力テキスト
+
+        Raises:
+            ValueError: contentがNoneの場合
+
+        Returns:
+            Iterator[str]: 回答の差分
+        """
+        if content is None:
+            raise ValueError("content cannot be None for OpenAIGptUseCase")
+        llm_service = OpenAIGptService()
+        my_chat_completion_message = MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=content,
+            invisible=False,
+        )
+        return llm_service.generate_stream(my_chat_completion_message, gender="man")
+
+    def aexecute_stream(self, user: User, content: str | None) -> AsyncIterator[str]:
+        """
+        execute_stream の非同期版（ASGI の AsyncStreamView から使う）
+        """
+        if content is None:
+            raise ValueError("content cannot be None for OpenAIGptUseCase")
+        llm_service = OpenAIGptService()
+        my_chat_completion_message = MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=content,
+            invisible=False,
+        )
+        return llm_service.agenerate_stream(my_chat_completion_message, gender="man")
+
 
 class OpenAIDalleUseCase(UseCase):
     def execute(self, user: User, content: str | None):
         """
-        OpenAIDalleServiceを利用し、ユーザーからの入力テキスト（content）を基に画像を生成します。
+        ユーザーからの入力テキスト（content）を基に、OpenAIDalleServiceで画像を生成するジョブを投入します。
         contentパラメータはNoneではないこと。
 
         Args:
@@ -93,24 +168,34 @@ class OpenAIDalleUseCase(UseCase):
             ValueError: contentがNoneの場合
 
         Returns:
-            画像生成の結果
+            MediaJob: 投入した生成ジョブ。画像は run_media_worker が生成して、会話ログの行に file_path を埋める
         """
         if content is None:
             raise ValueError("content cannot be None for OpenAIDalleUseCase")
-        llm_service = OpenAIDalleService()
         my_chat_completion_message = MyChatCompletionMessage(
             user=user,
             role="user",
             content=content,
             invisible=False,
         )
-        return llm_service.generate(my_chat_completion_message)
+        return enqueue_media_job(my_chat_completion_message, MediaJob.Kind.DALLE)
+
+    async def aexecute(self, user: User, content: str | None):
+        if content is None:
+            raise ValueError("content cannot be None for OpenAIDalleUseCase")
+        my_chat_completion_message = MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=content,
+            invisible=False,
+        )
+        return await aenqueue_media_job(my_chat_completion_message, MediaJob.Kind.DALLE)
 
 
 class OpenAITextToSpeechUseCase(UseCase):
     def execute(self, user: User, content: str | None):
         """
-        OpenAITextToSpeechServiceを利用し、ユーザーからの入力テキスト（content）を基に音声を生成します。
+        ユーザーからの入力テキスト（content）を基に、OpenAITextToSpeechServiceで音声を生成するジョブを投入します。
         contentパラメータはNoneではないこと。
 
         Args:
@@ -121,25 +206,39 @@ class OpenAITextToSpeechUseCase(UseCase):
             ValueError: contentがNoneの場合
 
         Returns:
-            音声生成の結果
+            MediaJob: 投入した生成ジョブ。音声は run_media_worker が生成して、会話ログの行に file_path を埋める
         """
         if content is None:
             raise ValueError("content cannot be None for OpenAITextToSpeechUseCase")
-        llm_service = OpenAITextToSpeechService()
         my_chat_completion_message = MyChatCompletionMessage(
             user=user,
             role="user",
             content=content,
             invisible=False,
         )
-        return llm_service.generate(my_chat_completion_message)
+        return enqueue_media_job(
+            my_chat_completion_message, MediaJob.Kind.TEXT_TO_SPEECH
+        )
+
+    async def aexecute(self, user: User, content: str | None):
+        if content is None:
+            raise ValueError("content cannot be None for OpenAITextToSpeechUseCase")
+        my_chat_completion_message = MyChatCompletionMessage(
+            user=user,
+            role="user",
+            content=content,
+            invisible=False,
+        )
+        return await aenqueue_media_job(
+            my_chat_completion_message, MediaJob.Kind.TEXT_TO_SPEECH
+        )
 
 
 class OpenAISpeechToTextUseCase(UseCase):
     def execute(self, user: User, content: str | None):
         """
         TODO: ちょっとファイルが見つけられないバグがある issue7
-        OpenAISpeechToTextServiceを利用し、ユーザーの最新の音声ファイルをテキストに変換します。
+        ユーザーの最新の音声ファイルを、OpenAISpeechToTextServiceでテキストに変換するジョブを投入します。
         contentパラメータは必ずNoneであること。
 
         Args:
@@ -150,28 +249,37 @@ class OpenAISpeechToTextUseCase(UseCase):
             ValueError: contentがNoneでない場合
 
         Returns:
-            音声をテキストに変換した結果
+            MediaJob: 投入した文字起こしジョブ。run_media_worker が音声の行の content を埋める
         """
         if content is not None:
             raise ValueError("content must be None for OpenAISpeechToTextUseCase")
-        record = ChatLogsWithLine.objects.filter(
-            Q(user=user)
-            & Q(role="user")
-            & Q(file_path__endswith=".mp3")
-            & Q(invisible=False)
-        ).last()
+        record = self._latest_audio(user).last()
 
         if record is None:
             raise ObjectDoesNotExist("No audio file registered for the user")
 
-        llm_service = OpenAISpeechToTextService()
-        my_chat_completion_message = MyChatCompletionMessage(
-            pk=record.pk,
-            user=record.user,
-            role=record.role,
-            content=record.content,
-            file_path=str(Path(settings.MEDIA_ROOT) / record.file_path),
-            invisible=record.invisible,
+        return MediaJobRepository.enqueue(record.pk, MediaJob.Kind.SPEECH_TO_TEXT)
+
+    async def aexecute(self, user: User, content: str | None):
+        if content is not None:
+            raise ValueError("content must be None for OpenAISpeechToTextUseCase")
+        record = await self._latest_audio(user).alast()
+
+        if record is None:
+            raise ObjectDoesNotExist("No audio file registered for the user")
+
+        return await MediaJobRepository.aenqueue(
+            record.pk, MediaJob.Kind.SPEECH_TO_TEXT
         )
 
-        return llm_service.generate(my_chat_completion_message)
+    @staticmethod
+    def _latest_audio(user: User) -> QuerySet[ChatLogsWithLine]:
+        """
+        Note: (user, media_type, role, id) のインデックスを新しい順に読むだけで済む
+        """
+        return ChatLogsWithLine.objects.filter(
+            Q(user=user)
+            & Q(role="user")
+            & Q(media_type=ChatLogsWithLine.MediaType.AUDIO)
+            & Q(invisible=False)
+        ).order_by("pk")
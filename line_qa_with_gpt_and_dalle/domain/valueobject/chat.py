@@ -17,12 +17,14 @@ class MyChatCompletionMessage:
         pk: int = None,
         content: str = None,
         file_path: str = None,
+        media_type: str = None,
     ):
         self.id = pk
         self.user = user
         self.role = role
         self.content = content
         self.file_path = file_path
+        self.media_type = media_type
         self.invisible = invisible
 
     def to_origin(self):
@@ -44,6 +46,7 @@ class MyChatCompletionMessage:
             content=self.content,
             invisible=self.invisible,
             file_path=self.file_path,
+            media_type=self.media_type,
         )
 
     def __str__(self):
@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+
+
+@dataclass(frozen=True)
+class ChatContextPolicy:
+    """
+    LLM に送る会話履歴の組み立て方。サービスごとに設定する
+
+    Attributes:
+        max_prompt_tokens (int): system プロンプト・要約・直近の会話を合わせたトークン数の上限。
+        max_recent_messages (int): そのまま送る直近のメッセージ数の上限（1往復で2件）。
+        summary_model (str): 古い会話を要約するモデル。
+        summary_max_tokens (int): 要約の長さの上限（トークン）。
+        encoding_name (str): トークン数を数える tiktoken のエンコーディング。
+        window_step (int): 直近の会話の先頭を何件単位で進めるか。先頭が数ターン動かないので、そのあいだは
+            system プロンプトから直近の会話までの前置きが毎回同じになり、プロバイダ側のプロンプトキャッシュが効く。
+    """
+
+    max_prompt_tokens: int = 6000
+    max_recent_messages: int = 20
+    summary_model: str = "gpt-3.5-turbo"
+    summary_max_tokens: int = 500
+    encoding_name: str = "cl100k_base"
+    window_step: int = 6
+
+
+@dataclass
+class ChatContextPlan:
+    """
+    会話履歴を「そのまま送るもの」と「要約に畳み込むもの」に分けた結果
+
+    Attributes:
+        system (list[MyChatCompletionMessage]): 先頭の system プロンプト（常に送る）。
+        to_summarize (list[MyChatCompletionMessage]): 予算に入りきらず、要約に畳み込む古い会話。
+        recent (list[MyChatCompletionMessage]): そのまま送る直近の会話。
+    """
+
+    system: list[MyChatCompletionMessage]
+    to_summarize: list[MyChatCompletionMessage]
+    recent: list[MyChatCompletionMessage]
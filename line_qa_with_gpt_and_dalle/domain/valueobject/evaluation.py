@@ -0,0 +1,38 @@
+import json
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SkillEvaluation:
+    """
+    なぞなぞの判定結果（1スキルぶん）
+
+    Attributes:
+        skill (str): 評価したスキル（論理的思考力、洞察力）。
+        score (int): 点数。
+        judge (str): 合格 / 不合格。
+    """
+
+    skill: str
+    score: int
+    judge: str
+
+    @classmethod
+    def from_json(cls, content: str) -> list["SkillEvaluation"]:
+        """
+        JSON モードの応答（{"results": [判定結果例の配列]}）を読む
+        JSON モードはオブジェクトしか返さないので、配列はキーの下にある。配列がそのまま返ってきても読める
+
+        Raises:
+            ValueError: 判定結果として読めないとき
+        """
+        try:
+            data = json.loads(content)
+            if isinstance(data, dict):
+                data = next(x for x in data.values() if isinstance(x, list))
+            return [
+                cls(skill=str(x["skill"]), score=int(x["score"]), judge=str(x["judge"]))
+                for x in data
+            ]
+        except (ValueError, TypeError, KeyError, StopIteration) as e:
+            raise ValueError(f"invalid evaluation: {content}") from e
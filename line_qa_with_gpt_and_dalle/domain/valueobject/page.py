@@ -0,0 +1,52 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+
+
+@dataclass(frozen=True)
+class ChatLogCursor:
+    """
+    キーセットページングの位置（このページで一番古い行）。次のページはこれより古い行を読む
+
+    Attributes:
+        created_at (datetime): 行の作成日時。
+        pk (int): 作成日時が同じ行を区別するための pk。
+    """
+
+    created_at: datetime
+    pk: int
+
+    def encode(self) -> str:
+        """
+        URL のクエリにそのまま載せられる文字列にする
+        """
+        raw = json.dumps([self.created_at.isoformat(), self.pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, value: str) -> "ChatLogCursor":
+        """
+        Raises:
+            ValueError: 壊れた文字列のとき
+        """
+        try:
+            raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+            created_at, pk = json.loads(raw)
+            return cls(created_at=datetime.fromisoformat(created_at), pk=int(pk))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"invalid cursor: {value}") from e
+
+
+@dataclass
+class ChatLogPage:
+    """
+    Attributes:
+        rows (list[ChatLogsWithLine]): 表示する行（古い順）。
+        older (ChatLogCursor | None): さらに古い行を読むための位置。これより古い行がなければ None。
+    """
+
+    rows: list[ChatLogsWithLine]
+    older: ChatLogCursor | None
@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class PromptUsage:
+    """
+    LLM に送ったトークン数の累計。プロバイダ側のプロンプトキャッシュがどれだけ効いているかを確かめるために使う
+
+    Attributes:
+        requests (int): 応答を受け取った回数。
+        prompt_tokens (int): プロンプトのトークン数。
+        cached_tokens (int): プロンプトのうち、プロバイダ側のキャッシュから読まれたトークン数。
+        completion_tokens (int): 応答のトークン数。
+    """
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def cached_rate(self) -> float:
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens > 0 else 0
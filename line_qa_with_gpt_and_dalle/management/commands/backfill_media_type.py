@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+
+# 既存の行の file_path の拡張子と、media_type の対応（OpenAIDalleService / OpenAITextToSpeechService が保存する形式）
+EXTENSIONS = {
+    ".jpg": ChatLogsWithLine.MediaType.IMAGE,
+    ".mp3": ChatLogsWithLine.MediaType.AUDIO,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "media_type の列を追加する前に保存された会話ログに、file_path の拡張子から media_type を埋めます。"
+        "makemigrations / migrate のあとに1回だけ実行してください"
+    )
+
+    def handle(self, *args, **options):
+        for extension, media_type in EXTENSIONS.items():
+            updated = ChatLogsWithLine.objects.filter(
+                media_type__isnull=True, file_path__endswith=extension
+            ).update(media_type=media_type)
+            self.stdout.write(f"{extension}: {updated} 件")
+
+        self.stdout.write(self.style.SUCCESS("media_type を埋めました"))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from config.settings import (
+    MEDIA_JOB_CONCURRENCY,
+    MEDIA_JOB_MAX_ATTEMPTS,
+    MEDIA_JOB_POLL_SECONDS,
+    MEDIA_JOB_TIMEOUT_SECONDS,
+)
+from line_qa_with_gpt_and_dalle.domain.service.media_job import MediaJobWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "画像・音声の生成ジョブ（DALL·E / TTS / Whisper）となぞなぞの評価のジョブを処理します。"
+        "Webサーバとは別のプロセスで動かしてください"
+    )
+
+    def add_arguments(self, parser):
+        for kind, default in MEDIA_JOB_CONCURRENCY.items():
+            parser.add_argument(
+                f"--{kind}",
+                type=int,
+                default=default,
+                help=f"{kind} のジョブの同時実行数",
+            )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="いまキューにあるジョブを1回ぶんだけ取り出して、終わったら終了する",
+        )
+
+    def handle(self, *args, **options):
+        worker = MediaJobWorker(
+            concurrency={kind: options[kind] for kind in MEDIA_JOB_CONCURRENCY},
+            poll_seconds=MEDIA_JOB_POLL_SECONDS,
+            timeout_seconds=MEDIA_JOB_TIMEOUT_SECONDS,
+            max_attempts=MEDIA_JOB_MAX_ATTEMPTS,
+        )
+        if options["once"]:
+            submitted = worker.run_once()
+            worker.executor.shutdown(wait=True)
+            self.stdout.write(
+                self.style.SUCCESS(f"{submitted} 件のジョブを処理しました")
+            )
+            return
+
+        self.stdout.write(f"ジョブを待っています: {worker.concurrency}")
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            worker.stop()
@@ -3,9 +3,101 @@ from django.db import models
 
 
 class ChatLogsWithLine(models.Model):
+    class MediaType(models.TextChoices):
+        IMAGE = "image"
+        AUDIO = "audio"
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=255)
     content = models.TextField()
     file_path = models.CharField(max_length=255, null=True)
+    # file_path の拡張子を見ずに絞り込めるように、添付ファイルの種類を持っておく（添付なしは null）
+    media_type = models.CharField(max_length=16, choices=MediaType.choices, null=True)
     invisible = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # 画面表示のキーセットページング（ユーザごとに created_at, id の順）
+            models.Index(
+                fields=["user", "created_at", "id"], name="chatlog_line_user_created"
+            ),
+            # 最新の音声ファイルの検索（OpenAISpeechToTextUseCase）。invisible は NOT invisible と
+            # 書かれて等価条件にならないので、インデックスに入れず id の降順で読んだ行を確かめる
+            models.Index(
+                fields=["user", "media_type", "role", "id"],
+                name="chatlog_line_user_media",
+            ),
+        ]
+
+
+class ChatSummaryWithLine(models.Model):
+    """
+    ChatLogsWithLine のうち、LLM にそのまま送らずに要約へ畳み込んだ会話の要約（ユーザごとに1行）
+    last_chatlog_id 以下の会話は要約に含まれている
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    content = models.TextField()
+    last_chatlog_id = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ChatHistoryVersionWithLine(models.Model):
+    """
+    ChatLogsWithLine の既存の行を書き換えるたびに上げる番号（ユーザごとに1行）
+    会話履歴のキャッシュはプロセスごとにあるので、どのプロセスが書き換えても気づけるように DB に置く
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    version = models.PositiveBigIntegerField(default=0)
+
+
+class MediaJob(models.Model):
+    """
+    DALL·E / TTS / Whisper の生成を HTTP リクエストの外で行うためのジョブ（run_media_worker が処理する）
+    会話ログの行は投入時に作っておき、ジョブが終わったら file_path（文字起こしは content）を埋める
+    なぞなぞの評価（EVALUATION）は最後の回答の行に対して投入し、結果は ChatEvaluationWithLine に保存する
+    """
+
+    class Kind(models.TextChoices):
+        DALLE = "dalle"
+        TEXT_TO_SPEECH = "tts"
+        SPEECH_TO_TEXT = "stt"
+        EVALUATION = "evaluation"
+
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        SUCCEEDED = "succeeded"
+        FAILED = "failed"
+
+    chatlog = models.ForeignKey(ChatLogsWithLine, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # ワーカーが種類ごとに古い順に取り出す
+            models.Index(fields=["status", "kind", "id"], name="mediajob_status_kind"),
+        ]
+
+
+class ChatEvaluationWithLine(models.Model):
+    """
+    なぞなぞの判定結果（スキルごとに1行）。chatlog は「本日はなぞなぞにご参加いただき」で終わった最後の回答
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    chatlog = models.ForeignKey(ChatLogsWithLine, on_delete=models.CASCADE)
+    skill = models.CharField(max_length=255)
+    score = models.IntegerField()
+    judge = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog import ChatLogRepository
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+
+
+class TestChatLogUnitOfWork(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester")
+
+    def add_turn(self, unit_of_work) -> list[MyChatCompletionMessage]:
+        # 最初のターン（system プロンプトから、質問1への回答まで）
+        return unit_of_work.add(
+            [
+                MyChatCompletionMessage(
+                    user=self.user, role=role, content=content, invisible=False
+                )
+                for role, content in [
+                    ("system", "なぞなぞの担当者です"),
+                    ("user", "なぞなぞスタート"),
+                    ("assistant", "質問1です"),
+                    ("user", "人間"),
+                ]
+            ]
+        )
+
+    def flush(self, unit_of_work) -> tuple[list[int], list[str]]:
+        with CaptureQueriesContext(connection) as queries:
+            pks = unit_of_work.flush()
+
+        return pks, [x["sql"] for x in queries.captured_queries]
+
+    def assert_flushed(
+        self,
+        messages: list[MyChatCompletionMessage],
+        pks: list[int],
+        statements: list[str],
+        inserts: int,
+    ):
+        self.assertNotIn(None, pks)
+        self.assertEqual(pks, [x.id for x in messages])
+        rows = ChatLogsWithLine.objects.in_bulk(pks)
+        self.assertEqual(
+            [x.content for x in messages], [rows[pk].content for pk in pks]
+        )
+        # TestCase のトランザクションの中なので、transaction.atomic は SAVEPOINT になる。
+        # INSERT がすべて1つの SAVEPOINT の中にあれば、1つのトランザクションでコミットされる
+        self.assertTrue(statements[0].startswith("SAVEPOINT"))
+        self.assertTrue(statements[-1].startswith("RELEASE SAVEPOINT"))
+        self.assertEqual(
+            [True] * inserts, [x.startswith("INSERT") for x in statements[1:-1]]
+        )
+
+    def test_flush_assigns_pks_in_one_transaction(self):
+        unit_of_work = ChatLogRepository.unit_of_work()
+        messages = self.add_turn(unit_of_work)
+        self.assertEqual([None] * 4, [x.id for x in messages])
+
+        pks, statements = self.flush(unit_of_work)
+
+        # 4件を1回の INSERT で保存する
+        self.assert_flushed(messages, pks, statements, inserts=1)
+        # 2回目は保存するものがない
+        self.assertEqual([], unit_of_work.flush())
+
+    def test_flush_without_returning_rows_from_bulk_insert(self):
+        unit_of_work = ChatLogRepository.unit_of_work()
+        messages = self.add_turn(unit_of_work)
+
+        # MySQL のように bulk_create で pk を返せないバックエンドでは1件ずつ INSERT する
+        with mock.patch.object(
+            type(connection.features),
+            "can_return_rows_from_bulk_insert",
+            new_callable=mock.PropertyMock,
+            return_value=False,
+        ):
+            pks, statements = self.flush(unit_of_work)
+
+        self.assert_flushed(messages, pks, statements, inserts=4)
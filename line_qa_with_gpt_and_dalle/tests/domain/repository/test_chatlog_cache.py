@@ -0,0 +1,146 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog import ChatLogRepository
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog_cache import (
+    ChatHistory,
+    ChatHistoryCache,
+)
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
+
+
+class TestChatHistoryCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester")
+        self.cache = ChatHistoryCache(max_users=10, idle_seconds=60)
+        # find_newer に渡された last_pk
+        self.read_after = []
+
+    def create_row(self, content: str) -> ChatLogsWithLine:
+        return ChatLogsWithLine.objects.create(
+            user=self.user, role="user", content=content
+        )
+
+    def get(self, user_id: int | None = None) -> ChatHistory:
+        user_id = user_id or self.user.pk
+
+        def find_newer(last_pk: int):
+            self.read_after.append(last_pk)
+            return ChatLogRepository._find_newer(user_id, last_pk)
+
+        return self.cache.get(
+            user_id,
+            find_newer,
+            lambda: ChatLogRepository._find_version(user_id),
+        )
+
+    def aget(self) -> ChatHistory:
+        async def afind_newer(last_pk: int):
+            self.read_after.append(last_pk)
+            return await ChatLogRepository._afind_newer(self.user.pk, last_pk)
+
+        return async_to_sync(self.cache.aget)(
+            self.user.pk,
+            afind_newer,
+            lambda: ChatLogRepository._afind_version(self.user.pk),
+        )
+
+    def test_reads_only_rows_newer_than_last_pk(self):
+        first = self.create_row("1")
+        second = self.create_row("2")
+        self.assertEqual(["1", "2"], [x.content for x in self.get().rows])
+
+        third = self.create_row("3")
+        history = self.get()
+
+        self.assertEqual(["1", "2", "3"], [x.content for x in history.messages])
+        self.assertEqual(third.pk, history.last_pk)
+        self.assertEqual([0, second.pk], self.read_after)
+        self.assertEqual(first.pk, history.rows[0].pk)
+
+    def test_aget_reads_only_rows_newer_than_last_pk(self):
+        self.create_row("1")
+        first = self.aget()
+
+        self.create_row("2")
+        history = self.aget()
+
+        self.assertEqual(["1", "2"], [x.content for x in history.rows])
+        self.assertEqual([0, first.last_pk], self.read_after)
+
+    def test_upsert_of_existing_row_reloads_history(self):
+        row = self.create_row("1")
+        self.create_row("2")
+        self.get()
+
+        # ほかのプロセスのキャッシュは invalidate されないので、DB の番号だけで気づく
+        ChatLogRepository.upsert(
+            MyChatCompletionMessage(
+                user=self.user,
+                role="user",
+                pk=row.pk,
+                content="書き換えた",
+                invisible=False,
+            )
+        )
+        history = self.get()
+
+        self.assertEqual(["書き換えた", "2"], [x.content for x in history.rows])
+        self.assertEqual(0, self.read_after[-1])
+        self.assertEqual(1, history.version)
+
+    def test_aget_notices_upsert(self):
+        row = self.create_row("1")
+        self.aget()
+
+        async_to_sync(ChatLogRepository.aupsert)(
+            MyChatCompletionMessage(
+                user=self.user,
+                role="user",
+                pk=row.pk,
+                content="書き換えた",
+                invisible=False,
+            )
+        )
+
+        self.assertEqual(["書き換えた"], [x.content for x in self.aget().rows])
+
+    def test_idle_user_is_evicted(self):
+        other = User.objects.create_user("other")
+        self.create_row("1")
+        with mock.patch(
+            "line_qa_with_gpt_and_dalle.domain.repository.chatlog_cache.time.monotonic",
+            side_effect=[0.0, 30.0, 100.0],
+        ):
+            self.get()
+            self.get(other.pk)
+            # 60秒より長く使われていないユーザだけを追い出す
+            self.get(other.pk)
+
+        self.assertEqual([other.pk], list(self.cache._histories))
+
+    def test_least_recently_used_user_is_evicted_over_max_users(self):
+        self.cache.max_users = 1
+        other = User.objects.create_user("other")
+
+        self.get()
+        self.get(other.pk)
+
+        self.assertEqual([other.pk], list(self.cache._histories))
+
+    def test_mutating_result_does_not_change_cache(self):
+        self.create_row("1")
+        history = self.get()
+
+        history.rows[0].content = "書き換えた"
+        history.messages[0].content = "書き換えた"
+        history.rows.append(history.rows[0])
+        history.messages.clear()
+
+        cached = self.get()
+        self.assertEqual(["1"], [x.content for x in cached.rows])
+        self.assertEqual(["1"], [x.content for x in cached.messages])
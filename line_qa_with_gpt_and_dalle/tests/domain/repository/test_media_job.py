@@ -0,0 +1,99 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.utils import timezone
+
+from line_qa_with_gpt_and_dalle.domain.repository.media_job import (
+    MediaJobRepository,
+)
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine, MediaJob
+
+
+def create_job(user: User, kind: str = MediaJob.Kind.DALLE) -> MediaJob:
+    chatlog = ChatLogsWithLine.objects.create(user=user, role="assistant", content="")
+    return MediaJobRepository.enqueue(chatlog.pk, kind)
+
+
+class TestMediaJobRepository(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester")
+
+    def test_claim_takes_oldest_jobs_of_kind(self):
+        first = create_job(self.user)
+        second = create_job(self.user)
+        create_job(self.user, MediaJob.Kind.TEXT_TO_SPEECH)
+        last = create_job(self.user)
+
+        claimed = MediaJobRepository.claim(MediaJob.Kind.DALLE, 2)
+
+        self.assertEqual([first.pk, second.pk], [x.pk for x in claimed])
+        for job in claimed:
+            self.assertEqual(MediaJob.Status.RUNNING, job.status)
+            self.assertEqual(1, job.attempts)
+            self.assertIsNotNone(job.started_at)
+        # 取り出したジョブは二度と取り出さない
+        remaining = MediaJobRepository.claim(MediaJob.Kind.DALLE, 2)
+        self.assertEqual([last.pk], [x.pk for x in remaining])
+
+    def test_claim_skips_job_taken_by_another_worker(self):
+        job = create_job(self.user)
+        update = QuerySet.update
+        raced = []
+
+        def update_after_another_worker(queryset, **kwargs):
+            # 候補を選んでから UPDATE するまでの間に、別のワーカーが同じジョブを取り出した
+            if not raced:
+                raced.append(job.pk)
+                update(
+                    MediaJob.objects.filter(pk=job.pk), status=MediaJob.Status.RUNNING
+                )
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, "update", update_after_another_worker):
+            claimed = MediaJobRepository.claim(MediaJob.Kind.DALLE, 1)
+
+        self.assertEqual([], claimed)
+        self.assertEqual([job.pk], raced)
+        self.assertEqual(0, MediaJob.objects.get(pk=job.pk).attempts)
+
+    def test_fail_requeues_until_max_attempts(self):
+        create_job(self.user)
+
+        for attempt in range(1, 3):
+            (job,) = MediaJobRepository.claim(MediaJob.Kind.DALLE, 1)
+            self.assertEqual(attempt, job.attempts)
+            MediaJobRepository.fail(job, "boom", max_attempts=3)
+            self.assertEqual(
+                MediaJob.Status.QUEUED, MediaJob.objects.get(pk=job.pk).status
+            )
+
+        (job,) = MediaJobRepository.claim(MediaJob.Kind.DALLE, 1)
+        MediaJobRepository.fail(job, "boom", max_attempts=3)
+
+        job.refresh_from_db()
+        self.assertEqual(MediaJob.Status.FAILED, job.status)
+        self.assertEqual(3, job.attempts)
+        self.assertEqual("boom", job.error)
+        self.assertEqual([], MediaJobRepository.claim(MediaJob.Kind.DALLE, 1))
+
+    def test_requeue_stale_returns_only_old_running_jobs(self):
+        stale = create_job(self.user)
+        fresh = create_job(self.user)
+        MediaJobRepository.claim(MediaJob.Kind.DALLE, 2)
+        MediaJob.objects.filter(pk=stale.pk).update(
+            started_at=timezone.now() - timedelta(seconds=120)
+        )
+
+        self.assertEqual(1, MediaJobRepository.requeue_stale(60))
+
+        self.assertEqual(
+            MediaJob.Status.QUEUED, MediaJob.objects.get(pk=stale.pk).status
+        )
+        self.assertEqual(
+            MediaJob.Status.RUNNING, MediaJob.objects.get(pk=fresh.pk).status
+        )
+        (job,) = MediaJobRepository.claim(MediaJob.Kind.DALLE, 1)
+        self.assertEqual((stale.pk, 2), (job.pk, job.attempts))
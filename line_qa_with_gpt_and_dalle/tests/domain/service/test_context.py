@@ -0,0 +1,167 @@
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase as DjangoTestCase
+from openai.types import CompletionUsage
+
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog_cache import to_message
+from line_qa_with_gpt_and_dalle.domain.service.context import ChatContextBuilder
+from line_qa_with_gpt_and_dalle.domain.service.llm import OpenAIGptService
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.domain.valueobject.context import ChatContextPolicy
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine, ChatSummaryWithLine
+
+
+class CharEncoding:
+    """
+    1文字を1トークンと数える（tiktoken のファイルを読まずにトークン数を決める）
+    """
+
+    def encode_ordinary(self, text: str) -> list[str]:
+        return list(text)
+
+
+def patch_encoding():
+    return mock.patch(
+        "line_qa_with_gpt_and_dalle.domain.service.context.tiktoken.get_encoding",
+        return_value=CharEncoding(),
+    )
+
+
+def policy(**kwargs) -> ChatContextPolicy:
+    # lru_cache の count_static_tokens が本物のエンコーディングの結果と混ざらない名前にする
+    return ChatContextPolicy(encoding_name="chars", **kwargs)
+
+
+def message(user, role: str, content: str = "x" * 10) -> MyChatCompletionMessage:
+    return MyChatCompletionMessage(
+        user=user, role=role, invisible=role == "system", content=content
+    )
+
+
+def conversation(user, n: int) -> list[MyChatCompletionMessage]:
+    """
+    system プロンプトのあとに、user から始めて user / assistant を交互に n 件
+    """
+    return [message(user, "system", "s" * 20)] + [
+        message(user, "user" if i % 2 == 0 else "assistant") for i in range(n)
+    ]
+
+
+class TestChatContextBuilder(TestCase):
+    def setUp(self):
+        patcher = patch_encoding()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recent_messages_fit_in_budget(self):
+        builder = ChatContextBuilder(
+            policy(max_prompt_tokens=200, summary_max_tokens=50, window_step=1)
+        )
+        history = conversation(None, 31)
+
+        plan = builder.plan(history)
+
+        self.assertEqual(history[:1], plan.system)
+        self.assertEqual(history[1:], plan.to_summarize + plan.recent)
+        # system 24 トークン + 要約 50 トークンの残り 126 トークンに、14 トークンのメッセージが 9 件入る
+        self.assertEqual(9, len(plan.recent))
+        self.assertLessEqual(
+            sum(builder.count_tokens(x) for x in plan.system + plan.recent) + 50, 200
+        )
+
+    def test_newest_message_is_kept_even_if_over_budget(self):
+        builder = ChatContextBuilder(
+            policy(max_prompt_tokens=200, summary_max_tokens=50, window_step=1)
+        )
+        history = conversation(None, 4)
+        history.append(message(None, "user", "x" * 1000))
+
+        plan = builder.plan(history)
+
+        self.assertEqual([history[-1]], plan.recent)
+        self.assertEqual(history[1:-1], plan.to_summarize)
+
+    def test_window_start_moves_every_window_step(self):
+        builder = ChatContextBuilder(policy(max_recent_messages=6, window_step=4))
+        history = conversation(None, 0)
+
+        starts = []
+        for _ in range(9):
+            # ユーザの入力で計画を立て、そのあとに返答が付く
+            history.append(message(None, "user"))
+            starts.append(len(builder.plan(history).to_summarize))
+            history.append(message(None, "assistant"))
+
+        # 先頭は window_step（2往復）ごとにしか進まないので、2ターン続けて同じ前置きになる
+        self.assertEqual([0, 0, 0, 4, 4, 8, 8, 12, 12], starts)
+
+    def test_recent_messages_do_not_start_with_assistant(self):
+        builder = ChatContextBuilder(policy(max_recent_messages=2, window_step=1))
+        history = conversation(None, 5)
+
+        plan = builder.plan(history)
+
+        # 直近の2件は assistant から始まるので、最後の user だけを送る
+        self.assertEqual([history[-1]], plan.recent)
+        self.assertEqual("assistant", plan.to_summarize[-1].role)
+
+
+class TestBuildContext(DjangoTestCase):
+    def setUp(self):
+        patcher = patch_encoding()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user("tester")
+        self.history = [
+            to_message(
+                ChatLogsWithLine.objects.create(
+                    user=self.user, role=x.role, content=x.content
+                )
+            )
+            for x in conversation(self.user, 7)
+        ]
+        self.service = OpenAIGptService(policy(max_recent_messages=2, window_step=1))
+        self.service.client = mock.Mock()
+        self.service.client.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="新しい要約"))],
+            usage=CompletionUsage(prompt_tokens=1, completion_tokens=1, total_tokens=2),
+        )
+
+    def test_summarizes_only_messages_newer_than_stored_summary(self):
+        # 最初の往復はもう要約に入っている
+        ChatSummaryWithLine.objects.create(
+            user=self.user, content="前の要約", last_chatlog_id=self.history[2].id
+        )
+
+        context = self.service.build_context(self.history)
+
+        create = self.service.client.chat.completions.create
+        create.assert_called_once()
+        self.assertEqual(
+            ChatContextBuilder.summary_prompt("前の要約", self.history[3:7]),
+            create.call_args.kwargs["messages"],
+        )
+        summary = ChatSummaryWithLine.objects.get(user=self.user)
+        self.assertEqual(
+            ("新しい要約", self.history[6].id),
+            (summary.content, summary.last_chatlog_id),
+        )
+        self.assertEqual(
+            [
+                self.history[0].content,
+                "これまでの会話の要約:\n新しい要約",
+                self.history[7].content,
+            ],
+            [x.content for x in context],
+        )
+
+    def test_does_not_summarize_again_when_nothing_new_overflows(self):
+        self.service.build_context(self.history)
+        self.service.client.chat.completions.create.reset_mock()
+
+        context = self.service.build_context(self.history)
+
+        self.service.client.chat.completions.create.assert_not_called()
+        self.assertEqual("これまでの会話の要約:\n新しい要約", context[1].content)
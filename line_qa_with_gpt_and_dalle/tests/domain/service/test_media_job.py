@@ -0,0 +1,180 @@
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from line_qa_with_gpt_and_dalle.domain.service import media_job
+from line_qa_with_gpt_and_dalle.domain.service.llm import OpenAISpeechToTextService
+from line_qa_with_gpt_and_dalle.domain.service.media_job import (
+    MediaJobWorker,
+    enqueue_media_job,
+    run_media_job,
+)
+from line_qa_with_gpt_and_dalle.domain.valueobject.chat import MyChatCompletionMessage
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine, MediaJob
+
+
+class TestRunMediaJob(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester")
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.media_root = Path(temp_dir.name)
+        patcher = mock.patch(
+            "line_qa_with_gpt_and_dalle.domain.service.llm.MEDIA_ROOT", self.media_root
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def enqueue_audio(self, file_path: str) -> MediaJob:
+        # OpenAITextToSpeechService が保存するのと同じ形の行
+        message = MyChatCompletionMessage(
+            user=self.user,
+            role="user",
+            content="",
+            file_path=file_path,
+            media_type=ChatLogsWithLine.MediaType.AUDIO,
+            invisible=False,
+        )
+        job = enqueue_media_job(message, MediaJob.Kind.SPEECH_TO_TEXT)
+        return MediaJob.objects.select_related("chatlog__user").get(pk=job.pk)
+
+    def test_speech_to_text_reads_file_under_media_root(self):
+        audio_path = self.media_root / "audios" / "0123456789.mp3"
+        audio_path.parent.mkdir()
+        audio_path.write_bytes(b"mp3")
+        job = self.enqueue_audio("/media/audios/0123456789.mp3")
+
+        with mock.patch.object(
+            OpenAISpeechToTextService,
+            "post_to_gpt",
+            return_value=SimpleNamespace(text="なぞなぞスタート"),
+        ) as post_to_gpt:
+            run_media_job(job)
+
+        post_to_gpt.assert_called_once_with(str(audio_path))
+        self.assertEqual(
+            "なぞなぞスタート", ChatLogsWithLine.objects.get(pk=job.chatlog_id).content
+        )
+
+    def test_speech_to_text_fails_when_file_is_missing(self):
+        job = self.enqueue_audio("/media/audios/missing.mp3")
+
+        with self.assertRaises(FileNotFoundError):
+            run_media_job(job)
+
+    def test_post_to_gpt_closes_audio_file(self):
+        audio_path = self.media_root / "audio.mp3"
+        audio_path.write_bytes(b"mp3")
+        service = OpenAISpeechToTextService()
+        service.client = mock.Mock()
+
+        service.post_to_gpt(str(audio_path))
+
+        audio = service.client.audio.transcriptions.create.call_args.kwargs["file"]
+        self.assertTrue(audio.closed)
+
+
+class RecordingExecutor:
+    """
+    渡されたジョブを実行せずに溜めておく（テストの側で1件ずつ実行する）
+    """
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append((fn, args))
+
+    def run_all(self):
+        submitted, self.submitted = self.submitted, []
+        for fn, args in submitted:
+            fn(*args)
+
+
+class TestMediaJobWorker(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tester")
+
+    def enqueue(self, kind: str) -> MediaJob:
+        chatlog = ChatLogsWithLine.objects.create(
+            user=self.user, role="assistant", content=""
+        )
+        return MediaJob.objects.create(chatlog=chatlog, kind=kind)
+
+    def create_worker(self, concurrency: dict[str, int], handler, max_attempts=3):
+        worker = MediaJobWorker(
+            concurrency,
+            poll_seconds=0,
+            timeout_seconds=60,
+            max_attempts=max_attempts,
+            handler=handler,
+        )
+        worker.executor.shutdown()
+        worker.executor = RecordingExecutor()
+        return worker
+
+    def test_concurrency_is_limited_per_kind(self):
+        for _ in range(3):
+            self.enqueue(MediaJob.Kind.DALLE)
+            self.enqueue(MediaJob.Kind.TEXT_TO_SPEECH)
+        worker = self.create_worker(
+            {MediaJob.Kind.DALLE: 1, MediaJob.Kind.TEXT_TO_SPEECH: 2}, mock.Mock()
+        )
+
+        self.assertEqual(3, worker.run_once())
+        self.assertEqual(
+            {MediaJob.Kind.DALLE: 1, MediaJob.Kind.TEXT_TO_SPEECH: 2}, worker.running
+        )
+        # 枠が埋まっているあいだは取り出さない
+        self.assertEqual(0, worker.run_once())
+
+        worker.executor.run_all()
+
+        self.assertEqual(
+            {MediaJob.Kind.DALLE: 0, MediaJob.Kind.TEXT_TO_SPEECH: 0}, worker.running
+        )
+        self.assertEqual(
+            3, MediaJob.objects.filter(status=MediaJob.Status.SUCCEEDED).count()
+        )
+        self.assertEqual(2, worker.run_once())
+
+    def test_failed_job_is_retried_until_max_attempts(self):
+        job = self.enqueue(MediaJob.Kind.SPEECH_TO_TEXT)
+        handler = mock.Mock(side_effect=FileNotFoundError("missing"))
+        worker = self.create_worker(
+            {MediaJob.Kind.SPEECH_TO_TEXT: 1}, handler, max_attempts=2
+        )
+
+        with self.assertLogs(media_job.logger, "ERROR") as logs:
+            for _ in range(3):
+                worker.run_once()
+                worker.executor.run_all()
+
+        job.refresh_from_db()
+        self.assertEqual(2, handler.call_count)
+        self.assertEqual(MediaJob.Status.FAILED, job.status)
+        self.assertEqual(2, job.attempts)
+        self.assertEqual(repr(FileNotFoundError("missing")), job.error)
+        self.assertEqual(2, len(logs.records))
+        self.assertEqual({MediaJob.Kind.SPEECH_TO_TEXT: 0}, worker.running)
+
+    def test_stale_running_job_is_requeued(self):
+        job = self.enqueue(MediaJob.Kind.DALLE)
+        MediaJob.objects.filter(pk=job.pk).update(
+            status=MediaJob.Status.RUNNING,
+            started_at=timezone.now() - timedelta(seconds=120),
+            attempts=1,
+        )
+        worker = self.create_worker({MediaJob.Kind.DALLE: 1}, mock.Mock())
+
+        with self.assertLogs(media_job.logger, "WARNING"):
+            self.assertEqual(1, worker.run_once())
+
+        job.refresh_from_db()
+        self.assertEqual((MediaJob.Status.RUNNING, 2), (job.status, job.attempts))
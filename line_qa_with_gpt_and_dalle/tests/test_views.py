@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from line_qa_with_gpt_and_dalle.domain.usecase.llm_service_use_cases import (
+    OpenAIGptUseCase,
+)
+from line_qa_with_gpt_and_dalle.views import STREAM_ERROR_MESSAGE
+
+
+class TestHomeView(TestCase):
+    def setUp(self):
+        User.objects.create_user("tester", pk=1)
+
+    def test_form_posts_to_sync_view_under_wsgi(self):
+        response = self.client.get(reverse("line_qa_with_gpt:home"))
+
+        self.assertEqual(
+            reverse("line_qa_with_gpt:home"), response.context["form_action"]
+        )
+
+    async def test_form_posts_to_async_view_under_asgi(self):
+        response = await self.async_client.get(reverse("line_qa_with_gpt:home"))
+
+        self.assertEqual(
+            reverse("line_qa_with_gpt:async_home"), response.context["form_action"]
+        )
+        self.assertEqual(
+            reverse("line_qa_with_gpt:async_stream"), response.context["stream_url"]
+        )
+        self.assertContains(
+            response, f'action="{reverse("line_qa_with_gpt:async_home")}"'
+        )
+
+
+def answer(*deltas: str, error: Exception | None = None):
+    yield from deltas
+    if error:
+        raise error
+
+
+async def aanswer(*deltas: str, error: Exception | None = None):
+    for delta in deltas:
+        yield delta
+    if error:
+        raise error
+
+
+DONE = "event: done\ndata: {}\n\n"
+ERROR = f'event: error\ndata: {{"message": "{STREAM_ERROR_MESSAGE}"}}\n\n'
+
+
+class TestStreamView(TestCase):
+    def setUp(self):
+        User.objects.create_user("tester", pk=1)
+
+    def post(self, deltas) -> list[str]:
+        with mock.patch.object(OpenAIGptUseCase, "execute_stream", return_value=deltas):
+            response = self.client.post(
+                reverse("line_qa_with_gpt:stream"), {"question": "人間"}
+            )
+            return [x.decode() for x in response.streaming_content]
+
+    async def apost(self, deltas) -> list[str]:
+        with mock.patch.object(
+            OpenAIGptUseCase, "aexecute_stream", return_value=deltas
+        ):
+            response = await self.async_client.post(
+                reverse("line_qa_with_gpt:async_stream"), {"question": "人間"}
+            )
+            # ASGI で1イベントずつ送れるのは、非同期のイテレータのときだけ
+            self.assertTrue(response.is_async)
+            return [x.decode() async for x in response.streaming_content]
+
+    def test_streams_deltas_then_done(self):
+        self.assertEqual(
+            ['data: {"delta": "答え"}\n\n', 'data: {"delta": "は"}\n\n', DONE],
+            self.post(answer("答え", "は")),
+        )
+
+    def test_sends_error_event_when_stream_fails(self):
+        with self.assertLogs("line_qa_with_gpt_and_dalle.views", "ERROR"):
+            events = self.post(answer("答え", error=RuntimeError("timeout")))
+
+        self.assertEqual(['data: {"delta": "答え"}\n\n', ERROR], events)
+
+    async def test_async_streams_deltas_then_done(self):
+        self.assertEqual(
+            ['data: {"delta": "答え"}\n\n', 'data: {"delta": "は"}\n\n', DONE],
+            await self.apost(aanswer("答え", "は")),
+        )
+
+    async def test_async_sends_error_event_when_stream_fails(self):
+        with self.assertLogs("line_qa_with_gpt_and_dalle.views", "ERROR"):
+            events = await self.apost(aanswer(error=RuntimeError("timeout")))
+
+        self.assertEqual([ERROR], events)
@@ -5,5 +5,9 @@ from . import views
 app_name = "line_qa_with_gpt"
 urlpatterns = [
     path("", views.HomeView.as_view(), name="home"),
+    path("async/", views.AsyncHomeView.as_view(), name="async_home"),
+    path("stream/", views.StreamView.as_view(), name="stream"),
+    path("stream/async/", views.AsyncStreamView.as_view(), name="async_stream"),
+    path("jobs/<int:pk>/", views.MediaJobStatusView.as_view(), name="job_status"),
     # path("line_webhook/", views.LineWebHookView.as_view(), name="line_webhook"),
 ]
@@ -1,13 +1,22 @@
 import json
+import logging
+from typing import AsyncIterator, Iterator
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
-from django.http import HttpResponse
-from django.urls import reverse_lazy
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse, reverse_lazy
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import FormView
 from dotenv import load_dotenv
 
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog import ChatLogRepository
+from line_qa_with_gpt_and_dalle.domain.repository.media_job import (
+    MediaJobRepository,
+)
 from line_qa_with_gpt_and_dalle.domain.usecase.llm_service_use_cases import (
     GeminiUseCase,
     OpenAIGptUseCase,
@@ -16,12 +25,14 @@ from line_qa_with_gpt_and_dalle.domain.usecase.llm_service_use_cases import (
     OpenAISpeechToTextUseCase,
     UseCase,
 )
+from line_qa_with_gpt_and_dalle.domain.valueobject.page import ChatLogCursor
 from line_qa_with_gpt_and_dalle.forms import UserTextForm
-from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine
 
 # .env ファイルを読み込む
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class HomeView(FormView):
     template_name = "line_qa_with_gpt_and_dalle/home.html"
@@ -31,9 +42,25 @@ class HomeView(FormView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         login_user = User.objects.get(pk=1)  # TODO: request.user.id
-        context["chat_logs"] = ChatLogsWithLine.objects.filter(
-            user=login_user
-        ).order_by("created_at")
+        page = ChatLogRepository.find_chatlog_page_by_user_id(
+            login_user.pk, before=parse_cursor(self.request.GET.get("before"))
+        )
+        # 生成ジョブが終わっていない行には、画面からジョブの状態を問い合わせられるように印をつける
+        pending_jobs = MediaJobRepository.find_pending_by_chatlog_ids(
+            [x.pk for x in page.rows]
+        )
+        for chat_log in page.rows:
+            chat_log.pending_job = pending_jobs.get(chat_log.pk)
+        context["chat_logs"] = page.rows
+        context["older_cursor"] = page.older.encode() if page.older else None
+        # ASGI で動いているときは、フォームとストリーミングを非同期版（AsyncHomeView / AsyncStreamView）に送らせる
+        is_asgi = isinstance(self.request, ASGIRequest)
+        context["form_action"] = reverse(
+            "line_qa_with_gpt:async_home" if is_asgi else "line_qa_with_gpt:home"
+        )
+        context["stream_url"] = reverse(
+            "line_qa_with_gpt:async_stream" if is_asgi else "line_qa_with_gpt:stream"
+        )
 
         return context
 
@@ -41,32 +68,176 @@ class HomeView(FormView):
         form_data = form.cleaned_data
         login_user = User.objects.get(pk=1)  # TODO: request.user.id
 
-        use_case_type = "OpenAISpeechToText"  # TODO: ドロップダウンでモードを決める？
-        use_case: UseCase | None = None
-        content: str | None = form_data["question"]
-        if use_case_type == "Gemini":
-            use_case = GeminiUseCase()
-            content = form_data["question"]
-        elif use_case_type == "OpenAIGpt":
-            # Questionは何を入れてもいい（処理されない）
-            use_case = OpenAIGptUseCase()
-            content = form_data["question"]
-        elif use_case_type == "OpenAIDalle":
-            use_case = OpenAIDalleUseCase()
-            content = form_data["question"]
-        elif use_case_type == "OpenAITextToSpeech":
-            use_case = OpenAITextToSpeechUseCase()
-            content = form_data["question"]
-        elif use_case_type == "OpenAISpeechToText":
-            # Questionは何を入れてもいい（処理されない）
-            use_case = OpenAISpeechToTextUseCase()
-            content = None
-
+        use_case, content = create_use_case(USE_CASE_TYPE, form_data["question"])
         use_case.execute(user=login_user, content=content)
 
         return super().form_valid(form)
 
 
+class AsyncHomeView(View):
+    async def post(self, request, *args, **kwargs):
+        """
+        HomeView のフォーム送信の非同期版
+        ASGI（uvicorn config.asgi:application）で動かすと、LLM の応答を待つ間ワーカースレッドを占有しない
+        （runserver などの WSGI ではリクエストごとにイベントループを作るので、非同期のクライアントを使い回せない）
+        """
+        form = UserTextForm(request.POST)
+        if not form.is_valid():
+            # HomeView と同じく、エラーつきのフォームを表示し直す
+            return await sync_to_async(HomeView.as_view())(request, *args, **kwargs)
+        login_user = await User.objects.aget(pk=1)  # TODO: request.user.id
+
+        use_case, content = create_use_case(
+            USE_CASE_TYPE, form.cleaned_data["question"]
+        )
+        await use_case.aexecute(user=login_user, content=content)
+
+        return redirect("line_qa_with_gpt:home")
+
+
+class MediaJobStatusView(View):
+    @staticmethod
+    def get(request, pk: int, *args, **kwargs):
+        """
+        画像・音声の生成ジョブの状態。画面は終わるまでこれを数秒おきに問い合わせる
+        """
+        job = MediaJobRepository.find_by_id(pk)
+        if job is None:
+            raise Http404
+
+        return JsonResponse(
+            {
+                "status": job.status,
+                "file_path": job.chatlog.file_path,
+                "content": job.chatlog.content,
+                "error": job.error,
+            }
+        )
+
+
+USE_CASE_TYPE = "OpenAISpeechToText"  # TODO: ドロップダウンでモードを決める？
+
+
+def create_use_case(use_case_type: str, question: str) -> tuple[UseCase, str | None]:
+    use_case: UseCase | None = None
+    content: str | None = question
+    if use_case_type == "Gemini":
+        use_case = GeminiUseCase()
+        content = question
+    elif use_case_type == "OpenAIGpt":
+        # Questionは何を入れてもいい（処理されない）
+        use_case = OpenAIGptUseCase()
+        content = question
+    elif use_case_type == "OpenAIDalle":
+        use_case = OpenAIDalleUseCase()
+        content = question
+    elif use_case_type == "OpenAITextToSpeech":
+        use_case = OpenAITextToSpeechUseCase()
+        content = question
+    elif use_case_type == "OpenAISpeechToText":
+        # Questionは何を入れてもいい（処理されない）
+        use_case = OpenAISpeechToTextUseCase()
+        content = None
+
+    return use_case, content
+
+
+class StreamView(View):
+    @staticmethod
+    def post(request, *args, **kwargs):
+        """
+        OpenAIGpt の回答をトークンが届いた順に Server-Sent Events で返す
+        最初のトークンが届いた時点で画面に出せるので、生成が終わるまで待たせない
+        """
+        form = UserTextForm(request.POST)
+        if not form.is_valid():
+            return HttpResponse(status=400)
+        login_user = User.objects.get(pk=1)  # TODO: request.user.id
+
+        deltas = OpenAIGptUseCase().execute_stream(
+            user=login_user, content=form.cleaned_data["question"]
+        )
+
+        return server_sent_events_response(to_server_sent_events(deltas))
+
+
+class AsyncStreamView(View):
+    async def post(self, request, *args, **kwargs):
+        """
+        StreamView の非同期版
+        ASGI では同期のイテレータを渡すと最後まで読んでから送るので、非同期のイテレータで1トークンずつ送る
+        （WSGI では逆に非同期のイテレータを最後まで読んでから送るので、StreamView を使う）
+        """
+        form = UserTextForm(request.POST)
+        if not form.is_valid():
+            return HttpResponse(status=400)
+        login_user = await User.objects.aget(pk=1)  # TODO: request.user.id
+
+        deltas = OpenAIGptUseCase().aexecute_stream(
+            user=login_user, content=form.cleaned_data["question"]
+        )
+
+        return server_sent_events_response(ato_server_sent_events(deltas))
+
+
+def server_sent_events_response(
+    events: Iterator[str] | AsyncIterator[str],
+) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx などのリバースプロキシにバッファリングさせない
+    response["X-Accel-Buffering"] = "no"
+
+    return response
+
+
+def parse_cursor(value: str | None) -> ChatLogCursor | None:
+    """
+    壊れた位置が渡されたら最新のページを表示する
+    """
+    if not value:
+        return None
+    try:
+        return ChatLogCursor.decode(value)
+    except ValueError:
+        return None
+
+
+def to_server_sent_events(deltas: Iterator[str]) -> Iterator[str]:
+    """
+    回答の差分を data のイベントにして、最後に done を送る
+    ヘッダーを送ったあとはステータスコードで失敗を伝えられないので、途中で失敗したら error のイベントを送る
+    """
+    try:
+        for delta in deltas:
+            yield server_sent_event({"delta": delta})
+    except Exception:
+        logger.exception("failed to stream the answer")
+        yield server_sent_event({"message": STREAM_ERROR_MESSAGE}, event="error")
+        return
+    yield server_sent_event({}, event="done")
+
+
+async def ato_server_sent_events(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    try:
+        async for delta in deltas:
+            yield server_sent_event({"delta": delta})
+    except Exception:
+        logger.exception("failed to stream the answer")
+        yield server_sent_event({"message": STREAM_ERROR_MESSAGE}, event="error")
+        return
+    yield server_sent_event({}, event="done")
+
+
+# 例外の内容は画面に出さない（ログに残す）
+STREAM_ERROR_MESSAGE = "回答の生成に失敗しました。もう一度送信してください"
+
+
+def server_sent_event(data: dict, event: str | None = None) -> str:
+    data = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n" if event else f"data: {data}\n\n"
+
+
 @csrf_exempt
 class LineWebHookView(View):
     @staticmethod
@@ -0,0 +1,221 @@
+"""
+会話ログの画面表示と音声ファイルの検索を、インデックスの有無・OFFSET とキーセットで比較する
+
+    python -m retrieval_qa_with_source.benchmarks.chatlog_queries [--rows 2000000] [--users 10]
+
+使い捨ての SQLite に ChatLogsWithLine / ChatLogsWithSource をそれぞれ rows 件ずつ入れる
+（ORM を通すと遅いので、投入だけ executemany で行う）。計測するクエリはアプリと同じものを使う
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# config.settings が import 時に読むので、django.setup より前に SQLite を指定する
+DB_PATH = Path(tempfile.mkdtemp()) / "chatlog_benchmark.sqlite3"
+os.environ["DB_ENGINE"] = "django.db.backends.sqlite3"
+os.environ["DB_NAME"] = str(DB_PATH)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from line_qa_with_gpt_and_dalle.domain.repository.chatlog import (  # noqa: E402
+    ChatLogRepository as LineChatLogRepository,
+)
+from line_qa_with_gpt_and_dalle.domain.usecase.llm_service_use_cases import (  # noqa: E402
+    OpenAISpeechToTextUseCase,
+)
+from line_qa_with_gpt_and_dalle.domain.valueobject.page import (  # noqa: E402
+    ChatLogCursor as LineChatLogCursor,
+)
+from line_qa_with_gpt_and_dalle.models import ChatLogsWithLine  # noqa: E402
+from retrieval_qa_with_source.domain.repository.chatlog import (  # noqa: E402
+    ChatLogRepository as SourceChatLogRepository,
+)
+from retrieval_qa_with_source.domain.valueobject.page import (  # noqa: E402
+    ChatLogCursor as SourceChatLogCursor,
+)
+from retrieval_qa_with_source.models import ChatLogsWithSource  # noqa: E402
+
+INDEXES = [
+    "chatlog_line_user_created",
+    "chatlog_line_user_media",
+    "chatlog_src_user_thread",
+]
+INSERT_BATCH_SIZE = 100_000
+STARTED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def seed(rows: int, users: int) -> None:
+    User.objects.bulk_create(
+        [User(username=f"user{i}", password="!") for i in range(users)]
+    )
+    user_ids = list(User.objects.values_list("pk", flat=True))
+    with connection.cursor() as cursor:
+        # 使い捨てのDBなので、投入中の耐久性は捨てる
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, rows, INSERT_BATCH_SIZE):
+            line, source = [], []
+            for i in range(start, min(start + INSERT_BATCH_SIZE, rows)):
+                user_id = user_ids[i % users]
+                created_at = connection.ops.adapt_datetimefield_value(
+                    STARTED_AT + timedelta(seconds=i)
+                )
+                # 1% が画像、1% が音声の添付つき
+                file_path, media_type = None, None
+                if i % 100 == 0:
+                    file_path, media_type = f"/media/images/{i:010x}.jpg", "image"
+                elif i % 100 == 1:
+                    file_path, media_type = f"/media/audios/{i:010x}.mp3", "audio"
+                role = "user" if i % 2 else "assistant"
+                line.append(
+                    (
+                        user_id,
+                        role,
+                        f"message {i}",
+                        file_path,
+                        media_type,
+                        False,
+                        created_at,
+                    )
+                )
+                source.append(
+                    (user_id, f"thread{i % 7}", role, f"message {i}", created_at)
+                )
+            cursor.executemany(
+                f"INSERT INTO {ChatLogsWithLine._meta.db_table}"
+                " (user_id, role, content, file_path, media_type, invisible, created_at)"
+                " VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                line,
+            )
+            cursor.executemany(
+                f"INSERT INTO {ChatLogsWithSource._meta.db_table}"
+                " (user_id, thread, role, message, created_at)"
+                " VALUES (%s, %s, %s, %s, %s)",
+                source,
+            )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def measure(label: str, query, repeat: int) -> None:
+    query()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        query()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<36} {elapsed / repeat * 1000:>10.2f} ms/query")
+
+
+def run(user_id: int, page_size: int, repeat: int) -> None:
+    # 画面は新しいほうから表示するので、一番古いページが OFFSET でもっとも多くの行を読み飛ばす
+    line_rows = ChatLogsWithLine.objects.filter(user_id=user_id).order_by(
+        "-created_at", "-pk"
+    )
+    total = line_rows.count()
+    offset = max(total - page_size, 1)
+    boundary = line_rows[offset - 1]
+    line_cursor = LineChatLogCursor(created_at=boundary.created_at, pk=boundary.pk)
+    source_rows = ChatLogsWithSource.objects.filter(user_id=user_id).order_by(
+        "-thread", "-created_at", "-pk"
+    )
+    boundary = source_rows[offset - 1]
+    source_cursor = SourceChatLogCursor(
+        thread=boundary.thread, created_at=boundary.created_at, pk=boundary.pk
+    )
+
+    print(f"ChatLogsWithLine（ユーザあたり {total} 行）")
+    measure(
+        "最新のページ",
+        lambda: LineChatLogRepository.find_chatlog_page_by_user_id(
+            user_id, limit=page_size
+        ),
+        repeat,
+    )
+    measure(
+        "最古のページ OFFSET",
+        lambda: list(line_rows[offset : offset + page_size]),
+        repeat,
+    )
+    measure(
+        "最古のページ キーセット",
+        lambda: LineChatLogRepository.find_chatlog_page_by_user_id(
+            user_id, before=line_cursor, limit=page_size
+        ),
+        repeat,
+    )
+    measure(
+        "最新の音声 file_path__endswith",
+        lambda: ChatLogsWithLine.objects.filter(
+            user_id=user_id, role="user", file_path__endswith=".mp3", invisible=False
+        ).last(),
+        repeat,
+    )
+    user = User(pk=user_id)
+    measure(
+        "最新の音声 media_type",
+        lambda: OpenAISpeechToTextUseCase._latest_audio(user).last(),
+        repeat,
+    )
+
+    print("ChatLogsWithSource")
+    measure(
+        "最新のページ",
+        lambda: SourceChatLogRepository.find_chatlog_page_by_user_id(
+            user_id, limit=page_size
+        ),
+        repeat,
+    )
+    measure(
+        "最古のページ OFFSET",
+        lambda: list(source_rows[offset : offset + page_size]),
+        repeat,
+    )
+    measure(
+        "最古のページ キーセット",
+        lambda: SourceChatLogRepository.find_chatlog_page_by_user_id(
+            user_id, before=source_cursor, limit=page_size
+        ),
+        repeat,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    started = time.perf_counter()
+    seed(args.rows, args.users)
+    print(
+        f"{args.rows} 行 x 2テーブルを投入しました ({time.perf_counter() - started:.1f} s)"
+    )
+    user_id = User.objects.order_by("pk").values_list("pk", flat=True).first()
+
+    print("\n== 複合インデックスあり ==")
+    run(user_id, args.page_size, args.repeat)
+
+    with connection.cursor() as cursor:
+        for name in INDEXES:
+            cursor.execute(f"DROP INDEX {name}")
+    print("\n== 複合インデックスなし（外部キーのインデックスのみ） ==")
+    run(user_id, args.page_size, args.repeat)
+
+    connection.close()
+    shutil.rmtree(DB_PATH.parent)
@@ -0,0 +1,64 @@
+"""
+チャンク分割のスループット（ページ/秒）を計測する
+
+    python -m retrieval_qa_with_source.benchmarks.chunker [--repeat 20]
+
+比較対象は旧 Dataloader._shredder 相当の処理（TokenTextSplitter.split_text でチャンクごとに decode する）
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from langchain.text_splitter import TokenTextSplitter
+
+from config.settings import BASE_DIR
+from retrieval_qa_with_source.domain.valueobject.pdfdataloader import PdfDataloader
+
+PDF_DIRECTORY = Path(BASE_DIR) / "retrieval_qa_with_source/tests/domain/valueobject"
+
+
+def measure(label: str, pages: int, repeat: int, func) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        chunks = func()
+    elapsed = time.perf_counter() - started
+    pages_per_second = pages * repeat / elapsed
+    print(f"  {label:<18} {pages_per_second:>10.1f} pages/s  ({chunks} chunks)")
+    return pages_per_second
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for file_path in sorted(PDF_DIRECTORY.glob("*.pdf")):
+        dataloader = PdfDataloader(str(file_path), cache=None)
+        pages = dataloader.pages
+        splitter = TokenTextSplitter(
+            encoding_name=dataloader.encoding_name,
+            chunk_size=dataloader.chunk_size,
+            chunk_overlap=dataloader.chunk_overlap,
+        )
+        print(f"{file_path.name} ({len(pages)} pages)")
+        # 初回だけかかるトークン長テーブルの作成を計測から外す
+        list(dataloader._chunk(pages))
+        baseline = measure(
+            "TokenTextSplitter",
+            len(pages),
+            args.repeat,
+            lambda: sum(
+                1
+                for x in pages
+                for chunk in splitter.split_text(x.page_content)
+                if chunk.strip()
+            ),
+        )
+        current = measure(
+            "Dataloader._chunk",
+            len(pages),
+            args.repeat,
+            lambda: sum(1 for _ in dataloader._chunk(pages)),
+        )
+        print(f"  speedup            {current / baseline:>10.2f}x")
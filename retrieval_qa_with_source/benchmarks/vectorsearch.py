@@ -0,0 +1,110 @@
+"""
+ベクトル検索の再現率（recall@k）とレイテンシを計測する
+
+    python -m retrieval_qa_with_source.benchmarks.vectorsearch [--rows 50000] [--dim 1536]
+
+比較対象は現行の Chroma（HNSW, cosine）。正解は float32 の総当たりの上位k件
+埋め込みAPIは呼ばず、乱数のベクトルを直接入れる
+"""
+
+import argparse
+import time
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+
+from retrieval_qa_with_source.domain.repository.numpy_vectorstore import (
+    NumpyVectorStore,
+)
+from retrieval_qa_with_source.domain.service.embeddings import HashingEmbeddings
+
+# Chroma が1回の add で受け付ける件数の上限より小さくする
+CHROMA_BATCH_SIZE = 5000
+
+
+def recall(expected: list[list[int]], found: list[list[int]]) -> float:
+    return float(
+        np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)])
+    )
+
+
+def measure(label: str, queries: np.ndarray, expected, search) -> None:
+    started = time.perf_counter()
+    found = [search(query) for query in queries]
+    elapsed = time.perf_counter() - started
+    print(
+        f"  {label:<24} recall {recall(expected, found):.3f}"
+        f"  {elapsed / len(queries) * 1000:>8.2f} ms/query"
+    )
+
+
+def numpy_search(vectorstore: NumpyVectorStore, k: int):
+    return lambda query: [
+        int(doc.page_content)
+        for doc, _ in vectorstore.batch_similarity_search_by_vector([query], k)[0]
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--lists", type=int, default=256)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # 実際の埋め込みに近づけるため、いくつかの塊のまわりに散らばったベクトルにする
+    centers = rng.normal(size=(64, args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), args.rows)] + rng.normal(
+        size=(args.rows, args.dim)
+    ).astype(np.float32)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)] + 0.5 * (
+        rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    )
+    texts = [str(i) for i in range(args.rows)]
+    print(f"{args.rows} rows x {args.dim} dims, {args.queries} queries, k={args.k}")
+
+    brute_force = NumpyVectorStore(HashingEmbeddings())
+    brute_force.add_embeddings(texts, vectors, ids=texts)
+    expected = [numpy_search(brute_force, args.k)(query) for query in queries]
+
+    chroma = Chroma(
+        collection_name="benchmark",
+        embedding_function=HashingEmbeddings(),
+        collection_metadata={"hnsw:space": "cosine"},
+    )
+    started = time.perf_counter()
+    for start in range(0, args.rows, CHROMA_BATCH_SIZE):
+        chroma._collection.add(
+            ids=texts[start : start + CHROMA_BATCH_SIZE],
+            embeddings=vectors[start : start + CHROMA_BATCH_SIZE].tolist(),
+            documents=texts[start : start + CHROMA_BATCH_SIZE],
+        )
+    print(f"  chroma build             {time.perf_counter() - started:.1f} s")
+    measure(
+        "chroma",
+        queries,
+        expected,
+        lambda query: [
+            int(doc.page_content)
+            for doc in chroma.similarity_search_by_vector(query.tolist(), args.k)
+        ],
+    )
+    measure("numpy brute force", queries, expected, numpy_search(brute_force, args.k))
+
+    half = NumpyVectorStore(HashingEmbeddings(), dtype="float16")
+    half.add_embeddings(texts, vectors, ids=texts)
+    measure("numpy brute force fp16", queries, expected, numpy_search(half, args.k))
+
+    ivf = NumpyVectorStore(HashingEmbeddings(), n_lists=args.lists)
+    ivf.add_embeddings(texts, vectors, ids=texts)
+    started = time.perf_counter()
+    ivf.build_ivf()
+    print(f"  ivf build                {time.perf_counter() - started:.1f} s")
+    for n_probe in (4, 16, 64):
+        ivf.n_probe = n_probe
+        measure(
+            f"numpy ivf n_probe={n_probe}", queries, expected, numpy_search(ivf, args.k)
+        )
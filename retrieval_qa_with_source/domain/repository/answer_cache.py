@@ -0,0 +1,210 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from config.settings import (
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_SIMILARITY,
+)
+from retrieval_qa_with_source.domain.service.embeddings import create_embeddings
+
+
+class AnswerCache:
+    """
+    同じ（または言い回しが少し違うだけの）質問に、RetrievalQAWithSourcesChain を回さずに答える。
+
+    - 完全一致: 正規化した質問のハッシュで引く
+    - ほぼ同じ質問: 質問の埋め込みのコサイン類似度が similarity_threshold 以上なら同じ答えを返す
+    - インデックスのバージョン（index_version）が変わった答えは使わず、次の書き込みで消す
+    - source_documents も保存するので、キャッシュから返しても出典を表示できる
+
+    SQLite に置くので、複数プロセス（ワーカー）の間でも共有される
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        embeddings: Embeddings | None = None,
+        ttl_seconds: int = 24 * 60 * 60,
+        similarity_threshold: float = 0.95,
+    ):
+        """
+        Args:
+            path (Path): SQLiteのファイル。
+            embeddings (Embeddings | None): ほぼ同じ質問の判定に使う埋め込み。Noneなら完全一致だけ。
+            ttl_seconds (int): 答えの有効期限（秒）。0ならキャッシュしない。
+            similarity_threshold (float): ほぼ同じ質問とみなすコサイン類似度の下限。
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.embeddings = embeddings
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    index_name TEXT NOT NULL,
+                    question_hash TEXT NOT NULL,
+                    index_version TEXT NOT NULL,
+                    embedding BLOB,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (index_name, question_hash)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        sqlite3 の接続はスレッドをまたいで使えないので、スレッドごとに持つ
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """
+        全角・半角、大文字・小文字、空白、末尾の「？」「。」の違いは同じ質問とみなす
+        """
+        question = unicodedata.normalize("NFKC", question).lower()
+        question = re.sub(r"\s+", " ", question).strip()
+        return question.rstrip("?!.。 ")
+
+    @classmethod
+    def question_hash(cls, question: str) -> str:
+        return hashlib.sha256(cls.normalize(question).encode()).hexdigest()
+
+    def get(self, question: str, index_name: str, index_version: str) -> dict | None:
+        """
+        Returns:
+            dict | None: gpt_answer と同じ形の結果（answer, sources, source_documents）。なければNone
+        """
+        if self.ttl_seconds <= 0:
+            return None
+        expires_before = time.time() - self.ttl_seconds
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT result FROM answers WHERE index_name = ? AND question_hash = ?"
+            " AND index_version = ? AND created_at >= ?",
+            [index_name, self.question_hash(question), index_version, expires_before],
+        ).fetchone()
+        if row is None and self.embeddings is not None:
+            row = self._find_similar(
+                question, index_name, index_version, expires_before
+            )
+        if row is None:
+            return None
+
+        result = json.loads(row[0])
+        result["question"] = question
+        result["source_documents"] = [Document(**x) for x in result["source_documents"]]
+        return result
+
+    def _find_similar(
+        self, question: str, index_name: str, index_version: str, expires_before: float
+    ) -> tuple[str] | None:
+        """
+        答え（result）は大きいので、候補はキーと埋め込みだけ読み、一番近いものの答えだけを読む
+        """
+        connection = self._connection()
+        rows = connection.execute(
+            "SELECT question_hash, embedding FROM answers WHERE index_name = ?"
+            " AND index_version = ? AND created_at >= ? AND embedding IS NOT NULL",
+            [index_name, index_version, expires_before],
+        ).fetchall()
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(x[1], dtype=np.float32) for x in rows])
+        similarities = matrix @ self._embed(question)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        # 読むまでの間に消されていたら None
+        return connection.execute(
+            "SELECT result FROM answers WHERE index_name = ? AND question_hash = ?"
+            " AND index_version = ?",
+            [index_name, rows[best][0], index_version],
+        ).fetchone()
+
+    def put(self, question: str, index_name: str, index_version: str, result: dict):
+        """
+        答えを保存する。期限切れの答えと、同じインデックスの古いバージョンの答えはここで消す
+        """
+        if self.ttl_seconds <= 0:
+            return
+        serialized = json.dumps(
+            {
+                "answer": result["answer"],
+                "sources": result.get("sources", ""),
+                "source_documents": [
+                    {"page_content": x.page_content, "metadata": x.metadata}
+                    for x in result.get("source_documents", [])
+                ],
+            },
+            ensure_ascii=False,
+        )
+        embedding = (
+            self._embed(question).tobytes() if self.embeddings is not None else None
+        )
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM answers WHERE created_at < ?"
+                " OR (index_name = ? AND index_version != ?)",
+                [now - self.ttl_seconds, index_name, index_version],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO answers"
+                " (index_name, question_hash, index_version, embedding, result, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    index_name,
+                    self.question_hash(question),
+                    index_version,
+                    embedding,
+                    serialized,
+                    now,
+                ],
+            )
+
+    def invalidate(self, index_name: str):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM answers WHERE index_name = ?", [index_name])
+
+    def _embed(self, question: str) -> np.ndarray:
+        """
+        Note: 検索で使うのと同じ embed_query を呼ぶので、CachedEmbeddings なら検索側の埋め込みはキャッシュから返る
+        """
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+@lru_cache(maxsize=None)
+def create_answer_cache() -> AnswerCache:
+    """
+    プロセス内で共有する回答キャッシュ（ほぼ同じ質問の判定には検索と同じ埋め込みを使う）
+    """
+    return AnswerCache(
+        ANSWER_CACHE_PATH,
+        embeddings=create_embeddings(),
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    )
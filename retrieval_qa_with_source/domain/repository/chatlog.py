@@ -0,0 +1,39 @@
+from django.db.models import Q
+
+from config.settings import CHAT_LOG_PAGE_SIZE
+from retrieval_qa_with_source.domain.valueobject.page import (
+    ChatLogCursor,
+    ChatLogPage,
+)
+from retrieval_qa_with_source.models import ChatLogsWithSource
+
+
+class ChatLogRepository:
+    @staticmethod
+    def find_chatlog_page_by_user_id(
+        user_id: int,
+        before: ChatLogCursor | None = None,
+        limit: int = CHAT_LOG_PAGE_SIZE,
+    ) -> ChatLogPage:
+        """
+        (thread, created_at, id) の順で末尾から limit 件を読む（キーセットページング）
+        before を渡すとそれより前の行を読む。(user, thread, created_at, id) のインデックスを limit 件なめるだけで済む
+        """
+        queryset = ChatLogsWithSource.objects.filter(user_id=user_id)
+        if before is not None:
+            # 範囲の条件（thread <=）を別に書いておくと、OR があってもインデックスで位置を探せる
+            queryset = queryset.filter(thread__lte=before.thread).filter(
+                Q(thread__lt=before.thread)
+                | Q(created_at__lt=before.created_at)
+                | Q(created_at=before.created_at, pk__lt=before.pk)
+            )
+        # 1件多く読んで、さらに前の行があるかを判定する
+        rows = list(queryset.order_by("-thread", "-created_at", "-pk")[: limit + 1])
+        older = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            older = ChatLogCursor(
+                thread=rows[-1].thread, created_at=rows[-1].created_at, pk=rows[-1].pk
+            )
+
+        return ChatLogPage(rows=rows[::-1], older=older)
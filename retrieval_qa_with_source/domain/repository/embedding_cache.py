@@ -0,0 +1,195 @@
+import hashlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from retrieval_qa_with_source.domain.valueobject.cache import CacheStats
+
+
+class EmbeddingStore(ABC):
+    """
+    埋め込みベクトルの永続化先。キーは (モデル名, テキストのハッシュ)
+    """
+
+    @abstractmethod
+    def get_many(self, model: str, keys: List[str]) -> dict[str, np.ndarray]:
+        pass
+
+    @abstractmethod
+    def put_many(self, model: str, vectors: dict[str, np.ndarray]):
+        pass
+
+
+class SqliteEmbeddingStore(EmbeddingStore):
+    """
+    SQLiteにfloat32のバイト列として保存する。WALモードなので複数プロセスから読み書きできる
+    """
+
+    # SQLite の1文あたりの変数の上限より小さくする
+    _MAX_VARIABLES = 500
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        sqlite3 の接続はスレッドをまたいで使えないので、スレッドごとに持つ
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, model: str, keys: List[str]) -> dict[str, np.ndarray]:
+        found = {}
+        connection = self._connection()
+        for i in range(0, len(keys), self._MAX_VARIABLES):
+            part = keys[i : i + self._MAX_VARIABLES]
+            rows = connection.execute(
+                "SELECT text_hash, vector FROM embeddings"
+                f" WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                [model, *part],
+            )
+            for text_hash, vector in rows:
+                found[text_hash] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: dict[str, np.ndarray]):
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector)"
+                " VALUES (?, ?, ?)",
+                [
+                    (model, key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in vectors.items()
+                ],
+            )
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    埋め込みモデルの前段に置くキャッシュ。プロセス内のLRU -> EmbeddingStore -> 埋め込みAPI の順に探す。
+    同じテキストは、文書が違っても、リクエストやプロセスが違っても二度と埋め込まない。
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        store: EmbeddingStore | None = None,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        """
+        Args:
+            embeddings (Embeddings): 実際に埋め込みを計算するモデル。
+            store (EmbeddingStore | None): ディスク上のキャッシュ。Noneならプロセス内だけで持つ。
+            max_bytes (int): プロセス内LRUの上限（バイト）。
+        """
+        self.embeddings = embeddings
+        self.store = store
+        self.max_bytes = max_bytes
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def model(self) -> str:
+        return getattr(self.embeddings, "model", type(self.embeddings).__name__)
+
+    @staticmethod
+    def _key(text: str, kind: str) -> str:
+        """
+        Note: モデルによっては文書とクエリで埋め込み方が違うので、キーを分けておく
+        """
+        return hashlib.sha256(f"{kind}\0{text}".encode()).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(
+            [text], "query", lambda x: [self.embeddings.embed_query(x[0])]
+        )[0]
+
+    def _embed(self, texts: List[str], kind: str, embed) -> List[List[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        vectors = self._lookup(keys)
+
+        # 同じテキストが何度出てきても、埋め込みAPIには1回だけ送る
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        with self._lock:
+            self._hits += len(keys) - len(missing)
+            self._misses += len(missing)
+        if missing:
+            embedded = {
+                key: np.asarray(vector, dtype=np.float32)
+                for key, vector in zip(missing, embed(list(missing.values())))
+            }
+            if self.store is not None:
+                self.store.put_many(self.model, embedded)
+            self._remember(embedded)
+            vectors.update(embedded)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def _lookup(self, keys: List[str]) -> dict[str, np.ndarray]:
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+
+        not_in_memory = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if not_in_memory and self.store is not None:
+            stored = self.store.get_many(self.model, not_in_memory)
+            self._remember(stored)
+            vectors.update(stored)
+
+        return vectors
+
+    def _remember(self, vectors: dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                if key in self._memory:
+                    continue
+                self._memory[key] = vector
+                self._current_bytes += vector.nbytes
+            while self._current_bytes > self.max_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._current_bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._memory),
+                current_bytes=self._current_bytes,
+                max_bytes=self.max_bytes,
+            )
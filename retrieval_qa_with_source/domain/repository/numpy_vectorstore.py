@@ -0,0 +1,363 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    正規化した埋め込みを1枚の連続した行列（float32 / float16）で持つ、プロセス内のベクトル検索。
+    小〜中規模のコーパスなら Chroma への往復より、行列積1回の総当たりのほうが速い。
+
+    - 検索はクエリをまとめて行列積し、argpartition で上位k件を取る（行ブロックごとに計算するのでメモリは一定）
+    - n_lists > 0 のときは IVF（k-meansの粗い量子化）で n_probe 個のリストだけを探す
+    - 行列は .npy に保存し、読み込み時はメモリマップするのでプロセス起動が軽い
+
+    ファイル構成（persist_directory 配下）:
+        vectors.npy    正規化済みの埋め込み (n, dim)
+        documents.json ID・本文・メタデータ
+        ivf.npz        IVFのセントロイドと各行の所属リスト（n_lists > 0 のときだけ）
+    """
+
+    _VECTORS = "vectors.npy"
+    _DOCUMENTS = "documents.json"
+    _IVF = "ivf.npz"
+    # 一度に行列積する行数（float32, 1536次元で約400MB）
+    _BLOCK_ROWS = 65536
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        persist_directory: str | None = None,
+        dtype: str = "float32",
+        n_lists: int = 0,
+        n_probe: int = 8,
+    ):
+        """
+        Args:
+            embedding (Embeddings): 埋め込みモデル。
+            persist_directory (str | None): 保存先。Noneならメモリ上だけで持つ。
+            dtype (str): 行列の型。"float16" にするとメモリとディスクが半分になるが、検索のたびに float32 へ変換するぶん遅い。
+            n_lists (int): IVFのリスト数。0なら総当たり。
+            n_probe (int): IVFで検索時に探すリスト数。
+        """
+        self._embedding = embedding
+        self._persist_directory = Path(persist_directory) if persist_directory else None
+        self._dtype = np.dtype(dtype)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._positions: dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=self._dtype)
+        # 追加分はまとめて vstack する（バッチごとに行列全体をコピーしないため）
+        self._pending: list[np.ndarray] = []
+        self._centroids: np.ndarray | None = None
+        self._list_order: np.ndarray | None = None
+        self._list_offsets: np.ndarray | None = None
+        if (
+            self._persist_directory
+            and (self._persist_directory / self._VECTORS).exists()
+        ):
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _load(self):
+        with open(self._persist_directory / self._DOCUMENTS, encoding="utf-8") as f:
+            documents = json.load(f)
+        self._ids = documents["ids"]
+        self._texts = documents["texts"]
+        self._metadatas = documents["metadatas"]
+        self._positions = {x: i for i, x in enumerate(self._ids)}
+        self._vectors = np.load(self._persist_directory / self._VECTORS, mmap_mode="r")
+        ivf_path = self._persist_directory / self._IVF
+        if self.n_lists > 0 and ivf_path.exists():
+            with np.load(ivf_path) as ivf:
+                self._set_ivf(ivf["centroids"], ivf["assignments"])
+
+    def persist(self):
+        """
+        一時ファイルに書いてから置き換えるので、読み込み中の他プロセスが壊れたファイルを見ることはない
+        """
+        if self._persist_directory is None:
+            raise ValueError("persist_directory is not set")
+        self._persist_directory.mkdir(parents=True, exist_ok=True)
+        if self.n_lists > 0 and self._centroids is None and len(self) > 0:
+            self.build_ivf()
+
+        vectors_path = self._persist_directory / self._VECTORS
+        with open(f"{vectors_path}.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self._matrix()))
+        documents_path = self._persist_directory / self._DOCUMENTS
+        with open(f"{documents_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas},
+                f,
+                ensure_ascii=False,
+            )
+        if self._centroids is not None:
+            ivf_path = self._persist_directory / self._IVF
+            with open(f"{ivf_path}.tmp", "wb") as f:
+                np.savez(f, centroids=self._centroids, assignments=self._assignments())
+            os.replace(f"{ivf_path}.tmp", ivf_path)
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        os.replace(f"{documents_path}.tmp", documents_path)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(
+            texts, self._embedding.embed_documents(texts), metadatas, ids
+        )
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]] | np.ndarray,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """
+        埋め込み済みのベクトルを追加する。同じIDがあれば置き換える（upsert）
+        ids の中で同じIDが重なっていれば、最後のものを入れる
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [os.urandom(16).hex() for _ in texts]
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+
+        # 同じ呼び出しの中で同じIDが重なったら、後ろのものだけを使う
+        latest = {x: i for i, x in enumerate(ids)}
+        replaced = [
+            (i, self._positions[x]) for x, i in latest.items() if x in self._positions
+        ]
+        if replaced:
+            matrix = self._matrix()
+            if not matrix.flags.writeable:
+                # メモリマップは読み取り専用なので、書き換えるときだけ手元にコピーする
+                matrix = self._vectors = np.array(matrix)
+            for i, row in replaced:
+                matrix[row] = vectors[i]
+                self._texts[row] = texts[i]
+                self._metadatas[row] = metadatas[i]
+
+        appended = [i for x, i in latest.items() if x not in self._positions]
+        if appended:
+            self._pending.append(vectors[appended].astype(self._dtype))
+            for i in appended:
+                self._positions[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._texts.append(texts[i])
+                self._metadatas.append(metadatas[i])
+        self._invalidate_ivf()
+
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        removed = set(ids)
+        keep = np.array([x not in removed for x in self._ids], dtype=bool)
+        self._vectors = self._matrix()[keep]
+        self._ids = [x for x, k in zip(self._ids, keep) if k]
+        self._texts = [x for x, k in zip(self._texts, keep) if k]
+        self._metadatas = [x for x, k in zip(self._metadatas, keep) if k]
+        self._positions = {x: i for i, x in enumerate(self._ids)}
+        self._invalidate_ivf()
+        return True
+
+    def get(self) -> dict:
+        return {
+            "ids": self._ids,
+            "documents": self._texts,
+            "metadatas": self._metadatas,
+        }
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        vector = self._embedding.embed_query(query)
+        return self.batch_similarity_search_by_vector([vector], k)[0]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            doc for doc, _ in self.batch_similarity_search_by_vector([embedding], k)[0]
+        ]
+
+    def batch_similarity_search_by_vector(
+        self, embeddings: List[List[float]] | np.ndarray, k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        複数のクエリをまとめて検索する。スコアはコサイン類似度
+
+        Returns:
+            List[List[Tuple[Document, float]]]: クエリごとの (Document, スコア) の上位k件
+        """
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        if len(self) == 0:
+            return [[] for _ in queries]
+
+        if self._centroids is not None:
+            indices, scores = self._search_ivf(queries, k)
+        else:
+            indices, scores = self._top_k(self._scores(queries), k)
+
+        return [
+            [
+                (
+                    Document(
+                        page_content=self._texts[i], metadata=dict(self._metadatas[i])
+                    ),
+                    float(score),
+                )
+                for i, score in zip(row_indices, row_scores)
+                if i >= 0
+            ]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def _matrix(self) -> np.ndarray:
+        if self._pending:
+            if self._vectors.size == 0:
+                self._vectors = np.vstack(self._pending)
+            else:
+                self._vectors = np.vstack([self._vectors, *self._pending])
+            self._pending = []
+        return self._vectors
+
+    def _scores(
+        self, queries: np.ndarray, rows: np.ndarray | None = None
+    ) -> np.ndarray:
+        """
+        (クエリ数, 行数) の類似度。行ブロックごとに float32 で計算する
+        """
+        matrix = self._matrix()
+        if rows is not None:
+            return queries @ np.asarray(matrix[rows], dtype=np.float32).T
+
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), self._BLOCK_ROWS):
+            block = np.asarray(
+                matrix[start : start + self._BLOCK_ROWS], dtype=np.float32
+            )
+            scores[:, start : start + len(block)] = queries @ block.T
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        各行の上位k件の列番号とスコア（スコアの降順）。全体をソートせず argpartition で絞る
+        """
+        k = min(k, scores.shape[1])
+        partitioned = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        partitioned_scores = np.take_along_axis(scores, partitioned, axis=1)
+        order = np.argsort(-partitioned_scores, axis=1)
+        return (
+            np.take_along_axis(partitioned, order, axis=1),
+            np.take_along_axis(partitioned_scores, order, axis=1),
+        )
+
+    def build_ivf(self, iterations: int = 10, seed: int = 0):
+        """
+        k-means でセントロイドを求め、各行を最も近いリストに振り分ける
+        """
+        n_lists = min(self.n_lists, len(self))
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(self._matrix(), dtype=np.float32)
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = vectors[assignments == i]
+                if len(members) > 0:
+                    centroids[i] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+        self._set_ivf(centroids, np.argmax(vectors @ centroids.T, axis=1))
+
+    def _set_ivf(self, centroids: np.ndarray, assignments: np.ndarray):
+        self._centroids = centroids.astype(np.float32)
+        self._list_order = np.argsort(assignments, kind="stable")
+        self._list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assignments, minlength=len(centroids))))
+        )
+
+    def _assignments(self) -> np.ndarray:
+        assignments = np.empty(len(self), dtype=np.int32)
+        for i in range(len(self._centroids)):
+            members = self._list_order[
+                self._list_offsets[i] : self._list_offsets[i + 1]
+            ]
+            assignments[members] = i
+        return assignments
+
+    def _invalidate_ivf(self):
+        self._centroids = None
+        self._list_order = None
+        self._list_offsets = None
+
+    def _search_ivf(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        n_probe = min(self.n_probe, len(self._centroids))
+        probes, _ = self._top_k(queries @ self._centroids.T, n_probe)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            candidates = np.concatenate(
+                [
+                    self._list_order[self._list_offsets[i] : self._list_offsets[i + 1]]
+                    for i in lists
+                ]
+            )
+            if len(candidates) == 0:
+                continue
+            top, top_scores = self._top_k(
+                self._scores(queries[q : q + 1], candidates), k
+            )
+            indices[q, : top.shape[1]] = candidates[top[0]]
+            scores[q, : top.shape[1]] = top_scores[0]
+        return indices, scores
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # コサイン類似度 [-1, 1] を [0, 1] に
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        ids = kwargs.pop("ids", None)
+        vectorstore = cls(embedding, **kwargs)
+        vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+        return vectorstore
@@ -0,0 +1,281 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.io import DatasetReader
+from rasterio.windows import Window
+
+from retrieval_qa_with_source.domain.valueobject.cache import CacheStats
+
+
+@dataclass
+class RasterHandle:
+    """
+    開いたままの GeoTIFF と、毎回計算しなくてよいアフィン変換
+
+    Attributes:
+        key (tuple[str, int]): ファイルの実パスと更新時刻（ns）。ファイルが書き換えられたら別のハンドルになる。
+        dataset (DatasetReader): 開いたデータセット。
+        transform (Affine): ピクセル座標 -> 地理座標。
+        inverse (Affine): 地理座標 -> ピクセル座標。
+        lock (threading.Lock): GDAL のデータセットはスレッドセーフではないので、読むときはこれを取る。
+    """
+
+    key: tuple[str, int]
+    dataset: DatasetReader
+    transform: Affine
+    inverse: Affine
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def index(self, longitude: float, latitude: float) -> tuple[int, int]:
+        """
+        DatasetReader.index と同じく、地理座標を含むピクセルの (row, col) を返す
+        """
+        col, row = self.inverse * (longitude, latitude)
+        return math.floor(row), math.floor(col)
+
+    def index_many(
+        self, longitudes: np.ndarray, latitudes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        index の配列版。逆変換を配列のまま1回で計算する
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (rows, cols)。int64 の配列。
+        """
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        inverse = self.inverse
+        cols = inverse.a * longitudes + inverse.b * latitudes + inverse.c
+        rows = inverse.d * longitudes + inverse.e * latitudes + inverse.f
+        return np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+
+    def read(
+        self,
+        band_index: int,
+        window: Window | None = None,
+        out_shape: tuple[int, int] | None = None,
+        resampling: Resampling = Resampling.nearest,
+    ) -> np.ndarray:
+        """
+        out_shape が元より小さければ、GDAL はそれを満たすオーバービューのうち最も粗いものから読む
+        """
+        with self.lock:
+            return self.dataset.read(
+                band_index, window=window, out_shape=out_shape, resampling=resampling
+            )
+
+
+class RasterDatasetCache:
+    """
+    開いた GeoTIFF を LRU で持つ。ファイルを開くと GDAL がヘッダとタイルの索引を読むので、問い合わせのたびに開かない
+    ファイルが書き換えられたら（更新時刻が変わったら）開き直す
+
+    追い出したハンドルはキャッシュから外すだけで閉じない（ほかのスレッドがまだ使っているかもしれない）。
+    DatasetReader は最後の参照がなくなったときに閉じられるので、開いたままになるのは使っている間だけ
+    """
+
+    def __init__(self, max_datasets: int = 8):
+        """
+        Args:
+            max_datasets (int): 開いたままにしておくファイルの数の上限。
+        """
+        self.max_datasets = max_datasets
+        self._handles: OrderedDict[str, RasterHandle] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_path: str) -> RasterHandle:
+        path = os.path.realpath(file_path)
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            handle = self._handles.get(path)
+            if handle is not None and handle.key == key:
+                self._handles.move_to_end(path)
+                return handle
+
+        dataset = rasterio.open(path)
+        handle = RasterHandle(
+            key=key,
+            dataset=dataset,
+            transform=dataset.transform,
+            inverse=~dataset.transform,
+        )
+        with self._lock:
+            self._handles[path] = handle
+            self._handles.move_to_end(path)
+            while len(self._handles) > self.max_datasets:
+                self._handles.popitem(last=False)
+
+        return handle
+
+    def invalidate(self, file_path: str):
+        """
+        ハンドルをキャッシュから外す。次の get で開き直す
+        外部のオーバービュー（.ovr）を作ってもファイルの更新時刻は変わらないので、そのときに呼ぶ
+        """
+        with self._lock:
+            self._handles.pop(os.path.realpath(file_path), None)
+
+    def close(self):
+        """
+        持っているハンドルをすべて閉じる（使い終わったとき用。閉じたハンドルは読めなくなる）
+        """
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            self._close(handle)
+
+    @staticmethod
+    def _close(handle: RasterHandle):
+        # ほかのスレッドが読んでいる途中なら、読み終わるのを待ってから閉じる
+        with handle.lock:
+            handle.dataset.close()
+
+
+class RasterTileCache:
+    """
+    GeoTIFF の内部ブロック（タイル）単位で読んだ配列を LRU で持つ（上限はバイト数）
+    同じあたりを何度も切り出すとき、ディスクから読むのは重なっていないタイルだけで済む
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): 持っておくタイルの合計の上限（バイト）。
+        """
+        self.max_bytes = max_bytes
+        self._tiles: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def read(self, handle: RasterHandle, band_index: int, window: Window) -> np.ndarray:
+        """
+        window の範囲を、タイルを継ぎ合わせて返す
+        DatasetReader.read と同じく、ファイルからはみ出た部分は切り捨てる
+
+        Args:
+            handle (RasterHandle): 読むファイル。
+            band_index (int): バンドのインデックス（1始まり）。
+            window (Window): 読む範囲。
+
+        Returns:
+            np.ndarray: (height, width) の配列。
+        """
+        dataset = handle.dataset
+        window = self._clip(window, dataset.width, dataset.height)
+        row_off, col_off = int(window.row_off), int(window.col_off)
+        height, width = int(window.height), int(window.width)
+        out = np.empty((height, width), dtype=dataset.dtypes[band_index - 1])
+        if height == 0 or width == 0:
+            return out
+
+        block_height, block_width = dataset.block_shapes[band_index - 1]
+        for block_row in range(
+            row_off // block_height, (row_off + height - 1) // block_height + 1
+        ):
+            for block_col in range(
+                col_off // block_width, (col_off + width - 1) // block_width + 1
+            ):
+                tile = self.tile(handle, band_index, block_row, block_col)
+                top, left = block_row * block_height, block_col * block_width
+                # タイルのうち window に入る部分だけを写す
+                r0, r1 = max(row_off, top), min(row_off + height, top + tile.shape[0])
+                c0, c1 = max(col_off, left), min(col_off + width, left + tile.shape[1])
+                out[r0 - row_off : r1 - row_off, c0 - col_off : c1 - col_off] = tile[
+                    r0 - top : r1 - top, c0 - left : c1 - left
+                ]
+
+        return out
+
+    def sample(
+        self, handle: RasterHandle, band_index: int, rows: np.ndarray, cols: np.ndarray
+    ) -> np.ndarray:
+        """
+        ピクセル (rows[i], cols[i]) の値をまとめて読む。点をタイルごとにまとめるので、各タイルは1回だけ読む
+
+        Args:
+            handle (RasterHandle): 読むファイル。
+            band_index (int): バンドのインデックス（1始まり）。
+            rows (np.ndarray): 行のインデックス。すべて画像の範囲内であること。
+            cols (np.ndarray): 列のインデックス。すべて画像の範囲内であること。
+
+        Returns:
+            np.ndarray: rows と同じ長さの値の配列。
+        """
+        dataset = handle.dataset
+        values = np.empty(len(rows), dtype=dataset.dtypes[band_index - 1])
+        if len(rows) == 0:
+            return values
+
+        block_height, block_width = dataset.block_shapes[band_index - 1]
+        block_rows, block_cols = rows // block_height, cols // block_width
+        block_ids = block_rows * (-(-dataset.width // block_width)) + block_cols
+        order = np.argsort(block_ids, kind="stable")
+        _, starts = np.unique(block_ids[order], return_index=True)
+        for start, stop in zip(starts, np.append(starts[1:], len(order))):
+            points = order[start:stop]
+            block_row = int(block_rows[points[0]])
+            block_col = int(block_cols[points[0]])
+            tile = self.tile(handle, band_index, block_row, block_col)
+            values[points] = tile[
+                rows[points] - block_row * block_height,
+                cols[points] - block_col * block_width,
+            ]
+
+        return values
+
+    def tile(
+        self, handle: RasterHandle, band_index: int, block_row: int, block_col: int
+    ) -> np.ndarray:
+        key = (handle.key, band_index, block_row, block_col)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self._hits += 1
+                return tile
+            self._misses += 1
+
+        tile = handle.read(
+            band_index,
+            window=handle.dataset.block_window(band_index, block_row, block_col),
+        )
+        with self._lock:
+            if key not in self._tiles:
+                self._tiles[key] = tile
+                self._current_bytes += tile.nbytes
+            while self._current_bytes > self.max_bytes and self._tiles:
+                _, evicted = self._tiles.popitem(last=False)
+                self._current_bytes -= evicted.nbytes
+                self._evictions += 1
+
+        return tile
+
+    @staticmethod
+    def _clip(window: Window, width: int, height: int) -> Window:
+        row_start = min(max(int(window.row_off), 0), height)
+        col_start = min(max(int(window.col_off), 0), width)
+        row_stop = min(max(int(window.row_off + window.height), row_start), height)
+        col_stop = min(max(int(window.col_off + window.width), col_start), width)
+        return Window.from_slices((row_start, row_stop), (col_start, col_stop))
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._tiles),
+                current_bytes=self._current_bytes,
+                max_bytes=self.max_bytes,
+            )
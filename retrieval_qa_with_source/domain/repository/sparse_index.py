@@ -0,0 +1,241 @@
+import json
+import math
+import os
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """
+    日本語は分かち書きしないので、空白で区切った各かたまりを文字n-gramにする（1文字だけのかたまりはそのまま）
+    全角・半角や大文字・小文字の違いは NFKC と小文字化で吸収する
+    """
+    terms = []
+    for run in unicodedata.normalize("NFKC", text).lower().split():
+        if len(run) < n:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + n] for i in range(len(run) - n + 1))
+    return terms
+
+
+class SparseIndexBuilder:
+    """
+    チャンクを1件ずつ受け取り、転置インデックスを組み立てる
+    （ベクトルインデックスの取り込みと同じ1回の走査の中で使う）
+    """
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self._vocabulary: dict[str, int] = {}
+        self._term_ids = array("i")
+        self._doc_ids = array("i")
+        self._term_freqs = array("i")
+        self._doc_lengths = array("i")
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+
+    def add(self, document: Document):
+        doc_id = len(self._texts)
+        terms = char_ngrams(document.page_content, self.n)
+        for term, freq in Counter(terms).items():
+            self._term_ids.append(
+                self._vocabulary.setdefault(term, len(self._vocabulary))
+            )
+            self._doc_ids.append(doc_id)
+            self._term_freqs.append(freq)
+        self._doc_lengths.append(len(terms))
+        self._texts.append(document.page_content)
+        self._metadatas.append(document.metadata)
+
+    def build(self) -> "SparseIndex":
+        term_ids = np.frombuffer(self._term_ids, dtype=np.int32)
+        # 語ごとにポスティングが連続するよう並べ替える（CSR形式）
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(term_ids, minlength=len(self._vocabulary))))
+        )
+        return SparseIndex(
+            terms=list(self._vocabulary),
+            offsets=offsets.astype(np.int64),
+            doc_ids=np.frombuffer(self._doc_ids, dtype=np.int32)[order],
+            term_freqs=np.frombuffer(self._term_freqs, dtype=np.int32)[order].astype(
+                np.uint16
+            ),
+            doc_lengths=np.frombuffer(self._doc_lengths, dtype=np.int32).copy(),
+            texts=self._texts,
+            metadatas=self._metadatas,
+            n=self.n,
+        )
+
+
+class SparseIndex:
+    """
+    文字n-gramの転置インデックスによる BM25 検索。埋め込みを使わないのでクエリごとのAPI呼び出しはない
+
+    語 t のポスティングは doc_ids[offsets[t]:offsets[t+1]] と term_freqs[同じ範囲]
+    ファイル構成（ベクトルインデックスと同じディレクトリ）:
+        sparse_index.npz       語彙・ポスティング・文書長
+        sparse_documents.json  本文・メタデータ
+    """
+
+    ARRAYS = "sparse_index.npz"
+    DOCUMENTS = "sparse_documents.json"
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        term_freqs: np.ndarray,
+        doc_lengths: np.ndarray,
+        texts: List[str],
+        metadatas: List[dict],
+        n: int = 2,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.texts = texts
+        self.metadatas = metadatas
+        self.n = n
+        self.k1 = k1
+        self.b = b
+        self._vocabulary = {term: i for i, term in enumerate(terms)}
+        # 文書長による正規化の項はクエリによらないので先に計算しておく
+        average_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self._length_norms = (
+            k1 * (1 - b + b * doc_lengths / average_length)
+            if average_length > 0
+            else np.full(len(doc_lengths), k1)
+        ).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """
+        Returns:
+            List[Tuple[Document, float]]: BM25スコアの降順に上位k件（スコアが0の文書は返さない）
+        """
+        scores = self.scores(query)
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (
+                Document(page_content=self.texts[i], metadata=dict(self.metadatas[i])),
+                float(scores[i]),
+            )
+            for i in top
+        ]
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        全文書のBM25スコア。ヒットしたポスティングだけを集めて bincount で足し上げる
+        """
+        query_terms = Counter(
+            self._vocabulary[x]
+            for x in char_ngrams(query, self.n)
+            if x in self._vocabulary
+        )
+        if not query_terms:
+            return np.zeros(len(self), dtype=np.float32)
+
+        doc_ids, weights = [], []
+        for term_id, query_freq in query_terms.items():
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            postings = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            idf = math.log(
+                1 + (len(self) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            doc_ids.append(postings)
+            weights.append(
+                query_freq
+                * idf
+                * freqs
+                * (self.k1 + 1)
+                / (freqs + self._length_norms[postings])
+            )
+        return np.bincount(
+            np.concatenate(doc_ids),
+            weights=np.concatenate(weights),
+            minlength=len(self),
+        ).astype(np.float32)
+
+    def as_retriever(self, k: int = 4) -> "SparseRetriever":
+        return SparseRetriever(index=self, k=k)
+
+    @classmethod
+    def load(cls, directory: Path) -> "SparseIndex | None":
+        directory = Path(directory)
+        if not (directory / cls.ARRAYS).exists():
+            return None
+        with open(directory / cls.DOCUMENTS, encoding="utf-8") as f:
+            documents = json.load(f)
+        with np.load(directory / cls.ARRAYS) as arrays:
+            return cls(
+                terms=arrays["terms"].tolist(),
+                offsets=arrays["offsets"],
+                doc_ids=arrays["doc_ids"],
+                term_freqs=arrays["term_freqs"],
+                doc_lengths=arrays["doc_lengths"],
+                texts=documents["texts"],
+                metadatas=documents["metadatas"],
+                n=int(arrays["n"]),
+            )
+
+    def save(self, directory: Path):
+        """
+        一時ファイルに書いてから置き換える（本文を先に置き、配列の置き換えを最後にする）
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        documents_path = directory / self.DOCUMENTS
+        with open(f"{documents_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {"texts": self.texts, "metadatas": self.metadatas},
+                f,
+                ensure_ascii=False,
+            )
+        arrays_path = directory / self.ARRAYS
+        with open(f"{arrays_path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                terms=np.array(self.terms, dtype=str),
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_lengths=self.doc_lengths,
+                n=self.n,
+            )
+        os.replace(f"{documents_path}.tmp", documents_path)
+        os.replace(f"{arrays_path}.tmp", arrays_path)
+
+
+class SparseRetriever(BaseRetriever):
+    index: SparseIndex
+    k: int = 4
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [doc for doc, _ in self.index.search(query, self.k)]
@@ -0,0 +1,315 @@
+import hashlib
+import shutil
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+from filelock import FileLock
+from langchain.schema import Document
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from config.settings import (
+    VECTORSTORE_ROOT,
+    VECTORSTORE_BACKEND,
+    VECTORSTORE_IVF_LISTS,
+    VECTORSTORE_IVF_PROBES,
+)
+from retrieval_qa_with_source.domain.repository.numpy_vectorstore import (
+    NumpyVectorStore,
+)
+from retrieval_qa_with_source.domain.repository.sparse_index import (
+    SparseIndex,
+    SparseIndexBuilder,
+)
+from retrieval_qa_with_source.domain.service.embeddings import create_embeddings
+from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
+from retrieval_qa_with_source.domain.valueobject.indexmanifest import (
+    IndexManifest,
+    IndexSyncResult,
+)
+
+
+class VectorStoreRepository:
+    """
+    ベクトルインデックスをディスクに永続化し、チャンク単位の差分で更新する。
+    Dataloader.fingerprint がマニフェストと一致する限り、PDFの解析も埋め込みも行わない。
+
+    取り込みと同じ走査で、キーワード検索用の文字n-gramの転置インデックス（SparseIndex）も作る。
+    ベクトル検索の実装は backend で選ぶ（"chroma" または プロセス内で総当たり/IVF検索する "numpy"）
+
+    ディレクトリ構成:
+        VECTORSTORE_ROOT / <backend> / <埋め込みモデル名> / <Dataloader.index_name> /
+    """
+
+    BACKENDS = ("chroma", "numpy")
+
+    # プロセス内でのインスタンス再利用（persist_directory -> (fingerprint, VectorStore, SparseIndex)）
+    _loaded: dict[str, tuple[str, VectorStore, SparseIndex]] = {}
+    _loaded_lock = threading.Lock()
+    # read_only で読み込んだときのマニフェストの更新時刻（persist_directory -> st_mtime_ns）
+    _loaded_manifest_mtimes: dict[str, int] = {}
+
+    def __init__(
+        self,
+        root: Path = VECTORSTORE_ROOT,
+        embeddings: Embeddings | None = None,
+        batch_size: int = 256,
+        max_batch_chars: int = 200_000,
+        backend: str = VECTORSTORE_BACKEND,
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            root (Path): インデックスを置くディレクトリ。
+            embeddings (Embeddings | None): 埋め込みモデル。Noneならキャッシュつきの共有モデル。
+            batch_size (int): 1回の埋め込みリクエストに載せるチャンク数の上限。
+            max_batch_chars (int): 1回の埋め込みリクエストに載せる文字数の上限。
+            backend (str): ベクトル検索の実装。"chroma" または "numpy"。
+            read_only (bool): Trueならデータソースとの差分を取り込まず、ディスクにあるインデックスをそのまま読む。
+                取り込みは manage.py ingest_corpus で行う（Webのリクエストの中でPDFの解析や埋め込みをしない）
+        """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"unknown vectorstore backend: {backend}")
+        self.backend = backend
+        self.root = Path(root)
+        self.embeddings = embeddings or create_embeddings()
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.read_only = read_only
+
+    @property
+    def embedding_model(self) -> str:
+        return getattr(self.embeddings, "model", type(self.embeddings).__name__)
+
+    def persist_directory(self, dataloader: Dataloader) -> Path:
+        return self.root / self.backend / self.embedding_model / dataloader.index_name
+
+    def index_version(self, dataloader: Dataloader) -> str:
+        """
+        インデックスの中身が変わると変わる値（回答キャッシュの無効化に使う）
+        read_only なら、データソースではなく取り込んだ時点の fingerprint から決める
+        """
+        fingerprint = (
+            self._get_loaded(dataloader)[0]
+            if self.read_only
+            else dataloader.fingerprint
+        )
+        return hashlib.sha256(
+            f"{self.backend}:{self.embedding_model}:{fingerprint}".encode()
+        ).hexdigest()
+
+    def get_or_create(self, dataloader: Dataloader) -> VectorStore:
+        """
+        インデックスが最新ならそのまま読み込み、古ければ差分を取り込んでから返す。
+        read_only なら差分は取り込まず、ディスクにあるインデックスを返す。
+
+        Args:
+            dataloader (Dataloader): インデックス化するデータソース
+
+        Returns:
+            VectorStore: ベクトルストア
+        """
+        return self._get_loaded(dataloader)[1]
+
+    def get_sparse_index(self, dataloader: Dataloader) -> SparseIndex:
+        """
+        get_or_create と同じインデックスに対応する、BM25用の転置インデックスを返す。
+
+        Args:
+            dataloader (Dataloader): インデックス化するデータソース
+
+        Returns:
+            SparseIndex: 文字n-gramの転置インデックス
+        """
+        return self._get_loaded(dataloader)[2]
+
+    def _get_loaded(
+        self, dataloader: Dataloader
+    ) -> tuple[str, VectorStore, SparseIndex]:
+        if self.read_only:
+            return self._get_persisted(dataloader)
+
+        key = str(self.persist_directory(dataloader))
+        with self._loaded_lock:
+            loaded = self._loaded.get(key)
+        if loaded is not None and loaded[0] == dataloader.fingerprint:
+            return loaded
+
+        self.sync(dataloader)
+        with self._loaded_lock:
+            return self._loaded[key]
+
+    def _get_persisted(
+        self, dataloader: Dataloader
+    ) -> tuple[str, VectorStore, SparseIndex]:
+        """
+        取り込み済みのインデックスを読む。マニフェストは取り込みの最後に書くので、あれば取り込みは終わっている。
+        マニフェストの更新時刻が変わる（ingest_corpus で取り込み直す）までは、読み込んだものを使い回す
+
+        Raises:
+            FileNotFoundError: まだ取り込んでいないとき
+        """
+        persist_directory = self.persist_directory(dataloader)
+        key = str(persist_directory)
+        manifest_path = persist_directory / IndexManifest.FILENAME
+        if not manifest_path.exists():
+            raise FileNotFoundError(
+                f"index not found: {persist_directory} (run manage.py ingest_corpus)"
+            )
+        mtime = manifest_path.stat().st_mtime_ns
+        with self._loaded_lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None and self._loaded_manifest_mtimes.get(key) == mtime:
+                return loaded
+
+        manifest = IndexManifest.load(persist_directory)
+        sparse_index = SparseIndex.load(persist_directory)
+        if sparse_index is None:
+            raise FileNotFoundError(
+                f"sparse index not found: {persist_directory} (run manage.py ingest_corpus)"
+            )
+        loaded = (manifest.fingerprint, self._open(persist_directory), sparse_index)
+        with self._loaded_lock:
+            self._loaded[key] = loaded
+            self._loaded_manifest_mtimes[key] = mtime
+
+        return loaded
+
+    def sync(self, dataloader: Dataloader) -> IndexSyncResult:
+        """
+        マニフェストと現在のチャンクの差分を取り、増えたチャンクだけ埋め込み、消えたチャンクを削除する。
+        ファイルロックで直列化するので、複数プロセスから同時に呼ばれても二重に埋め込まない。
+
+        Args:
+            dataloader (Dataloader): インデックス化するデータソース
+
+        Returns:
+            IndexSyncResult: 追加・削除・再利用したチャンク数
+        """
+        persist_directory = self.persist_directory(dataloader)
+        persist_directory.parent.mkdir(parents=True, exist_ok=True)
+        with FileLock(f"{persist_directory}.lock"):
+            manifest = IndexManifest.load(persist_directory)
+            if manifest is None and persist_directory.exists():
+                # マニフェストがない＝初回の取り込み中に落ちたので作り直す
+                shutil.rmtree(persist_directory)
+            vectorstore = self._open(persist_directory)
+
+            if manifest is not None and manifest.fingerprint == dataloader.fingerprint:
+                result = IndexSyncResult(
+                    added=0, removed=0, unchanged=len(manifest.chunk_ids)
+                )
+                sparse_index = SparseIndex.load(persist_directory)
+                if sparse_index is None:
+                    # 転置インデックスがない古いインデックス。埋め込みは不要なのでチャンクを走査して作るだけ
+                    sparse_index = self._build_sparse_index(dataloader)
+                    sparse_index.save(persist_directory)
+            else:
+                sparse_builder = SparseIndexBuilder()
+                result, chunk_ids = self._apply_diff(
+                    vectorstore, dataloader, manifest, sparse_builder
+                )
+                if isinstance(vectorstore, NumpyVectorStore):
+                    # マニフェストより先に書く（途中で落ちても次回は差分の取り込みからやり直せる）
+                    vectorstore.persist()
+                sparse_index = sparse_builder.build()
+                sparse_index.save(persist_directory)
+                IndexManifest(
+                    fingerprint=dataloader.fingerprint, chunk_ids=chunk_ids
+                ).save(persist_directory)
+
+        with self._loaded_lock:
+            self._loaded[str(persist_directory)] = (
+                dataloader.fingerprint,
+                vectorstore,
+                sparse_index,
+            )
+
+        return result
+
+    def _open(self, persist_directory: Path) -> VectorStore:
+        if self.backend == "numpy":
+            return NumpyVectorStore(
+                self.embeddings,
+                persist_directory=str(persist_directory),
+                n_lists=VECTORSTORE_IVF_LISTS,
+                n_probe=VECTORSTORE_IVF_PROBES,
+            )
+        return Chroma(
+            persist_directory=str(persist_directory),
+            embedding_function=self.embeddings,
+        )
+
+    def _apply_diff(
+        self,
+        vectorstore: VectorStore,
+        dataloader: Dataloader,
+        manifest: IndexManifest | None,
+        sparse_builder: SparseIndexBuilder,
+    ) -> tuple[IndexSyncResult, list[str]]:
+        """
+        チャンクを1回だけ走査しながら、マニフェストにないものをバッチで埋め込む。
+        転置インデックスは埋め込みと違って作り直しても安いので、すべてのチャンクを sparse_builder に渡す。
+        手元に残すのはチャンクIDだけなので、dataloader.data がイテレータならメモリは一定で済む
+
+        Note: add_documents はIDによる upsert なので、途中で落ちた取り込みをやり直しても重複しない
+        """
+        known_ids = set(manifest.chunk_ids) if manifest else set()
+        # 同じ内容のチャンクが複数あっても1つにまとめる（順序を保つため dict を使う）
+        seen_ids: dict[str, None] = {}
+
+        def new_documents() -> Iterator[Document]:
+            for document in dataloader.data:
+                chunk_id = IndexManifest.chunk_id(document)
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids[chunk_id] = None
+                sparse_builder.add(document)
+                if chunk_id not in known_ids:
+                    yield document
+
+        added = 0
+        for batch in self._batched(new_documents()):
+            vectorstore.add_documents(
+                batch, ids=[IndexManifest.chunk_id(x) for x in batch]
+            )
+            added += len(batch)
+
+        removed_ids = list(known_ids - seen_ids.keys())
+        if removed_ids:
+            vectorstore.delete(ids=removed_ids)
+
+        result = IndexSyncResult(
+            added=added, removed=len(removed_ids), unchanged=len(seen_ids) - added
+        )
+        return result, list(seen_ids)
+
+    @staticmethod
+    def _build_sparse_index(dataloader: Dataloader) -> SparseIndex:
+        sparse_builder = SparseIndexBuilder()
+        seen_ids = set()
+        for document in dataloader.data:
+            chunk_id = IndexManifest.chunk_id(document)
+            if chunk_id not in seen_ids:
+                seen_ids.add(chunk_id)
+                sparse_builder.add(document)
+        return sparse_builder.build()
+
+    def _batched(self, documents: Iterable[Document]) -> Iterator[List[Document]]:
+        """
+        チャンク数と文字数の両方で上限を切ったバッチに分ける
+        """
+        batch, chars = [], 0
+        for document in documents:
+            length = len(document.page_content)
+            if batch and (
+                len(batch) >= self.batch_size or chars + length > self.max_batch_chars
+            ):
+                yield batch
+                batch, chars = [], 0
+            batch.append(document)
+            chars += length
+        if batch:
+            yield batch
@@ -0,0 +1,63 @@
+import hashlib
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from config.settings import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_BYTES,
+)
+from retrieval_qa_with_source.domain.repository.embedding_cache import (
+    CachedEmbeddings,
+    SqliteEmbeddingStore,
+)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    APIを呼ばないローカルの埋め込み（テストやオフライン確認用）
+    文字bi-gramをハッシュして固定次元に畳み込み、L2正規化する。同じテキストなら必ず同じベクトルになる
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.model = f"local-hashing-{size}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for i in range(max(len(text) - 1, 1)):
+            digest = hashlib.blake2b(text[i : i + 2].encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.size] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+
+@lru_cache(maxsize=None)
+def create_embeddings() -> CachedEmbeddings:
+    """
+    検索系のすべての経路で共有する埋め込みモデル（プロセス内で1つ）
+    EMBEDDING_MODEL が "local-hashing" で始まるときは HashingEmbeddings を使う
+
+    Note: OpenAIEmbeddings runs on "text-embedding-ada-002" by default
+    """
+    if EMBEDDING_MODEL.startswith("local-hashing"):
+        embeddings = HashingEmbeddings()
+    else:
+        embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+    return CachedEmbeddings(
+        embeddings,
+        store=SqliteEmbeddingStore(EMBEDDING_CACHE_PATH),
+        max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+    )
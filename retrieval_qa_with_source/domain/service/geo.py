@@ -1,20 +1,56 @@
-import matplotlib.pyplot as plt
+import math
+from pathlib import Path
+
 import numpy as np
 import rasterio
-from matplotlib.patches import Rectangle
+from rasterio.enums import Resampling
 from rasterio.windows import Window
 
+from retrieval_qa_with_source.domain.repository.raster import (
+    RasterDatasetCache,
+    RasterTileCache,
+)
+from retrieval_qa_with_source.domain.service.render import ImageRenderService
 from retrieval_qa_with_source.domain.valueobject.geo import (
     MetaData,
     GoogleMapCoords,
     RectangleCoords,
     Point,
+    PointSamples,
 )
 
 
+# build_overviews で作る一番粗いオーバービューの、長辺のピクセル数の目安
+OVERVIEW_MIN_SIZE = 256
+
+
 class GeoService:
-    @staticmethod
-    def read_metadata(file_path: str) -> MetaData:
+    """
+    開いたファイル・アフィン変換・読んだタイルをインスタンスで持つ
+    同じファイルに何度も問い合わせるときは、1つのインスタンスを使い回す（使い終わったら close する）
+    """
+
+    def __init__(
+        self, max_datasets: int = 8, tile_cache_bytes: int = 256 * 1024 * 1024
+    ):
+        """
+        Args:
+            max_datasets (int): 開いたままにしておくファイルの数の上限。
+            tile_cache_bytes (int): 切り出しのために持っておくタイルの合計の上限（バイト）。
+        """
+        self.datasets = RasterDatasetCache(max_datasets)
+        self.tiles = RasterTileCache(tile_cache_bytes)
+
+    def close(self):
+        self.datasets.close()
+
+    def __enter__(self) -> "GeoService":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def read_metadata(self, file_path: str) -> MetaData:
         """
         指定したGeoTIFFファイルを読み込み、メタデータをMetaDataオブジェクトに変換する。
 
@@ -24,21 +60,19 @@ class GeoService:
         Returns:
             MetaData: メタデータを格納したオブジェクト。
         """
-        with rasterio.open(file_path) as dataset:
-            meta = dataset.meta
-            return MetaData(
-                driver=meta["driver"],
-                dtype=meta["dtype"],
-                nodata=meta["nodata"],
-                width=meta["width"],
-                height=meta["height"],
-                count=meta["count"],
-                crs=meta["crs"],
-                transform=meta["transform"],
-            )
+        meta = self.datasets.get(file_path).dataset.meta
+        return MetaData(
+            driver=meta["driver"],
+            dtype=meta["dtype"],
+            nodata=meta["nodata"],
+            width=meta["width"],
+            height=meta["height"],
+            count=meta["count"],
+            crs=meta["crs"],
+            transform=meta["transform"],
+        )
 
-    @staticmethod
-    def get_center_coordinates(file_path: str) -> GoogleMapCoords:
+    def get_center_coordinates(self, file_path: str) -> GoogleMapCoords:
         """
         指定したGeoTIFFファイルの中央ピクセルの緯度経度を取得する。
 
@@ -48,23 +82,20 @@ class GeoService:
         Returns:
             tuple[float, float]: 中央ピクセルの緯度と経度。
         """
-        with rasterio.open(file_path) as dataset:
-            width, height = dataset.width, dataset.height
-            transform = dataset.transform
+        handle = self.datasets.get(file_path)
 
-            # 中央ピクセルの行列インデックス
-            center_x = width // 2
-            center_y = height // 2
+        # 中央ピクセルの行列インデックス
+        center_x = handle.dataset.width // 2
+        center_y = handle.dataset.height // 2
 
-            # ピクセル座標を地理座標に変換
-            lon, lat = rasterio.transform.xy(
-                transform, center_y, center_x, offset="center"
-            )
-            return GoogleMapCoords(latitude=lat, longitude=lon)
+        # ピクセル座標を地理座標に変換
+        lon, lat = rasterio.transform.xy(
+            handle.transform, center_y, center_x, offset="center"
+        )
+        return GoogleMapCoords(latitude=lat, longitude=lon)
 
-    @staticmethod
     def get_pixel_coordinates_from_geo(
-        file_path: str, coords: GoogleMapCoords
+        self, file_path: str, coords: GoogleMapCoords
     ) -> tuple[int, int]:
         """
         緯度経度からピクセル座標に変換する。
@@ -76,17 +107,34 @@ class GeoService:
         Returns:
             tuple[int, int]: ピクセル座標 (x, y)。
         """
-        with rasterio.open(file_path) as dataset:
-            transform = dataset.transform
+        # 緯度経度をピクセル座標に変換（逆変換は開いたときに計算してある）
+        col, row = self.datasets.get(file_path).inverse * (
+            coords.longitude,
+            coords.latitude,
+        )
 
-            # 緯度経度をピクセル座標に変換
-            col, row = ~transform * (coords.longitude, coords.latitude)  # 逆変換
+        return int(col), int(row)
 
-            return int(col), int(row)
+    def get_pixel_coordinates_from_geo_batch(
+        self, file_path: str, latitudes: np.ndarray, longitudes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        get_pixel_coordinates_from_geo の配列版。逆変換を配列のまま1回で計算する。
+        get_value_by_coords と同じく、ピクセル座標は切り捨て（floor）で求める。
+
+        Args:
+            file_path (str): GeoTIFFファイルのパス。
+            latitudes (np.ndarray): 緯度の配列。
+            longitudes (np.ndarray): 経度の配列。
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: ピクセル座標 (x, y) の配列。範囲外の点もそのまま返す。
+        """
+        rows, cols = self.datasets.get(file_path).index_many(longitudes, latitudes)
+        return cols, rows
 
-    @staticmethod
     def get_pixel_coordinates(
-        file_path: str, pixel_x: int, pixel_y: int
+        self, file_path: str, pixel_x: int, pixel_y: int
     ) -> GoogleMapCoords:
         """
         指定したピクセルの座標（緯度経度）を取得する。
@@ -99,17 +147,13 @@ class GeoService:
         Returns:
             tuple[float, float]: 指定したピクセル位置の緯度経度。
         """
-        with rasterio.open(file_path) as dataset:
-            transform = dataset.transform
-
-            # ピクセル座標を地理座標に変換
-            lon, lat = rasterio.transform.xy(
-                transform, pixel_y, pixel_x, offset="center"
-            )
-            return GoogleMapCoords(latitude=lat, longitude=lon)
+        # ピクセル座標を地理座標に変換
+        lon, lat = rasterio.transform.xy(
+            self.datasets.get(file_path).transform, pixel_y, pixel_x, offset="center"
+        )
+        return GoogleMapCoords(latitude=lat, longitude=lon)
 
-    @staticmethod
-    def read_band_as_array(file_path: str, band_index: int = 1) -> np.ndarray:
+    def read_band_as_array(self, file_path: str, band_index: int = 1) -> np.ndarray:
         """
         GeoTIFF ファイルの指定されたバンドを numpy 配列として読み込む。
 
@@ -120,28 +164,158 @@ class GeoService:
         Returns:
             np.ndarray: 指定バンドのデータ。
         """
-        with rasterio.open(file_path) as dataset:
-            return dataset.read(band_index)
+        return self.datasets.get(file_path).read(band_index)
+
+    def build_overviews(
+        self,
+        file_path: str,
+        factors: list[int] | None = None,
+        resampling: str = "average",
+        external: bool = False,
+    ) -> list[int]:
+        """
+        GeoTIFF の縮小版（オーバービュー）を作る。一度作っておけば、read_preview などは縮小版から読む。
+
+        Args:
+            file_path (str): GeoTIFFファイルのパス。
+            factors (list[int] | None): 縮小率。Noneなら 2, 4, 8, ... を長辺が OVERVIEW_MIN_SIZE 以下になるまで。
+            resampling (str): 縮小の方法（rasterio.enums.Resampling の名前。例: "average", "nearest"）。
+            external (bool): Trueなら元のファイルを書き換えず、横に .ovr ファイルとして作る。
+
+        Returns:
+            list[int]: 作った縮小率。
+        """
+        if factors is None:
+            dataset = self.datasets.get(file_path).dataset
+            factors = self._overview_factors(dataset.width, dataset.height)
+        # 作ったオーバービューは開き直さないと見えないので、キャッシュのハンドルは外しておく
+        self.datasets.invalidate(file_path)
+        with rasterio.Env(TIFF_USE_OVR=external):
+            with rasterio.open(file_path, "r+") as dataset:
+                dataset.build_overviews(factors, Resampling[resampling])
+
+        return factors
+
+    def get_overview_factors(self, file_path: str, band_index: int = 1) -> list[int]:
+        """
+        作ってあるオーバービューの縮小率（なければ空のリスト）
+        """
+        return self.datasets.get(file_path).dataset.overviews(band_index)
 
     @staticmethod
-    def get_value_by_coords(file_path: str, coords: GoogleMapCoords) -> float:
+    def _overview_factors(width: int, height: int) -> list[int]:
+        factors, factor = [], 2
+        while math.ceil(max(width, height) / (factor // 2)) > OVERVIEW_MIN_SIZE:
+            factors.append(factor)
+            factor *= 2
+        return factors
+
+    def read_preview(
+        self, file_path: str, max_size: int = 1024, band_index: int = 1
+    ) -> np.ndarray:
+        """
+        バンド全体を、長辺が max_size ピクセル以下になるように縮小して読み込む。
+        オーバービューがあれば、その大きさを満たす最も粗いものから読むので、元の解像度のバンドは読まない。
+
+        Args:
+            file_path (str): GeoTIFFファイルのパス。
+            max_size (int): 長辺のピクセル数の上限。元の画像のほうが小さければ元の大きさのまま。
+            band_index (int): 読み込むバンドのインデックス（デフォルトは1）。
+
+        Returns:
+            np.ndarray: 縮小したバンドのデータ。
+        """
+        handle = self.datasets.get(file_path)
+        return handle.read(
+            band_index,
+            out_shape=self._preview_shape(
+                handle.dataset.width, handle.dataset.height, max_size
+            ),
+        )
+
+    @staticmethod
+    def _preview_shape(width: int, height: int, max_size: int) -> tuple[int, int]:
+        scale = min(1.0, max_size / max(width, height))
+        return max(1, round(height * scale)), max(1, round(width * scale))
+
+    def get_value_by_coords(
+        self, file_path: str, coords: GoogleMapCoords, band_index: int = 1
+    ) -> float:
         """
         緯度経度を指定してピンポイントの値を取得する。
+        バンド全体ではなく、その1ピクセルだけを読む。
 
         Args:
             file_path (str): GeoTIFFファイルのパス。
             coords (GoogleMapCoords): 緯度経度。
+            band_index (int): 読み込むバンドのインデックス（デフォルトは1）。
+
+        Raises:
+            IndexError: 緯度経度が画像の範囲外のとき。
 
         Returns:
             float: 指定した位置の値。
         """
-        with rasterio.open(file_path) as dataset:
-            py, px = dataset.index(coords.longitude, coords.latitude)
-            return dataset.read(1)[py, px]
+        handle = self.datasets.get(file_path)
+        py, px = handle.index(coords.longitude, coords.latitude)
+        if not (0 <= py < handle.dataset.height and 0 <= px < handle.dataset.width):
+            raise IndexError(f"{coords.to_str()} is outside of {file_path}")
+        return handle.read(band_index, window=Window(px, py, 1, 1))[0, 0]
+
+    def get_values_by_coords_batch(
+        self,
+        file_path: str,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        band_index: int = 1,
+    ) -> PointSamples:
+        """
+        get_value_by_coords の配列版。点を内部タイルごとにまとめて読むので、各タイルは1回だけ読む。
+        範囲外の点と nodata の点は例外にせず、マスクで返す。
+
+        Args:
+            file_path (str): GeoTIFFファイルのパス。
+            latitudes (np.ndarray): 緯度の配列。
+            longitudes (np.ndarray): 経度の配列。
+            band_index (int): 読み込むバンドのインデックス（デフォルトは1）。
+
+        Returns:
+            PointSamples: 値・ピクセル座標・マスク。
+        """
+        handle = self.datasets.get(file_path)
+        rows, cols = handle.index_many(longitudes, latitudes)
+        outside = (
+            (rows < 0)
+            | (rows >= handle.dataset.height)
+            | (cols < 0)
+            | (cols >= handle.dataset.width)
+        )
+
+        values = np.zeros(len(rows), dtype=handle.dataset.dtypes[band_index - 1])
+        inside = np.flatnonzero(~outside)
+        values[inside] = self.tiles.sample(
+            handle, band_index, rows[inside], cols[inside]
+        )
+
+        nodata = np.zeros(len(rows), dtype=bool)
+        nodata_value = handle.dataset.nodatavals[band_index - 1]
+        if nodata_value is not None:
+            nodata[inside] = (
+                np.isnan(values[inside])
+                if np.isnan(nodata_value)
+                else values[inside] == nodata_value
+            )
+
+        return PointSamples(
+            values=values, rows=rows, cols=cols, outside=outside, nodata=nodata
+        )
 
-    @staticmethod
     def crop_by_bbox(
-        file_path: str, min_coords: GoogleMapCoords, max_coords: GoogleMapCoords
+        self,
+        file_path: str,
+        min_coords: GoogleMapCoords,
+        max_coords: GoogleMapCoords,
+        band_index: int = 1,
     ) -> np.ndarray:
         """
         指定した緯度経度範囲のデータを切り取る。
@@ -150,17 +324,40 @@ class GeoService:
             file_path (str): GeoTIFFファイルのパス。
             min_coords (GoogleMapCoords): 左下の緯度経度。
             max_coords (GoogleMapCoords): 右上の緯度経度。
+            band_index (int): 読み込むバンドのインデックス（デフォルトは1）。
 
         Returns:
             np.ndarray: 指定範囲のデータ。
         """
-        with rasterio.open(file_path) as src:
-            py, px = src.index(min_coords.longitude, min_coords.latitude)
-            py2, px2 = src.index(max_coords.longitude, max_coords.latitude)
+        handle = self.datasets.get(file_path)
+        py, px = handle.index(min_coords.longitude, min_coords.latitude)
+        py2, px2 = handle.index(max_coords.longitude, max_coords.latitude)
 
-            # 左上 (y: py2), 右下 (y: py) のピクセル範囲を指定
-            window = Window.from_slices((py2, py + 1), (px, px2 + 1))
-            return src.read(1, window=window)
+        # 左上 (y: py2), 右下 (y: py) のピクセル範囲を指定。重なるタイルはキャッシュから読む
+        window = Window.from_slices((py2, py + 1), (px, px2 + 1))
+        return self.tiles.read(handle, band_index, window)
+
+    @staticmethod
+    def render_bbox(
+        image_data: np.ndarray,
+        rectangle_coords: RectangleCoords,
+        image_format: str = "PNG",
+    ) -> bytes:
+        """
+        画像データをリスケールして赤枠を描き、画像ファイルのバイト列にする（ファイルには保存しない）
+
+        Args:
+            image_data (np.ndarray): 元の画像データ
+            rectangle_coords (RectangleCoords): 赤枠を描く矩形の座標範囲
+            image_format (str): "PNG" または "JPEG"
+
+        Returns:
+            bytes: 画像ファイルの中身
+        """
+        image = ImageRenderService.draw_rectangle(
+            ImageRenderService.rescale(image_data), rectangle_coords
+        )
+        return ImageRenderService.encode(image, image_format)
 
     @staticmethod
     def draw_bbox_on_cropped_image(
@@ -174,29 +371,82 @@ class GeoService:
         Args:
             full_image_data (np.ndarray): 元の全体画像データ
             rectangle_coords (RectangleCoords): 赤枠を描く矩形の座標範囲
-            output_path (str): 保存先の画像パス
-        """
-        fig, ax = plt.subplots(figsize=(10, 10))
-        ax.imshow(full_image_data, cmap="gray")  # グレースケール画像の表示
-
-        # 赤枠を描画する
-        rect = Rectangle(
-            (rectangle_coords.min_point.x, rectangle_coords.min_point.y),  # 左下の座標
-            rectangle_coords.width,  # 幅
-            rectangle_coords.height,  # 高さ
-            linewidth=2,
-            edgecolor="red",
-            facecolor="none",
+            output_path (str): 保存先の画像パス（拡張子が .jpg / .jpeg なら JPEG）
+        """
+        Path(output_path).write_bytes(
+            GeoService.render_bbox(
+                full_image_data, rectangle_coords, GeoService._image_format(output_path)
+            )
         )
-        ax.add_patch(rect)
+        print(f"Image with bounding box saved to: {output_path}")
+
+    def render_preview(
+        self,
+        file_path: str,
+        rectangle_coords: RectangleCoords | None = None,
+        max_size: int = 1024,
+        image_format: str = "PNG",
+    ) -> bytes:
+        """
+        全体画像の縮小版（read_preview）を画像ファイルのバイト列にする。rectangle_coords があれば赤枠を描く
+
+        Args:
+            file_path (str): GeoTIFFファイルのパス
+            rectangle_coords (RectangleCoords | None): 赤枠を描く矩形の座標範囲（元の画像のピクセル座標）
+            max_size (int): 縮小版の長辺のピクセル数の上限
+            image_format (str): "PNG" または "JPEG"
 
-        # 軸を非表示
-        ax.axis("off")
+        Returns:
+            bytes: 画像ファイルの中身
+        """
+        dataset = self.datasets.get(file_path).dataset
+        preview = self.read_preview(file_path, max_size=max_size)
+        if rectangle_coords is None:
+            return ImageRenderService.encode(
+                ImageRenderService.rescale(preview), image_format
+            )
+
+        scale_y = preview.shape[0] / dataset.height
+        scale_x = preview.shape[1] / dataset.width
+        return self.render_bbox(
+            preview,
+            RectangleCoords(
+                min_point=Point(
+                    round(rectangle_coords.min_point.x * scale_x),
+                    round(rectangle_coords.min_point.y * scale_y),
+                ),
+                max_point=Point(
+                    round(rectangle_coords.max_point.x * scale_x),
+                    round(rectangle_coords.max_point.y * scale_y),
+                ),
+            ),
+            image_format,
+        )
 
-        # 画像を保存
-        plt.savefig(output_path, bbox_inches="tight", pad_inches=0)
-        plt.close()
+    def draw_bbox_on_preview(
+        self,
+        file_path: str,
+        rectangle_coords: RectangleCoords,
+        output_path: str,
+        max_size: int = 1024,
+    ):
+        """
+        全体画像の縮小版（read_preview）に赤枠を描画し、保存する関数
 
+        Args:
+            file_path (str): GeoTIFFファイルのパス
+            rectangle_coords (RectangleCoords): 赤枠を描く矩形の座標範囲（元の画像のピクセル座標）
+            output_path (str): 保存先の画像パス（拡張子が .jpg / .jpeg なら JPEG）
+            max_size (int): 縮小版の長辺のピクセル数の上限
+        """
+        Path(output_path).write_bytes(
+            self.render_preview(
+                file_path,
+                rectangle_coords,
+                max_size=max_size,
+                image_format=self._image_format(output_path),
+            )
+        )
         print(f"Image with bounding box saved to: {output_path}")
 
     @staticmethod
@@ -220,28 +470,43 @@ class GeoService:
         return forest_pixels / total_pixels if total_pixels > 0 else 0
 
     @staticmethod
-    def rescale_cropped_data_and_save(cropped_data: np.ndarray, output_path: str):
+    def render_rescaled(cropped_data: np.ndarray, image_format: str = "PNG") -> bytes:
         """
-        切り取ったデータをリスケールし、保存する。
+        切り取ったデータをリスケールし、画像ファイルのバイト列にする（ファイルには保存しない）
 
         Args:
             cropped_data (np.ndarray): 切り取った画像データ。
-            output_path (str): 保存先の画像パス。
+            image_format (str): "PNG" または "JPEG"。
+
+        Returns:
+            bytes: 画像ファイルの中身。
         """
+        return ImageRenderService.encode(
+            ImageRenderService.rescale(cropped_data), image_format
+        )
 
-        def rescale_data(data: np.ndarray) -> np.ndarray:
-            data_min, data_max = np.percentile(data, [2, 98])
-            rescaled = (data - data_min) / (data_max - data_min) * 255
-            rescaled = np.clip(rescaled, 0, 255)
-            return rescaled.astype(np.uint8)
+    @staticmethod
+    def rescale_cropped_data_and_save(cropped_data: np.ndarray, output_path: str):
+        """
+        切り取ったデータをリスケールし、保存する。
 
-        rescaled_data = rescale_data(cropped_data)
-        plt.imshow(rescaled_data, cmap="gray")
-        plt.axis("off")
-        plt.savefig(output_path, bbox_inches="tight", pad_inches=0)
-        plt.close()
+        Args:
+            cropped_data (np.ndarray): 切り取った画像データ。
+            output_path (str): 保存先の画像パス（拡張子が .jpg / .jpeg なら JPEG）。
+        """
+        Path(output_path).write_bytes(
+            GeoService.render_rescaled(
+                cropped_data, GeoService._image_format(output_path)
+            )
+        )
         print(f"Rescaled cropped image saved to: {output_path}")
 
+    @staticmethod
+    def _image_format(output_path: str) -> str:
+        return (
+            "JPEG" if Path(output_path).suffix.lower() in (".jpg", ".jpeg") else "PNG"
+        )
+
 
 # サンプル利用
 if __name__ == "__main__":
@@ -310,10 +575,12 @@ if __name__ == "__main__":
         target_file_path, location_coords[location][1]
     )
 
-    # 全体写真に赤枠を描画して保存
+    # 全体写真に赤枠を描画して保存（縮小版から読むので、オーバービューがなければ先に作っておく）
+    if not geo_service.get_overview_factors(target_file_path):
+        geo_service.build_overviews(target_file_path, external=True)
     output_image_path = "image_with_bbox_full.png"
-    geo_service.draw_bbox_on_cropped_image(
-        full_image_data=geo_service.read_band_as_array(target_file_path),
+    geo_service.draw_bbox_on_preview(
+        file_path=target_file_path,
         rectangle_coords=RectangleCoords(
             min_point=Point(*min_pixel_coords),  # 左下（西南）
             max_point=Point(*max_pixel_coords),  # 右上（北東）
@@ -1,3 +1,4 @@
+import hashlib
 from typing import List
 
 from langchain.chains.qa_with_sources.retrieval import RetrievalQAWithSourcesChain
@@ -6,18 +7,43 @@ from langchain.prompts import (
     HumanMessagePromptTemplate,
     ChatPromptTemplate,
 )
-from langchain_community.vectorstores import Chroma
 from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
 
+from retrieval_qa_with_source.domain.repository.answer_cache import (
+    AnswerCache,
+    create_answer_cache,
+)
+from retrieval_qa_with_source.domain.repository.vectorstore import (
+    VectorStoreRepository,
+)
+from retrieval_qa_with_source.domain.service.retriever import create_hybrid_retriever
 from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
 
 
 class GptPdfService:
-    def __init__(self, dataloader: Dataloader, n_results: int = 3):
+    def __init__(
+        self,
+        dataloader: Dataloader,
+        n_results: int = 4,
+        vectorstore_repository: VectorStoreRepository | None = None,
+        hybrid: bool = True,
+        answer_cache: AnswerCache | None = None,
+    ):
+        """
+        Args:
+            dataloader (Dataloader): 検索対象のデータソース
+            n_results (int): プロンプトに載せるチャンク数（as_retriever の既定値と同じ4件）
+            vectorstore_repository (VectorStoreRepository | None): インデックスの置き場所
+            hybrid (bool): ベクトル検索にBM25（文字n-gram）を合わせる。Falseならベクトル検索だけ
+            answer_cache (AnswerCache | None): 回答キャッシュ。Noneならプロセス内で共有するもの
+        """
         self.dataloader = dataloader
+        self.vectorstore_repository = vectorstore_repository or VectorStoreRepository()
+        self.hybrid = hybrid
+        self.answer_cache = answer_cache or create_answer_cache()
 
         self.n_results = n_results
+        self.model_name = "gpt-3.5-turbo"
         self.system_template = """
             以下の資料の注意点を念頭に置いて回答してください
             ・ユーザの質問に対して、できる限り根拠を示してください
@@ -33,35 +59,53 @@ class GptPdfService:
         ]
         self.prompt_template = ChatPromptTemplate.from_messages(messages)
 
-    @staticmethod
-    def _create_vectorstore(dataloader: Dataloader) -> Chroma:
-        """
-        Note: OpenAIEmbeddings runs on "text-embedding-ada-002"
-        """
-        embeddings = OpenAIEmbeddings()
-        vectorstore = Chroma.from_documents(
-            dataloader.data, embedding=embeddings, persist_directory="."
-        )
-        vectorstore.persist()
-
-        return vectorstore
-
     def gpt_answer(self, user_text: str, chat_history: List[str]) -> dict:
         """
         Note: ChatOpenAI runs on 'gpt-3.5-turbo'
+        Note: インデックスは PDF とチャンク設定が変わらない限り使い回す（OpenAIEmbeddings runs on "text-embedding-ada-002"）
+        Note: 同じ（またはほぼ同じ）質問には、インデックスが変わっていなければキャッシュした答えを返す
         """
-        embeddings = OpenAIEmbeddings()
-        llm = ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo")
-        texts = [x.page_content for x in self.dataloader.data]
-        metadatas = [x.metadata for x in self.dataloader.data]
-        docsearch = Chroma.from_texts(texts, embeddings, metadatas)
+        cache_key = str(self.vectorstore_repository.persist_directory(self.dataloader))
+        cache_version = self._answer_version()
+        cached = self.answer_cache.get(user_text, cache_key, cache_version)
+        if cached is not None:
+            return cached
+
+        llm = ChatOpenAI(temperature=0, model_name=self.model_name)
+        docsearch = self.vectorstore_repository.get_or_create(self.dataloader)
+        if self.hybrid:
+            # 白書は固有名詞や数値の一致が効くので、キーワード検索の順位も混ぜる（埋め込みはクエリ1回分のまま）
+            retriever = create_hybrid_retriever(
+                docsearch,
+                self.vectorstore_repository.get_sparse_index(self.dataloader),
+                k=self.n_results,
+            )
+        else:
+            retriever = docsearch.as_retriever(search_kwargs={"k": self.n_results})
         chain = RetrievalQAWithSourcesChain.from_chain_type(
             llm=llm,
             chain_type="stuff",
             reduce_k_below_max_tokens=True,
             return_source_documents=True,
-            retriever=docsearch.as_retriever(),
+            retriever=retriever,
             chain_type_kwargs={"prompt": self.prompt_template},
         )
 
-        return chain({"question": user_text})
+        result = chain({"question": user_text})
+        self.answer_cache.put(user_text, cache_key, cache_version, result)
+
+        return result
+
+    def _answer_version(self) -> str:
+        """
+        答えを変えうるもの（インデックスの中身・検索の設定・モデル・プロンプト）から決まる値
+        """
+        return hashlib.sha256(
+            "\0".join(
+                [
+                    self.vectorstore_repository.index_version(self.dataloader),
+                    f"{self.hybrid}:{self.n_results}:{self.model_name}",
+                    self.system_template,
+                ]
+            ).encode()
+        ).hexdigest()
@@ -0,0 +1,103 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+from retrieval_qa_with_source.domain.valueobject.geo import RectangleCoords
+
+
+class ImageRenderService:
+    """
+    バンドの配列を PNG / JPEG のバイト列にする（matplotlib の figure を使わない）
+    numpy と Pillow だけで描くので、Web のリクエストから同時に呼んでもよい
+    """
+
+    # パーセンタイルを計算するときに使うピクセル数の上限。これより大きい配列は間引いて計算する
+    MAX_PERCENTILE_SAMPLES = 1_000_000
+
+    @classmethod
+    def rescale(
+        cls, data: np.ndarray, percentiles: tuple[float, float] = (2, 98)
+    ) -> np.ndarray:
+        """
+        percentiles の範囲を 0〜255 に伸ばして uint8 にする。範囲の外は 0 / 255 に切り詰める。
+
+        Args:
+            data (np.ndarray): バンドのデータ。
+            percentiles (tuple[float, float]): 黒・白にするパーセンタイル。
+
+        Returns:
+            np.ndarray: data と同じ形の uint8 の配列。
+        """
+        sample = data
+        if data.size > cls.MAX_PERCENTILE_SAMPLES:
+            # 大きい配列は等間隔に間引いても、パーセンタイルはほとんど変わらない
+            step = math.ceil(math.sqrt(data.size / cls.MAX_PERCENTILE_SAMPLES))
+            sample = data[::step, ::step]
+        low, high = np.percentile(sample, percentiles)
+
+        # 元の配列が大きくても、作る float の配列は1つだけにする
+        rescaled = np.subtract(data, low, dtype=np.float32)
+        rescaled *= 255 / (high - low) if high > low else 0
+        np.clip(rescaled, 0, 255, out=rescaled)
+        return rescaled.astype(np.uint8)
+
+    @staticmethod
+    def draw_rectangle(
+        image: np.ndarray,
+        rectangle_coords: RectangleCoords,
+        color: tuple[int, int, int] = (255, 0, 0),
+        line_width: int = 2,
+    ) -> np.ndarray:
+        """
+        グレースケールの画像を RGB にして、矩形の枠を描く。画像からはみ出た部分は描かない。
+
+        Args:
+            image (np.ndarray): (height, width) の uint8 の配列。
+            rectangle_coords (RectangleCoords): 枠を描く矩形のピクセル座標。
+            color (tuple[int, int, int]): 枠の色。
+            line_width (int): 枠の太さ（ピクセル）。
+
+        Returns:
+            np.ndarray: (height, width, 3) の uint8 の配列。
+        """
+        rgb = np.repeat(image[:, :, np.newaxis], 3, axis=2)
+        height, width = image.shape
+        (x0, y0), (x1, y1) = rectangle_coords.to_tuple()
+        left, right = sorted((x0, x1))
+        top, bottom = sorted((y0, y1))
+
+        def fill(row_start, row_stop, col_start, col_stop):
+            row_start, row_stop = max(row_start, 0), min(row_stop, height)
+            col_start, col_stop = max(col_start, 0), min(col_stop, width)
+            if row_start < row_stop and col_start < col_stop:
+                rgb[row_start:row_stop, col_start:col_stop] = color
+
+        # 線は矩形の辺を中心に描く（matplotlib の Rectangle と同じ）
+        half = line_width // 2
+        fill(top - half, top - half + line_width, left - half, right + half + 1)
+        fill(bottom - half, bottom - half + line_width, left - half, right + half + 1)
+        fill(top - half, bottom + half + 1, left - half, left - half + line_width)
+        fill(top - half, bottom + half + 1, right - half, right - half + line_width)
+        return rgb
+
+    @staticmethod
+    def encode(
+        image: np.ndarray, image_format: str = "PNG", quality: int = 90
+    ) -> bytes:
+        """
+        uint8 の配列（グレースケールまたは RGB）を画像ファイルのバイト列にする。
+
+        Args:
+            image (np.ndarray): (height, width) または (height, width, 3) の uint8 の配列。
+            image_format (str): "PNG" または "JPEG"。
+            quality (int): JPEG の画質。
+
+        Returns:
+            bytes: 画像ファイルの中身。
+        """
+        buffer = io.BytesIO()
+        options = {"quality": quality} if image_format.upper() == "JPEG" else {}
+        Image.fromarray(image).save(buffer, format=image_format, **options)
+        return buffer.getvalue()
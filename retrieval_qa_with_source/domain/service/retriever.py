@@ -0,0 +1,65 @@
+from typing import List
+
+from langchain.retrievers import EnsembleRetriever
+from langchain.schema import Document
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.runnables import RunnableConfig
+from langchain_core.vectorstores import VectorStore
+
+from retrieval_qa_with_source.domain.repository.sparse_index import SparseIndex
+
+
+class HybridRetriever(EnsembleRetriever):
+    """
+    ベクトル検索とBM25の結果を Reciprocal Rank Fusion でまとめ、上位k件だけを返す
+    （EnsembleRetriever は両方の和集合をすべて返すので、プロンプトが膨らまないよう切り詰める）
+    """
+
+    k: int = 4
+
+    def rank_fusion(
+        self,
+        query: str,
+        run_manager: CallbackManagerForRetrieverRun,
+        *,
+        config: RunnableConfig | None = None,
+    ) -> List[Document]:
+        return super().rank_fusion(query, run_manager, config=config)[: self.k]
+
+    async def arank_fusion(
+        self,
+        query: str,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        *,
+        config: RunnableConfig | None = None,
+    ) -> List[Document]:
+        documents = await super().arank_fusion(query, run_manager, config=config)
+        return documents[: self.k]
+
+
+def create_hybrid_retriever(
+    vectorstore: VectorStore,
+    sparse_index: SparseIndex,
+    k: int = 4,
+    candidates: int = 20,
+    sparse_weight: float = 0.5,
+) -> HybridRetriever:
+    """
+    Args:
+        vectorstore (VectorStore): ベクトル検索
+        sparse_index (SparseIndex): 文字n-gramのBM25
+        k (int): 最終的に返す件数
+        candidates (int): それぞれの検索から取る候補数
+        sparse_weight (float): BM25側の重み（ベクトル側は 1 - sparse_weight）
+    """
+    return HybridRetriever(
+        retrievers=[
+            vectorstore.as_retriever(search_kwargs={"k": candidates}),
+            sparse_index.as_retriever(k=candidates),
+        ],
+        weights=[1 - sparse_weight, sparse_weight],
+        k=k,
+    )
@@ -0,0 +1,211 @@
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio import features, windows
+from rasterio.errors import NotGeoreferencedWarning
+
+from retrieval_qa_with_source.domain.repository.raster import RasterHandle
+from retrieval_qa_with_source.domain.service.geo import GeoService
+from retrieval_qa_with_source.domain.valueobject.geo import ZonalStatistics, Zone
+
+
+class ZonalStatisticsService:
+    """
+    多数の範囲（校庭・森など）について、ラスタを内部ブロックごとに読みながら森の割合とヒストグラムを集計する
+    ラスタ全体も切り出した範囲もメモリに載せないので、使うメモリはブロックの大きさ x スレッド数で決まる
+    """
+
+    def __init__(
+        self, geo_service: GeoService | None = None, max_workers: int | None = None
+    ):
+        """
+        Args:
+            geo_service (GeoService | None): メタデータと変換を読むのに使う。Noneなら新しく作る。
+            max_workers (int | None): ブロックを並行して読むスレッド数。Noneなら CPU 数（最大8）。
+        """
+        self.geo_service = geo_service or GeoService()
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+
+    def calculate(
+        self,
+        file_path: str,
+        zones: list[Zone],
+        forest_threshold: float,
+        band_index: int = 1,
+        bins: int = 256,
+        value_range: tuple[float, float] | None = None,
+    ) -> list[ZonalStatistics]:
+        """
+        範囲ごとに、森と判定したピクセル数・ピクセル数・ヒストグラムを集計する。
+        calculate_forest_percentage_from_array と同じく、値が forest_threshold を超えるピクセルを森とみなす。
+        範囲に含まれるのは、中心が多角形の内側にあるピクセル。
+
+        Args:
+            file_path (str): GeoTIFFファイルのパス。
+            zones (list[Zone]): 集計する範囲。重なっていてもよい。
+            forest_threshold (float): 森と判定するピクセル値の閾値。
+            band_index (int): 読み込むバンドのインデックス（デフォルトは1）。
+            bins (int): ヒストグラムの区切りの数。
+            value_range (tuple[float, float] | None): ヒストグラムの範囲。Noneなら整数型の値域全体。
+
+        Raises:
+            ValueError: 浮動小数点のラスタで value_range を指定しなかったとき。
+
+        Returns:
+            list[ZonalStatistics]: zones と同じ順の集計結果。
+        """
+        handle = self.geo_service.datasets.get(file_path)
+        dtype = np.dtype(handle.dataset.dtypes[band_index - 1])
+        value_range = self._value_range(dtype, value_range)
+        bin_edges = np.histogram_bin_edges([], bins=bins, range=value_range)
+        nodata = handle.dataset.nodatavals[band_index - 1]
+        geometries = [x.to_geometry() for x in zones]
+
+        forest_pixels = np.zeros(len(zones), dtype=np.int64)
+        total_pixels = np.zeros(len(zones), dtype=np.int64)
+        histograms = np.zeros((len(zones), bins), dtype=np.int64)
+
+        # GDAL のデータセットはスレッドをまたいで使えないので、スレッドごとに開く
+        local = threading.local()
+        opened = []
+        opened_lock = threading.Lock()
+
+        def dataset_of_thread():
+            if not hasattr(local, "dataset"):
+                local.dataset = rasterio.open(handle.key[0])
+                with opened_lock:
+                    opened.append(local.dataset)
+            return local.dataset
+
+        def accumulate_block(block: tuple[int, int], zone_indices: list[int]):
+            dataset = dataset_of_thread()
+            window = dataset.block_window(band_index, *block)
+            data = dataset.read(band_index, window=window)
+            valid = self._valid(data, nodata)
+            transform = windows.transform(window, handle.transform)
+
+            results = []
+            for i in zone_indices:
+                inside = features.rasterize(
+                    [(geometries[i], 1)],
+                    out_shape=data.shape,
+                    transform=transform,
+                    dtype=np.uint8,
+                ).astype(bool)
+                values = data[inside & valid]
+                results.append(
+                    (
+                        i,
+                        np.count_nonzero(values > forest_threshold),
+                        values.size,
+                        self._histogram(values, bins, value_range),
+                    )
+                )
+            return results
+
+        # rasterize は内部の一時データセットで NotGeoreferencedWarning を出し、warnings.catch_warnings で抑えている。
+        # catch_warnings はプロセス全体の設定を書き換えるので、スレッドから同時に呼ぶと抑えきれずに漏れる。
+        # transform は地理参照済みで警告に意味はないので、スレッドを回す前にここで1回だけ無視する設定にしておく
+        try:
+            with warnings.catch_warnings(), ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="zonal"
+            ) as executor:
+                warnings.simplefilter("ignore", NotGeoreferencedWarning)
+                blocks = self._blocks(handle, band_index, zones)
+                for results in executor.map(
+                    accumulate_block, blocks.keys(), blocks.values()
+                ):
+                    for i, forest, total, histogram in results:
+                        forest_pixels[i] += forest
+                        total_pixels[i] += total
+                        histograms[i] += histogram
+        finally:
+            for dataset in opened:
+                dataset.close()
+
+        return [
+            ZonalStatistics(
+                name=zone.name,
+                forest_pixels=int(forest_pixels[i]),
+                total_pixels=int(total_pixels[i]),
+                histogram=histograms[i],
+                bin_edges=bin_edges,
+            )
+            for i, zone in enumerate(zones)
+        ]
+
+    @staticmethod
+    def _blocks(
+        handle: RasterHandle, band_index: int, zones: list[Zone]
+    ) -> dict[tuple[int, int], list[int]]:
+        """
+        範囲の外接矩形と重なる内部ブロック -> そのブロックで集計する範囲のインデックス
+        どの範囲にもかからないブロックは読まない
+        """
+        dataset = handle.dataset
+        block_height, block_width = dataset.block_shapes[band_index - 1]
+        blocks: dict[tuple[int, int], list[int]] = {}
+        for i, zone in enumerate(zones):
+            rows, cols = handle.index_many(
+                [x.longitude for x in zone.vertices],
+                [x.latitude for x in zone.vertices],
+            )
+            row_start, row_stop = max(rows.min(), 0), min(
+                rows.max(), dataset.height - 1
+            )
+            col_start, col_stop = max(cols.min(), 0), min(cols.max(), dataset.width - 1)
+            if row_start > row_stop or col_start > col_stop:
+                continue
+            for block_row in range(
+                row_start // block_height, row_stop // block_height + 1
+            ):
+                for block_col in range(
+                    col_start // block_width, col_stop // block_width + 1
+                ):
+                    blocks.setdefault((block_row, block_col), []).append(i)
+
+        return blocks
+
+    @staticmethod
+    def _value_range(
+        dtype: np.dtype, value_range: tuple[float, float] | None
+    ) -> tuple[float, float]:
+        if value_range is not None:
+            return value_range
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            return info.min, info.max + 1
+        raise ValueError(f"value_range is required for {dtype} rasters")
+
+    @staticmethod
+    def _histogram(
+        values: np.ndarray, bins: int, value_range: tuple[float, float]
+    ) -> np.ndarray:
+        """
+        区切りが等間隔なので、np.histogram のように区切りを二分探索せず、区切りの番号を計算して bincount で数える
+        （ブロックごとに呼ぶので、np.histogram だと集計の大半をここで使う）。整数のラスタなら np.histogram と同じ結果になる
+        """
+        low, high = value_range
+        values = values[(values >= low) & (values <= high)]
+        if (
+            np.issubdtype(values.dtype, np.integer)
+            and float(low).is_integer()
+            and float(high).is_integer()
+        ):
+            index = (values.astype(np.int64) - int(low)) * bins // int(high - low)
+        else:
+            index = ((values - low) * (bins / (high - low))).astype(np.int64)
+        # np.histogram と同じく、最後の区切りは右端を含む
+        return np.bincount(np.minimum(index, bins - 1), minlength=bins)
+
+    @staticmethod
+    def _valid(data: np.ndarray, nodata: float | None) -> np.ndarray:
+        if nodata is None:
+            return np.ones(data.shape, dtype=bool)
+        if np.isnan(nodata):
+            return ~np.isnan(data)
+        return data != nodata
@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class CacheStats:
+    """
+    キャッシュの利用状況。容量（バジェット）を決めるための指標として使う。
+
+    Attributes:
+        hits (int): キャッシュから返せた回数。
+        misses (int): キャッシュになく、読み込みが発生した回数。
+        evictions (int): 容量超過で追い出した件数。
+        entries (int): 現在保持している件数。
+        current_bytes (int): 現在の推定使用量（バイト）。
+        max_bytes (int): 容量の上限（バイト）。
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    current_bytes: int
+    max_bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0
@@ -0,0 +1,106 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import List
+
+from langchain.schema import Document
+
+from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
+from retrieval_qa_with_source.domain.valueobject.pdfdataloader import PdfDataloader
+
+
+def _parse_pdf(
+    file_path: str, chunk_size: int, chunk_overlap: int
+) -> tuple[str, List[Document]]:
+    """
+    プロセスプールのワーカーで実行する（pickleできるようにモジュール直下に置く）
+    """
+    dataloader = PdfDataloader(
+        file_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap, cache=None
+    )
+    return file_path, dataloader.data
+
+
+class CorpusDataloader(Dataloader):
+    """
+    ディレクトリ配下のPDFをまとめて1つのデータソースとして扱う。
+    PDFの解析とチャンク分割はプロセスプールで並列に行う。
+    """
+
+    @property
+    def data(self) -> List[Document]:
+        if self._chunks is None:
+            self._load()
+            self._split()
+        return self._chunks
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        全PDFの（相対パス, sha256）とチャンク設定のsha256
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for file_path in self.file_paths:
+                digest.update(self._relative_path(file_path).encode())
+                digest.update(self._file_digest(file_path).encode())
+            digest.update(self.chunk_settings.encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @property
+    def index_name(self) -> str:
+        """
+        PDFを差し替えても同じインデックスを差分更新できるよう、中身ではなく名前で決める
+        """
+        return f"corpus-{self._name}"
+
+    @property
+    def file_paths(self) -> List[str]:
+        return self._file_paths
+
+    def __init__(
+        self,
+        directory: str,
+        chunk_size: int = 600,
+        chunk_overlap: int = 100,
+        max_workers: int | None = None,
+        name: str | None = None,
+    ):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self._directory = directory
+        self._name = name or Path(directory).resolve().name
+        self._max_workers = max_workers
+        self._file_paths = sorted(str(x) for x in Path(directory).rglob("*.pdf"))
+        self._pages: List[tuple[str, List[Document]]] | None = None
+        self._chunks: List[Document] | None = None
+        self._fingerprint: str | None = None
+
+    def _relative_path(self, file_path: str) -> str:
+        return Path(os.path.relpath(file_path, self._directory)).as_posix()
+
+    def _load(self):
+        with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+            self._pages = list(
+                executor.map(
+                    partial(
+                        _parse_pdf,
+                        chunk_size=self.chunk_size,
+                        chunk_overlap=self.chunk_overlap,
+                    ),
+                    self.file_paths,
+                )
+            )
+
+    def _split(self):
+        """
+        チャンクに元PDFの相対パス（attr）をつける
+        """
+        self._chunks = []
+        for file_path, chunks in self._pages:
+            attr = self._relative_path(file_path)
+            for chunk in chunks:
+                chunk.metadata["attr"] = attr
+                self._chunks.append(chunk)
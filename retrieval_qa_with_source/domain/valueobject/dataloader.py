@@ -1,37 +1,155 @@
+import hashlib
+import os
+import threading
 from abc import ABC, abstractmethod
-from typing import List
+from functools import lru_cache
+from typing import Iterable, Iterator, List
 
+import numpy as np
+import tiktoken
 from langchain.schema import Document
-from langchain.text_splitter import TokenTextSplitter
+
+# (絶対パス, mtime, サイズ) -> sha256。同じファイルを何度もハッシュしないためのメモ
+_file_digests: dict[tuple[str, int, int], str] = {}
+_file_digests_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(encoding_name: str) -> np.ndarray:
+    """
+    トークンID -> そのトークンのバイト長。エンコーディングごとに一度だけ作る
+    """
+    encoding = tiktoken.get_encoding(encoding_name)
+    lengths = np.zeros(encoding.max_token_value + 1, dtype=np.int64)
+    for token in range(encoding.max_token_value + 1):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
 
 
 class Dataloader(ABC):
     @property
     @abstractmethod
-    def data(self) -> List[Document]:
+    def data(self) -> Iterable[Document]:
+        """
+        インデックス化するチャンク。一度しか走査しないので、リストでもイテレータでもよい
+        """
+        pass
+
+    @property
+    @abstractmethod
+    def fingerprint(self) -> str:
+        """
+        データソースの中身とチャンク設定から決まるハッシュ値
+        ベクトルインデックスを再利用できるかどうかの判定に使う
+        """
         pass
 
+    @property
+    def index_name(self) -> str:
+        """
+        ベクトルインデックスの保存先の名前
+        同じ名前のまま中身が変わった場合は、チャンク単位の差分で更新される
+        """
+        return self.fingerprint
+
+    @property
+    def chunk_settings(self) -> str:
+        """
+        チャンクの切り方を表す文字列。fingerprint やキャッシュのキーに含める
+        """
+        return f"{self.encoding_name}:{self.chunk_size}:{self.chunk_overlap}"
+
     @abstractmethod
-    def __init__(self, chunk_size: int = 600, chunk_overlap: int = 100):
-        self.text_splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    def __init__(
+        self,
+        chunk_size: int = 600,
+        chunk_overlap: int = 100,
+        encoding_name: str = "cl100k_base",
+    ):
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        self.tokenizer = tiktoken.get_encoding(encoding_name)
 
     @abstractmethod
     def _load(self):
         pass
-    
+
     @abstractmethod
     def _split(self):
         pass
 
-    def _shredder(self, text: str, source: str, attr: str) -> tuple:
+    @staticmethod
+    def _file_digest(file_path: str) -> str:
+        """
+        ファイルのsha256。更新日時とサイズが変わらなければプロセス内のメモを返す
+        """
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        with _file_digests_lock:
+            if key in _file_digests:
+                return _file_digests[key]
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        with _file_digests_lock:
+            _file_digests[key] = digest.hexdigest()
+
+        return _file_digests[key]
+
+    def _chunk(self, documents: Iterable[Document]) -> Iterator[Document]:
         """
         日本語PDFでトークンを多く消費するような場合、ページ単位ではAPIが処理できないので
-        さらに千切りにする
+        さらに千切りにする。出典（metadata）はページのものを各チャンクに引き継ぐ
+
+        ページのトークナイズは1回だけで、チャンクはトークン境界の文字位置で元の文字列をスライスして作る
+        （デコードし直さないので、マルチバイト文字がトークンの途中で割れることもない）
+        空白だけのチャンクは作らない
+        """
+        step = self.chunk_size - self.chunk_overlap
+        for document in documents:
+            text, text_bytes = self._encode(document.page_content)
+            tokens = self.tokenizer.encode_ordinary(text)
+            if not tokens:
+                continue
+            char_offsets = self._char_offsets(text_bytes, tokens)
+            starts = np.arange(0, max(len(tokens) - self.chunk_overlap, 1), step)
+            ends = np.minimum(starts + self.chunk_size, len(tokens))
+            for start, end in zip(char_offsets[starts], char_offsets[ends]):
+                chunk = text[start:end]
+                if chunk.strip():
+                    yield Document(page_content=chunk, metadata=dict(document.metadata))
+
+    @staticmethod
+    def _encode(text: str) -> tuple[str, bytes]:
         """
-        text_fragments = self.text_splitter.split_text(text)
-        all_text, all_metadata = [], []
-        for text_fragment in text_fragments:
-            all_text.extend(text_fragment)
-            all_metadata.extend({"source": source, "attr": attr})
+        PDF から取り出した文字列には対になっていないサロゲートが混ざることがあり、そのままでは UTF-8 にできない
+        tiktoken と同じく U+FFFD に置き換える（バイト列がトークンと揃うので、文字位置の計算がずれない）
 
-        return all_text, all_metadata
+        Returns:
+            tuple[str, bytes]: (置き換えた文字列, その UTF-8)
+        """
+        try:
+            return text, text.encode("utf-8")
+        except UnicodeEncodeError:
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+            return text, text.encode("utf-8")
+
+    def _char_offsets(self, text_bytes: bytes, tokens: List[int]) -> np.ndarray:
+        """
+        i番目のトークンが始まる文字位置（末尾に len(text) を足した len(tokens)+1 要素）
+        トークンが文字の途中から始まる場合は次の文字の位置に切り上げる
+        """
+        token_lengths = _token_byte_lengths(self.encoding_name)[tokens]
+        byte_offsets = np.concatenate(([0], np.cumsum(token_lengths)))
+        text_bytes = np.frombuffer(text_bytes, dtype=np.uint8)
+        # UTF-8 の継続バイト（0b10xxxxxx）以外が文字の先頭
+        char_starts = np.concatenate(([0], np.cumsum((text_bytes & 0xC0) != 0x80)))
+        return char_starts[byte_offsets]
@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+from langchain.schema import Document
+
+from config.settings import DATALOADER_CACHE_MAX_BYTES
+from retrieval_qa_with_source.domain.valueobject.cache import CacheStats
+
+
+class DataloaderCache:
+    """
+    解析済みのDocumentをプロセス内に保持するLRUキャッシュ。
+    キーは (絶対パス, mtime, サイズ, variant) なので、ファイルが差し替えられたら自然に読み直しになる。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple[List[Document], int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._current_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _key(file_path: str, variant: str) -> tuple[str, int, int, str]:
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, variant
+
+    @staticmethod
+    def _estimate_bytes(documents: List[Document]) -> int:
+        return sum(
+            len(doc.page_content.encode("utf-8")) + len(str(doc.metadata))
+            for doc in documents
+        )
+
+    def get_or_load(
+        self,
+        file_path: str,
+        loader: Callable[[], List[Document]],
+        variant: str = "",
+    ) -> List[Document]:
+        """
+        キャッシュにあればそれを返し、なければ loader で読み込んでキャッシュする。
+
+        Args:
+            file_path (str): 読み込むファイルのパス。
+            loader (Callable[[], List[Document]]): キャッシュミス時に呼ぶ読み込み処理。
+            variant (str): 同じファイルでも結果が変わる設定（チャンクサイズなど）。
+
+        Returns:
+            List[Document]: 解析済みのDocument。
+        """
+        key = self._key(file_path, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return list(entry[0])
+            self._misses += 1
+
+        documents = loader()
+        self._put(key, documents)
+
+        return list(documents)
+
+    def _put(self, key: tuple, documents: List[Document]):
+        size = self._estimate_bytes(documents)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # 同じファイルの古い版（mtime違い）は二度と当たらないので捨てる
+            for stale_key in [
+                k for k in self._entries if k[0] == key[0] and k[3] == key[3]
+            ]:
+                self._current_bytes -= self._entries.pop(stale_key)[1]
+
+            self._entries[key] = (documents, size)
+            self._current_bytes += size
+            while self._current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                current_bytes=self._current_bytes,
+                max_bytes=self.max_bytes,
+            )
+
+
+# プロセス全体で共有するキャッシュ
+dataloader_cache = DataloaderCache(max_bytes=DATALOADER_CACHE_MAX_BYTES)
@@ -1,6 +1,7 @@
 from abc import abstractmethod, ABC
 from dataclasses import dataclass
 
+import numpy as np
 from affine import Affine
 from rasterio.crs import CRS
 
@@ -113,3 +114,96 @@ class RectangleCoords:
     def to_tuple(self) -> tuple[tuple[int, int], tuple[int, int]]:
         """矩形座標をタプル形式で返す"""
         return self.min_point.to_tuple(), self.max_point.to_tuple()
+
+
+@dataclass
+class PointSamples:
+    """
+    緯度経度の配列でまとめて読んだピクセル値を表す Value Object。
+    各配列は入力の緯度経度と同じ順・同じ長さ。
+
+    Attributes:
+        values (np.ndarray): ピクセル値。outside の点は 0。
+        rows (np.ndarray): ピクセルの行（y）。範囲外の点も計算した値のまま入る。
+        cols (np.ndarray): ピクセルの列（x）。
+        outside (np.ndarray): 画像の範囲外の点（bool）。
+        nodata (np.ndarray): 値が nodata の点（bool）。
+    """
+
+    values: np.ndarray
+    rows: np.ndarray
+    cols: np.ndarray
+    outside: np.ndarray
+    nodata: np.ndarray
+
+    @property
+    def mask(self) -> np.ndarray:
+        """有効な値がない点（範囲外または nodata）"""
+        return self.outside | self.nodata
+
+    def to_masked_array(self) -> np.ma.MaskedArray:
+        """有効な値がない点をマスクした配列"""
+        return np.ma.MaskedArray(self.values, mask=self.mask)
+
+
+@dataclass
+class Zone:
+    """
+    集計する範囲（多角形）を表す Value Object。頂点は緯度経度で、閉じていなくてよい。
+
+    Attributes:
+        name (str): 範囲の名前（例: "schoolyard"）。
+        vertices (list[GoogleMapCoords]): 多角形の頂点。
+    """
+
+    name: str
+    vertices: list[GoogleMapCoords]
+
+    @classmethod
+    def from_bbox(
+        cls, name: str, min_coords: GoogleMapCoords, max_coords: GoogleMapCoords
+    ) -> "Zone":
+        """左下（西南）と右上（北東）の緯度経度から矩形の範囲を作る"""
+        return cls(
+            name=name,
+            vertices=[
+                min_coords,
+                GoogleMapCoords(
+                    latitude=min_coords.latitude, longitude=max_coords.longitude
+                ),
+                max_coords,
+                GoogleMapCoords(
+                    latitude=max_coords.latitude, longitude=min_coords.longitude
+                ),
+            ],
+        )
+
+    def to_geometry(self) -> dict:
+        """GeoJSON の Polygon（座標は 経度, 緯度 の順）"""
+        ring = [(x.longitude, x.latitude) for x in self.vertices]
+        return {"type": "Polygon", "coordinates": [ring + ring[:1]]}
+
+
+@dataclass
+class ZonalStatistics:
+    """
+    範囲ごとの集計結果を表す Value Object。nodata のピクセルは数えない。
+
+    Attributes:
+        name (str): 範囲の名前。
+        forest_pixels (int): 森と判定したピクセル数（値が閾値を超えるもの）。
+        total_pixels (int): 範囲に含まれるピクセル数。
+        histogram (np.ndarray): ピクセル値のヒストグラム。
+        bin_edges (np.ndarray): ヒストグラムの区切り（len(histogram) + 1 個）。
+    """
+
+    name: str
+    forest_pixels: int
+    total_pixels: int
+    histogram: np.ndarray
+    bin_edges: np.ndarray
+
+    @property
+    def forest_percentage(self) -> float:
+        """森が占める割合（0～1）"""
+        return self.forest_pixels / self.total_pixels if self.total_pixels > 0 else 0
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+from langchain.schema import Document
+
+
+@dataclass
+class IndexManifest:
+    """
+    ベクトルインデックスの隣に置く、チャンク単位の内容ハッシュの一覧。
+    再取り込み時はこれと差分を取り、増えたチャンクだけ埋め込み、消えたチャンクだけ削除する。
+
+    Attributes:
+        fingerprint (str): 取り込んだ時点の Dataloader.fingerprint。
+        chunk_ids (list[str]): インデックスに入っているチャンクのID（内容ハッシュ）。
+    """
+
+    FILENAME = "manifest.json"
+
+    fingerprint: str
+    chunk_ids: list[str] = field(default_factory=list)
+
+    @staticmethod
+    def chunk_id(document: Document) -> str:
+        """
+        チャンクの内容と出典から決まるID。同じ内容なら何度取り込んでも同じIDになる
+        """
+        digest = hashlib.sha256()
+        digest.update(document.metadata.get("source", "").encode())
+        digest.update(b"\0")
+        digest.update(document.metadata.get("attr", "").encode())
+        digest.update(b"\0")
+        digest.update(document.page_content.encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def load(cls, directory: Path) -> "IndexManifest | None":
+        path = Path(directory) / cls.FILENAME
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, directory: Path):
+        """
+        書き込み途中で落ちても壊れたマニフェストが残らないよう、一時ファイルから置き換える
+        """
+        path = Path(directory) / self.FILENAME
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+        os.replace(temp_path, path)
+
+
+@dataclass
+class IndexSyncResult:
+    """
+    インデックスの差分更新の結果。
+
+    Attributes:
+        added (int): 新たに埋め込んだチャンク数。
+        removed (int): インデックスから削除したチャンク数。
+        unchanged (int): 埋め込みを再利用したチャンク数。
+    """
+
+    added: int
+    removed: int
+    unchanged: int
@@ -0,0 +1,58 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from retrieval_qa_with_source.models import ChatLogsWithSource
+
+
+@dataclass(frozen=True)
+class ChatLogCursor:
+    """
+    キーセットページングの位置（このページで先頭に表示する行）。次のページはこれより前の行を読む
+
+    Attributes:
+        thread (str): 行のスレッド。
+        created_at (datetime): 行の作成日時。
+        pk (int): 作成日時が同じ行を区別するための pk。
+    """
+
+    thread: str
+    created_at: datetime
+    pk: int
+
+    def encode(self) -> str:
+        """
+        URL のクエリにそのまま載せられる文字列にする
+        """
+        raw = json.dumps([self.thread, self.created_at.isoformat(), self.pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, value: str) -> "ChatLogCursor":
+        """
+        Raises:
+            ValueError: 壊れた文字列のとき
+        """
+        try:
+            raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+            thread, created_at, pk = json.loads(raw)
+            return cls(
+                thread=str(thread),
+                created_at=datetime.fromisoformat(created_at),
+                pk=int(pk),
+            )
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"invalid cursor: {value}") from e
+
+
+@dataclass
+class ChatLogPage:
+    """
+    Attributes:
+        rows (list[ChatLogsWithSource]): 表示する行（thread, created_at の順）。
+        older (ChatLogCursor | None): さらに前の行を読むための位置。前の行がなければ None。
+    """
+
+    rows: list[ChatLogsWithSource]
+    older: ChatLogCursor | None
@@ -1,31 +1,94 @@
+import hashlib
 import os
-from typing import List
+from typing import Iterable, Iterator, List
 
 from langchain.schema import Document
 from langchain_community.document_loaders import PyPDFLoader
 
 from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
+from retrieval_qa_with_source.domain.valueobject.dataloader_cache import (
+    DataloaderCache,
+    dataloader_cache,
+)
 
 
 class PdfDataloader(Dataloader):
     @property
-    def data(self) -> List[Document]:
-        return self.pages
+    def data(self) -> Iterable[Document]:
+        """
+        ページをトークン数で千切ったチャンク
+        PDFの解析は重いので、本文が必要になった時点ではじめて読み込む
+        同じPDF（パス・更新日時・サイズが同じ）の解析結果はプロセス内でキャッシュされる
+
+        lazy=True のときはページを1枚ずつ読んでチャンクを流すイテレータを返す（キャッシュしない）
+        巨大なPDFでもメモリに載るのは1ページ分だけになる
+        """
+        if self._lazy:
+            return self._chunk(self._lazy_pages())
+        if self._chunks is None:
+            if self._cache is None:
+                self._chunks = list(self._chunk(self.pages))
+            else:
+                self._chunks = self._cache.get_or_load(
+                    self._file_path,
+                    lambda: list(self._chunk(self.pages)),
+                    variant=self.chunk_settings,
+                )
+        return self._chunks
+
+    @property
+    def pages(self) -> List[Document]:
+        """
+        チャンクに分ける前のページ（出典つき）
+        """
+        if self._pages is None:
+            self._load()
+            self._split()
+        return self._pages
 
-    def __init__(self, file_path: str):
-        super().__init__()
+    @property
+    def fingerprint(self) -> str:
+        """
+        PDFのバイト列とチャンク設定のsha256
+        """
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha256(
+                f"{self._file_digest(self._file_path)}:{self.chunk_settings}".encode()
+            ).hexdigest()
+        return self._fingerprint
+
+    def __init__(
+        self,
+        file_path: str,
+        chunk_size: int = 600,
+        chunk_overlap: int = 100,
+        cache: DataloaderCache | None = dataloader_cache,
+        lazy: bool = False,
+    ):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         self._file_path = file_path
-        self._load()
-        self._split()
+        self._pages: List[Document] | None = None
+        self._chunks: List[Document] | None = None
+        self._fingerprint: str | None = None
+        self._cache = cache
+        self._lazy = lazy
 
     def _load(self):
-        self.pages = PyPDFLoader(self._file_path).load()
+        self._pages = PyPDFLoader(self._file_path).load()
 
     def _split(self):
         """
         PDFを切り刻み、出典（ページ数）をつけます
         """
+        for i, doc in enumerate(self._pages):
+            self._normalize(doc, page_number=i + 1)
+
+    def _lazy_pages(self) -> Iterator[Document]:
+        for i, doc in enumerate(PyPDFLoader(self._file_path).lazy_load()):
+            yield self._normalize(doc, page_number=i + 1)
+
+    def _normalize(self, doc: Document, page_number: int) -> Document:
         filename = os.path.basename(self._file_path)
-        for i, doc in enumerate(self.pages):
-            doc.page_content = doc.page_content.replace("\n", " ")
-            doc.metadata = {"source": f"{filename} {i + 1}ページ"}
+        doc.page_content = doc.page_content.replace("\n", " ")
+        doc.metadata = {"source": f"{filename} {page_number}ページ"}
+        return doc
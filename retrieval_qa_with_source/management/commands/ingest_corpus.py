@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from retrieval_qa_with_source.domain.repository.vectorstore import (
+    VectorStoreRepository,
+)
+from retrieval_qa_with_source.domain.valueobject.corpusdataloader import (
+    CorpusDataloader,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "ディレクトリ配下のPDFをまとめて1つのベクトルインデックスに取り込みます。"
+        "2回目以降は変更のあったチャンクだけを埋め込み直します"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", type=str, help="PDFを置いたディレクトリ")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="PDF解析のプロセス数（省略時はCPU数）",
+        )
+        parser.add_argument(
+            "--name",
+            type=str,
+            default=None,
+            help="インデックス名（省略時はディレクトリ名）",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=256,
+            help="1回の埋め込みリクエストに載せるチャンク数の上限",
+        )
+
+    def handle(self, *args, **options):
+        dataloader = CorpusDataloader(
+            options["directory"], max_workers=options["workers"], name=options["name"]
+        )
+        self.stdout.write(f"{len(dataloader.file_paths)} 件のPDFを取り込みます")
+
+        repository = VectorStoreRepository(batch_size=options["batch_size"])
+        result = repository.sync(dataloader)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"インデックスを更新しました: {repository.persist_directory(dataloader)} "
+                f"(追加 {result.added} / 削除 {result.removed} / 再利用 {result.unchanged})"
+            )
+        )
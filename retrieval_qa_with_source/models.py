@@ -8,3 +8,12 @@ class ChatLogsWithSource(models.Model):
     role = models.CharField(max_length=255)
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # 画面表示のキーセットページング（ユーザごとに thread, created_at, id の順）
+            models.Index(
+                fields=["user", "thread", "created_at", "id"],
+                name="chatlog_src_user_thread",
+            ),
+        ]
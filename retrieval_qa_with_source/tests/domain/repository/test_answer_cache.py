@@ -0,0 +1,61 @@
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from langchain.schema import Document
+
+from retrieval_qa_with_source.domain.repository.answer_cache import AnswerCache
+from retrieval_qa_with_source.domain.service.embeddings import HashingEmbeddings
+
+RESULT = {
+    "question": "少子化の原因は？",
+    "answer": "・未婚化・晩婚化の進行",
+    "sources": "白書.pdf 3ページ",
+    "source_documents": [
+        Document(page_content="未婚化・晩婚化", metadata={"source": "白書.pdf 3ページ"})
+    ],
+}
+
+
+class TestAnswerCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = AnswerCache(
+            Path(self.temp_dir.name) / "answer_cache.sqlite3",
+            embeddings=HashingEmbeddings(),
+            similarity_threshold=0.75,
+        )
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_exact_match_keeps_source_documents(self):
+        self.cache.put("少子化の原因は？", "index", "v1", RESULT)
+
+        cached = self.cache.get("少子化の原因は?", "index", "v1")
+
+        self.assertEqual(RESULT["answer"], cached["answer"])
+        self.assertEqual(RESULT["source_documents"], cached["source_documents"])
+
+    def test_near_duplicate_question(self):
+        self.cache.put("日本の少子化の主な原因は何ですか", "index", "v1", RESULT)
+
+        self.assertIsNotNone(
+            self.cache.get("日本の少子化の主な原因は？", "index", "v1")
+        )
+        self.assertIsNone(self.cache.get("高齢化率の推移を教えて", "index", "v1"))
+
+    def test_index_version_change_invalidates(self):
+        self.cache.put("少子化の原因は？", "index", "v1", RESULT)
+        self.cache.put("出生率は？", "index", "v2", RESULT)
+
+        self.assertIsNone(self.cache.get("少子化の原因は？", "index", "v2"))
+        self.assertIsNone(self.cache.get("少子化の原因は？", "index", "v1"))
+
+    def test_expired_answer_is_not_returned(self):
+        self.cache.ttl_seconds = 1
+        self.cache.put("少子化の原因は？", "index", "v1", RESULT)
+        time.sleep(1.1)
+
+        self.assertIsNone(self.cache.get("少子化の原因は？", "index", "v1"))
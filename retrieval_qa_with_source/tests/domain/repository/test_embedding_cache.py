@@ -0,0 +1,65 @@
+import tempfile
+from pathlib import Path
+from typing import List
+from unittest import TestCase
+
+import numpy as np
+
+from retrieval_qa_with_source.domain.repository.embedding_cache import (
+    CachedEmbeddings,
+    SqliteEmbeddingStore,
+)
+from retrieval_qa_with_source.domain.service.embeddings import HashingEmbeddings
+
+
+class CountingHashingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(size=32)
+        self.embedded_texts: list[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded_texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+class TestCachedEmbeddings(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = SqliteEmbeddingStore(Path(self.temp_dir.name) / "cache.sqlite3")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_same_text_is_embedded_once(self):
+        underlying = CountingHashingEmbeddings()
+        embeddings = CachedEmbeddings(underlying, store=self.store)
+
+        first = embeddings.embed_documents(["少子化", "白書", "少子化"])
+        second = embeddings.embed_documents(["白書", "少子化"])
+
+        self.assertEqual(["少子化", "白書"], underlying.embedded_texts)
+        self.assertEqual(first[0], first[2])
+        self.assertEqual(first[1], second[0])
+        self.assertEqual(3, embeddings.stats().hits)
+        self.assertEqual(2, embeddings.stats().misses)
+
+    def test_other_process_reads_from_disk(self):
+        CachedEmbeddings(CountingHashingEmbeddings(), store=self.store).embed_documents(
+            ["少子化社会対策"]
+        )
+        underlying = CountingHashingEmbeddings()
+        vector = CachedEmbeddings(underlying, store=self.store).embed_documents(
+            ["少子化社会対策"]
+        )[0]
+
+        self.assertEqual([], underlying.embedded_texts)
+        np.testing.assert_allclose(
+            HashingEmbeddings(size=32).embed_query("少子化社会対策"), vector, rtol=1e-6
+        )
+
+    def test_memory_is_bounded(self):
+        embeddings = CachedEmbeddings(CountingHashingEmbeddings(), max_bytes=32 * 4 * 2)
+        embeddings.embed_documents(["a", "b", "c"])
+
+        self.assertEqual(2, embeddings.stats().entries)
+        self.assertEqual(1, embeddings.stats().evictions)
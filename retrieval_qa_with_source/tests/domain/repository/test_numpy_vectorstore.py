@@ -0,0 +1,128 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from retrieval_qa_with_source.domain.repository.numpy_vectorstore import (
+    NumpyVectorStore,
+)
+from retrieval_qa_with_source.domain.repository.vectorstore import (
+    VectorStoreRepository,
+)
+from retrieval_qa_with_source.domain.service.embeddings import HashingEmbeddings
+from retrieval_qa_with_source.tests.domain.repository.test_vectorstore import (
+    CountingEmbeddings,
+    InMemoryDataloader,
+)
+
+
+class TestNumpyVectorStore(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(2000, 32)).astype(np.float32)
+        self.queries = rng.normal(size=(20, 32)).astype(np.float32)
+        self.texts = [str(i) for i in range(len(self.vectors))]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _exact_top_k(self, k: int) -> np.ndarray:
+        vectors = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        queries = self.queries / np.linalg.norm(self.queries, axis=1, keepdims=True)
+        return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+    def _search(self, vectorstore: NumpyVectorStore, k: int) -> list[list[int]]:
+        return [
+            [int(doc.page_content) for doc, _ in row]
+            for row in vectorstore.batch_similarity_search_by_vector(self.queries, k)
+        ]
+
+    def test_brute_force_matches_exact_search(self):
+        vectorstore = NumpyVectorStore(HashingEmbeddings())
+        vectorstore.add_embeddings(self.texts, self.vectors, ids=self.texts)
+
+        self.assertEqual(self._exact_top_k(5).tolist(), self._search(vectorstore, 5))
+
+    def test_ivf_recall(self):
+        vectorstore = NumpyVectorStore(HashingEmbeddings(), n_lists=16, n_probe=8)
+        vectorstore.add_embeddings(self.texts, self.vectors, ids=self.texts)
+        vectorstore.build_ivf()
+
+        expected = self._exact_top_k(10)
+        found = self._search(vectorstore, 10)
+        recall = np.mean(
+            [len(set(e) & set(f)) / 10 for e, f in zip(expected.tolist(), found)]
+        )
+        self.assertGreaterEqual(recall, 0.8)
+
+    def test_upsert_and_delete(self):
+        vectorstore = NumpyVectorStore(HashingEmbeddings())
+        vectorstore.add_texts(["りんご", "みかん"], ids=["a", "b"])
+        vectorstore.add_texts(["ぶどう"], ids=["a"])
+        vectorstore.delete(ids=["b"])
+
+        self.assertEqual(["a"], vectorstore.get()["ids"])
+        self.assertEqual(
+            "ぶどう", vectorstore.similarity_search("ぶどう", k=1)[0].page_content
+        )
+
+    def test_duplicate_ids_in_one_call(self):
+        vectorstore = NumpyVectorStore(HashingEmbeddings())
+        vectorstore.add_texts(["りんご", "みかん", "ぶどう"], ids=["a", "b", "a"])
+
+        self.assertEqual(["a", "b"], vectorstore.get()["ids"])
+        self.assertEqual(
+            ["ぶどう", "みかん"],
+            [x.page_content for x in vectorstore.similarity_search("ぶどう", k=3)],
+        )
+
+    def test_persist_and_load(self):
+        vectorstore = NumpyVectorStore(
+            HashingEmbeddings(), persist_directory=self.temp_dir.name, n_lists=4
+        )
+        vectorstore.add_texts(
+            ["りんご", "みかん", "ぶどう", "もも"],
+            metadatas=[{"source": f"sample.pdf {i}ページ"} for i in range(4)],
+        )
+        vectorstore.persist()
+
+        loaded = NumpyVectorStore(
+            HashingEmbeddings(), persist_directory=self.temp_dir.name, n_lists=4
+        )
+        loaded.add_texts(["なし"])
+
+        self.assertEqual(5, len(loaded))
+        self.assertEqual(
+            {"source": "sample.pdf 2ページ"},
+            loaded.similarity_search("ぶどう", k=1)[0].metadata,
+        )
+
+
+class TestVectorStoreRepositoryWithNumpy(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.embeddings = CountingEmbeddings()
+        self.repository = VectorStoreRepository(
+            root=self.temp_dir.name, embeddings=self.embeddings, backend="numpy"
+        )
+
+    def tearDown(self):
+        VectorStoreRepository._loaded.clear()
+        self.temp_dir.cleanup()
+
+    def test_index_is_reused_across_processes(self):
+        self.repository.sync(InMemoryDataloader(["りんご", "みかん", "ぶどう"]))
+        # 別プロセスで開いたのと同じ状態にする
+        VectorStoreRepository._loaded.clear()
+        self.embeddings.embedded_texts.clear()
+
+        vectorstore = self.repository.get_or_create(
+            InMemoryDataloader(["りんご", "みかん", "もも"])
+        )
+
+        self.assertIsInstance(vectorstore, NumpyVectorStore)
+        self.assertEqual(["もも"], self.embeddings.embedded_texts)
+        self.assertEqual(
+            {"りんご", "みかん", "もも"}, set(vectorstore.get()["documents"])
+        )
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from langchain.schema import Document
+
+from retrieval_qa_with_source.domain.repository.sparse_index import (
+    SparseIndex,
+    SparseIndexBuilder,
+    char_ngrams,
+)
+from retrieval_qa_with_source.domain.repository.vectorstore import (
+    VectorStoreRepository,
+)
+from retrieval_qa_with_source.domain.service.retriever import create_hybrid_retriever
+from retrieval_qa_with_source.tests.domain.repository.test_vectorstore import (
+    CountingEmbeddings,
+    InMemoryDataloader,
+)
+
+TEXTS = [
+    "令和5年版の情報通信白書では生成AIの利用状況を取り上げた",
+    "ＤＸの推進には人材の確保が欠かせない",
+    "地方の通信インフラ整備が進んでいる",
+]
+
+
+def build(texts: list[str]) -> SparseIndex:
+    builder = SparseIndexBuilder()
+    for i, text in enumerate(texts):
+        builder.add(Document(page_content=text, metadata={"source": f"{i}ページ"}))
+    return builder.build()
+
+
+class TestSparseIndex(TestCase):
+    def test_char_ngrams(self):
+        self.assertEqual(["dx", "x推", "推進", "a"], char_ngrams("ＤＸ推進 a"))
+
+    def test_keyword_match_ranks_first(self):
+        index = build(TEXTS)
+
+        results = index.search("生成AI", k=3)
+
+        self.assertEqual(TEXTS[0], results[0][0].page_content)
+        self.assertEqual({"source": "0ページ"}, results[0][0].metadata)
+        # 1文字も一致しない文書は返さない
+        self.assertEqual(1, len(results))
+
+    def test_save_and_load(self):
+        index = build(TEXTS)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index.save(temp_dir)
+            loaded = SparseIndex.load(temp_dir)
+
+        self.assertEqual(
+            [doc.page_content for doc, _ in index.search("通信", k=3)],
+            [doc.page_content for doc, _ in loaded.search("通信", k=3)],
+        )
+
+
+class TestHybridRetrieval(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.repository = VectorStoreRepository(
+            root=self.temp_dir.name, embeddings=CountingEmbeddings(), backend="numpy"
+        )
+
+    def tearDown(self):
+        VectorStoreRepository._loaded.clear()
+        self.temp_dir.cleanup()
+
+    def test_keyword_hit_is_fused_into_results(self):
+        dataloader = InMemoryDataloader(TEXTS)
+        retriever = create_hybrid_retriever(
+            self.repository.get_or_create(dataloader),
+            self.repository.get_sparse_index(dataloader),
+            k=2,
+        )
+
+        documents = retriever.invoke("DXの人材")
+
+        self.assertEqual(2, len(documents))
+        self.assertIn(TEXTS[1], [x.page_content for x in documents])
+
+    def test_sparse_index_is_built_for_existing_index(self):
+        dataloader = InMemoryDataloader(TEXTS)
+        self.repository.sync(dataloader)
+        directory = self.repository.persist_directory(dataloader)
+        os.remove(directory / SparseIndex.ARRAYS)
+        VectorStoreRepository._loaded.clear()
+
+        self.assertEqual(3, len(self.repository.get_sparse_index(dataloader)))
+        self.assertTrue((directory / SparseIndex.ARRAYS).exists())
@@ -0,0 +1,116 @@
+import hashlib
+import tempfile
+from typing import List
+from unittest import TestCase
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval_qa_with_source.domain.repository.vectorstore import (
+    VectorStoreRepository,
+)
+from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded_texts: list[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded_texts.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode()).digest()
+        return [x / 255 for x in digest[:8]]
+
+
+class InMemoryDataloader(Dataloader):
+    @property
+    def data(self) -> List[Document]:
+        return [
+            Document(
+                page_content=text, metadata={"source": f"sample.pdf {i + 1}ページ"}
+            )
+            for i, text in enumerate(self.texts)
+        ]
+
+    @property
+    def fingerprint(self) -> str:
+        return hashlib.sha256("\0".join(self.texts).encode()).hexdigest()
+
+    @property
+    def index_name(self) -> str:
+        return "sample"
+
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+
+    def _load(self):
+        pass
+
+    def _split(self):
+        pass
+
+
+class TestVectorStoreRepository(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.embeddings = CountingEmbeddings()
+        self.repository = VectorStoreRepository(
+            root=self.temp_dir.name, embeddings=self.embeddings, batch_size=2
+        )
+
+    def tearDown(self):
+        VectorStoreRepository._loaded.clear()
+        VectorStoreRepository._loaded_manifest_mtimes.clear()
+        self.temp_dir.cleanup()
+
+    def test_unchanged_source_is_not_embedded_again(self):
+        dataloader = InMemoryDataloader(["りんご", "みかん", "ぶどう"])
+        self.repository.sync(dataloader)
+        result = self.repository.sync(dataloader)
+
+        self.assertEqual(3, len(self.embeddings.embedded_texts))
+        self.assertEqual(0, result.added)
+        self.assertEqual(3, result.unchanged)
+
+    def test_only_changed_chunks_are_embedded(self):
+        self.repository.sync(InMemoryDataloader(["りんご", "みかん", "ぶどう"]))
+        self.embeddings.embedded_texts.clear()
+
+        result = self.repository.sync(InMemoryDataloader(["りんご", "みかん", "もも"]))
+        vectorstore = self.repository.get_or_create(
+            InMemoryDataloader(["りんご", "みかん", "もも"])
+        )
+
+        self.assertEqual(["もも"], self.embeddings.embedded_texts)
+        self.assertEqual(1, result.added)
+        self.assertEqual(1, result.removed)
+        self.assertEqual(
+            {"りんご", "みかん", "もも"}, set(vectorstore.get()["documents"])
+        )
+
+    def test_read_only_loads_ingested_index_without_syncing(self):
+        read_only = VectorStoreRepository(
+            root=self.temp_dir.name, embeddings=self.embeddings, read_only=True
+        )
+        with self.assertRaises(FileNotFoundError):
+            read_only.get_or_create(InMemoryDataloader(["りんご"]))
+
+        self.repository.sync(InMemoryDataloader(["りんご", "みかん"]))
+        VectorStoreRepository._loaded.clear()
+        self.embeddings.embedded_texts.clear()
+
+        # データソースが変わっていても取り込まない（取り込み済みの内容を返す）
+        dataloader = InMemoryDataloader(["りんご", "みかん", "ぶどう"])
+        vectorstore = read_only.get_or_create(dataloader)
+        self.assertEqual([], self.embeddings.embedded_texts)
+        self.assertEqual(
+            ["りんご"],
+            [x.page_content for x in vectorstore.similarity_search("りんご", k=1)],
+        )
+        self.assertEqual(
+            self.repository.index_version(InMemoryDataloader(["りんご", "みかん"])),
+            read_only.index_version(dataloader),
+        )
@@ -0,0 +1,262 @@
+import io
+import os
+import tempfile
+import weakref
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import rasterio
+from PIL import Image
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+from retrieval_qa_with_source.domain.service.geo import GeoService
+from retrieval_qa_with_source.domain.valueobject.geo import (
+    GoogleMapCoords,
+    Point,
+    RectangleCoords,
+)
+
+ORIGIN_LONGITUDE, ORIGIN_LATITUDE, PIXEL_SIZE = 136.9, 37.4, 1e-5
+
+
+def write_geotiff(path: Path, data: np.ndarray, block_size: int = 64):
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=data.shape[1],
+        height=data.shape[0],
+        count=1,
+        dtype=data.dtype,
+        crs="EPSG:4326",
+        transform=from_origin(
+            ORIGIN_LONGITUDE, ORIGIN_LATITUDE, PIXEL_SIZE, PIXEL_SIZE
+        ),
+        tiled=True,
+        blockxsize=block_size,
+        blockysize=block_size,
+    ) as dataset:
+        dataset.write(data, 1)
+
+
+def coords_of(row: float, col: float) -> GoogleMapCoords:
+    return GoogleMapCoords(
+        latitude=ORIGIN_LATITUDE - row * PIXEL_SIZE,
+        longitude=ORIGIN_LONGITUDE + col * PIXEL_SIZE,
+    )
+
+
+class TestGeoService(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "ortho.tif"
+        self.data = np.arange(300 * 500, dtype=np.uint32).reshape(300, 500)
+        write_geotiff(self.path, self.data)
+        self.geo_service = GeoService()
+
+    def tearDown(self):
+        self.geo_service.close()
+        self.temp_dir.cleanup()
+
+    def test_value_by_coords_matches_full_read(self):
+        rng = np.random.default_rng(0)
+        for row, col in rng.uniform([0, 0], [300, 500], size=(50, 2)):
+            coords = coords_of(row, col)
+            with rasterio.open(self.path) as dataset:
+                py, px = dataset.index(coords.longitude, coords.latitude)
+            self.assertEqual(
+                self.data[py, px],
+                self.geo_service.get_value_by_coords(str(self.path), coords),
+            )
+
+    def test_value_outside_raises(self):
+        with self.assertRaises(IndexError):
+            self.geo_service.get_value_by_coords(str(self.path), coords_of(-0.5, 10.5))
+
+    def test_crop_matches_windowed_read_and_reuses_tiles(self):
+        cases = [
+            (coords_of(120.5, 10.5), coords_of(30.5, 200.5)),
+            # 右下がはみ出る範囲は、rasterio と同じく切り捨てる
+            (coords_of(350.5, 450.5), coords_of(250.5, 520.5)),
+        ]
+        for min_coords, max_coords in cases:
+            with rasterio.open(self.path) as dataset:
+                py, px = dataset.index(min_coords.longitude, min_coords.latitude)
+                py2, px2 = dataset.index(max_coords.longitude, max_coords.latitude)
+                expected = dataset.read(
+                    1, window=Window.from_slices((py2, py + 1), (px, px2 + 1))
+                )
+            cropped = self.geo_service.crop_by_bbox(
+                str(self.path), min_coords, max_coords
+            )
+            np.testing.assert_array_equal(expected, cropped)
+
+        misses = self.geo_service.tiles.stats().misses
+        self.geo_service.crop_by_bbox(str(self.path), *cases[0])
+        self.assertEqual(misses, self.geo_service.tiles.stats().misses)
+
+    def test_rewritten_file_is_reopened(self):
+        coords = coords_of(10.5, 10.5)
+        self.assertEqual(
+            self.data[10, 10],
+            self.geo_service.get_value_by_coords(str(self.path), coords),
+        )
+
+        write_geotiff(self.path, self.data + 1)
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        self.assertEqual(
+            self.data[10, 10] + 1,
+            self.geo_service.get_value_by_coords(str(self.path), coords),
+        )
+
+    def test_least_recently_used_dataset_is_released(self):
+        geo_service = GeoService(max_datasets=1)
+        other = Path(self.temp_dir.name) / "other.tif"
+        write_geotiff(other, self.data)
+
+        first = weakref.ref(geo_service.datasets.get(str(self.path)))
+        geo_service.datasets.get(str(other))
+
+        # キャッシュが持っていなければ、最後の参照がなくなった時点で閉じられる
+        self.assertIsNone(first())
+        geo_service.close()
+
+    def test_evicted_handle_stays_readable(self):
+        other_path = Path(self.temp_dir.name) / "other.tif"
+        write_geotiff(other_path, self.data)
+        geo_service = GeoService(max_datasets=1)
+        try:
+            handle = geo_service.datasets.get(str(self.path))
+            # ほかのスレッドが別のファイルを開いて、使っている途中のハンドルを追い出した
+            geo_service.datasets.get(str(other_path))
+
+            window = Window(10, 20, 30, 40)
+            np.testing.assert_array_equal(
+                geo_service.tiles.read(handle, 1, window), self.data[20:60, 10:40]
+            )
+            self.assertEqual(handle.read(1, window=window).shape, (40, 30))
+        finally:
+            geo_service.close()
+
+
+class TestGeoServiceBatch(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "landcover.tif"
+        self.data = np.arange(300 * 500, dtype=np.int32).reshape(300, 500) % 97
+        self.data[:10, :10] = -1
+        write_geotiff(self.path, self.data)
+        with rasterio.open(self.path, "r+") as dataset:
+            dataset.nodata = -1
+        self.geo_service = GeoService()
+
+    def tearDown(self):
+        self.geo_service.close()
+        self.temp_dir.cleanup()
+
+    def test_batch_matches_single_lookups(self):
+        rng = np.random.default_rng(0)
+        rows, cols = rng.uniform(10, 300, 1000), rng.uniform(10, 500, 1000)
+        coords = [coords_of(row, col) for row, col in zip(rows, cols)]
+
+        samples = self.geo_service.get_values_by_coords_batch(
+            str(self.path),
+            np.array([x.latitude for x in coords]),
+            np.array([x.longitude for x in coords]),
+        )
+
+        self.assertFalse(samples.mask.any())
+        np.testing.assert_array_equal(
+            [self.geo_service.get_value_by_coords(str(self.path), x) for x in coords],
+            samples.values,
+        )
+        # タイル（64x64 が 5x8 枚）はそれぞれ1回だけ読む
+        self.assertEqual(40, self.geo_service.tiles.stats().misses)
+
+    def test_outside_and_nodata_are_masked(self):
+        coords = [coords_of(5.5, 5.5), coords_of(-1.5, 3.5), coords_of(20.5, 30.5)]
+
+        samples = self.geo_service.get_values_by_coords_batch(
+            str(self.path),
+            np.array([x.latitude for x in coords]),
+            np.array([x.longitude for x in coords]),
+        )
+
+        self.assertEqual([False, True, False], samples.outside.tolist())
+        self.assertEqual([True, False, False], samples.nodata.tolist())
+        self.assertEqual(
+            [None, None, self.data[20, 30]], samples.to_masked_array().tolist()
+        )
+        cols, rows = self.geo_service.get_pixel_coordinates_from_geo_batch(
+            str(self.path),
+            np.array([x.latitude for x in coords]),
+            np.array([x.longitude for x in coords]),
+        )
+        self.assertEqual([5, 3, 30], cols.tolist())
+        self.assertEqual([5, -2, 20], rows.tolist())
+
+
+class TestGeoServiceOverview(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "ortho.tif"
+        # 8x8 ピクセルごとに同じ値なので、平均で縮小しても値は変わらない
+        self.data = np.kron(
+            np.arange(75 * 125, dtype=np.uint16).reshape(75, 125),
+            np.ones((8, 8), dtype=np.uint16),
+        )
+        write_geotiff(self.path, self.data)
+        self.geo_service = GeoService()
+
+    def tearDown(self):
+        self.geo_service.close()
+        self.temp_dir.cleanup()
+
+    def test_default_factors_reach_min_size(self):
+        self.assertEqual(self.geo_service.build_overviews(str(self.path)), [2, 4])
+        self.assertEqual(self.geo_service.get_overview_factors(str(self.path)), [2, 4])
+
+    def test_external_overviews_are_seen_by_cached_handle(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        self.assertEqual(self.geo_service.get_overview_factors(str(self.path)), [])
+        self.geo_service.build_overviews(str(self.path), external=True)
+        self.assertTrue(Path(f"{self.path}.ovr").exists())
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        self.assertEqual(self.geo_service.get_overview_factors(str(self.path)), [2, 4])
+
+    def test_preview_reads_downsampled_band(self):
+        for external in (False, True):
+            with self.subTest(external=external):
+                path = Path(self.temp_dir.name) / f"ortho_{external}.tif"
+                write_geotiff(path, self.data)
+                self.geo_service.build_overviews(str(path), external=external)
+                preview = self.geo_service.read_preview(str(path), max_size=125)
+                self.assertEqual(preview.shape, (75, 125))
+                np.testing.assert_array_equal(preview, self.data[::8, ::8])
+
+    def test_preview_keeps_small_image_as_is(self):
+        preview = self.geo_service.read_preview(str(self.path), max_size=2000)
+        np.testing.assert_array_equal(preview, self.data)
+
+    def test_draw_bbox_on_preview(self):
+        output_path = Path(self.temp_dir.name) / "preview.png"
+        self.geo_service.build_overviews(str(self.path))
+        self.geo_service.draw_bbox_on_preview(
+            str(self.path),
+            RectangleCoords(min_point=Point(100, 500), max_point=Point(300, 200)),
+            str(output_path),
+            max_size=250,
+        )
+        with Image.open(output_path) as image:
+            self.assertEqual((image.format, image.size), ("PNG", (250, 150)))
+
+    def test_render_preview_returns_bytes(self):
+        content = self.geo_service.render_preview(
+            str(self.path), max_size=125, image_format="JPEG"
+        )
+        with Image.open(io.BytesIO(content)) as image:
+            self.assertEqual((image.format, image.size), ("JPEG", (125, 75)))
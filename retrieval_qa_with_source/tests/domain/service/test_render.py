@@ -0,0 +1,59 @@
+import io
+from unittest import TestCase
+
+import numpy as np
+from PIL import Image
+
+from retrieval_qa_with_source.domain.service.render import ImageRenderService
+from retrieval_qa_with_source.domain.valueobject.geo import Point, RectangleCoords
+
+
+class TestImageRenderService(TestCase):
+    def test_rescale_stretches_percentiles(self):
+        data = np.random.default_rng(0).normal(1000, 50, size=(200, 300))
+        low, high = np.percentile(data, [2, 98])
+        expected = np.clip((data - low) / (high - low) * 255, 0, 255).astype(np.uint8)
+
+        rescaled = ImageRenderService.rescale(data)
+        self.assertEqual(rescaled.dtype, np.uint8)
+        # float32 で計算するので、境目の値だけ1ずれることがある
+        self.assertLessEqual(
+            np.abs(rescaled.astype(int) - expected.astype(int)).max(), 1
+        )
+
+    def test_rescale_large_array_uses_sample(self):
+        data = np.random.default_rng(0).integers(0, 4096, (2000, 1500), np.uint16)
+        rescaled = ImageRenderService.rescale(data)
+        self.assertAlmostEqual(np.mean(rescaled == 0), 0.02, delta=0.005)
+        self.assertAlmostEqual(np.mean(rescaled == 255), 0.02, delta=0.005)
+
+    def test_rescale_constant_data(self):
+        rescaled = ImageRenderService.rescale(np.full((4, 4), 7, dtype=np.uint16))
+        np.testing.assert_array_equal(rescaled, np.zeros((4, 4), dtype=np.uint8))
+
+    def test_draw_rectangle(self):
+        image = np.full((50, 60), 100, dtype=np.uint8)
+        rgb = ImageRenderService.draw_rectangle(
+            image,
+            # 左下・右上の順でも、画像からはみ出していてもよい
+            RectangleCoords(min_point=Point(10, 40), max_point=Point(70, 20)),
+        )
+        self.assertEqual(rgb.shape, (50, 60, 3))
+        red = np.all(rgb == (255, 0, 0), axis=2)
+        self.assertTrue(red[20, 10:60].all())
+        self.assertTrue(red[40, 10:60].all())
+        self.assertTrue(red[20:41, 10].all())
+        self.assertFalse(red[25:36, 15:55].any())
+        self.assertFalse(red[:, :8].any())
+        np.testing.assert_array_equal(image, np.full((50, 60), 100, dtype=np.uint8))
+
+    def test_encode(self):
+        image = np.arange(64 * 32, dtype=np.uint16).reshape(32, 64).astype(np.uint8)
+        for image_format in ("PNG", "JPEG"):
+            with self.subTest(image_format=image_format):
+                content = ImageRenderService.encode(image, image_format)
+                with Image.open(io.BytesIO(content)) as decoded:
+                    self.assertEqual(decoded.format, image_format)
+                    self.assertEqual(decoded.size, (64, 32))
+                    if image_format == "PNG":
+                        np.testing.assert_array_equal(np.asarray(decoded), image)
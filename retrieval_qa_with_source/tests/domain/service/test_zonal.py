@@ -0,0 +1,77 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+import rasterio
+from rasterio import features
+
+from retrieval_qa_with_source.domain.service.zonal import ZonalStatisticsService
+from retrieval_qa_with_source.domain.valueobject.geo import Zone
+from retrieval_qa_with_source.tests.domain.service.test_geo import (
+    coords_of,
+    write_geotiff,
+)
+
+
+class TestZonalStatisticsService(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.temp_dir.name) / "forest.tif"
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 256, size=(300, 500), dtype=np.uint8)
+        self.data[:20, :] = 0
+        write_geotiff(self.path, self.data)
+        with rasterio.open(self.path, "r+") as dataset:
+            dataset.nodata = 0
+        self.zones = [
+            Zone.from_bbox("schoolyard", coords_of(120, 10), coords_of(30, 200)),
+            Zone(
+                "forest",
+                [
+                    coords_of(290.3, 20.2),
+                    coords_of(150.6, 480.1),
+                    coords_of(10.4, 250.7),
+                ],
+            ),
+            # 一部が画像の外にはみ出る範囲
+            Zone.from_bbox("edge", coords_of(320, 400), coords_of(250, 600)),
+            Zone.from_bbox("outside", coords_of(-50, -50), coords_of(-10, -10)),
+        ]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def expected(self, zone: Zone, forest_threshold: float) -> tuple[int, int]:
+        with rasterio.open(self.path) as dataset:
+            inside = features.rasterize(
+                [(zone.to_geometry(), 1)],
+                out_shape=self.data.shape,
+                transform=dataset.transform,
+                dtype=np.uint8,
+            ).astype(bool)
+        values = self.data[inside & (self.data != 0)]
+        return int(np.count_nonzero(values > forest_threshold)), values.size
+
+    def test_matches_whole_raster(self):
+        for max_workers in (1, 4):
+            service = ZonalStatisticsService(max_workers=max_workers)
+            statistics = service.calculate(str(self.path), self.zones, 128)
+            service.geo_service.close()
+
+            for zone, result in zip(self.zones, statistics):
+                forest, total = self.expected(zone, 128)
+                self.assertEqual(zone.name, result.name)
+                self.assertEqual(forest, result.forest_pixels)
+                self.assertEqual(total, result.total_pixels)
+                self.assertEqual(total, result.histogram.sum())
+            self.assertEqual(0, statistics[-1].forest_percentage)
+
+    def test_histogram_counts_each_value(self):
+        service = ZonalStatisticsService(max_workers=2)
+        result = service.calculate(str(self.path), self.zones[:1], 128)[0]
+        service.geo_service.close()
+
+        self.assertEqual(257, len(result.bin_edges))
+        self.assertEqual(0, result.histogram[0])
+        self.assertEqual(result.forest_pixels, result.histogram[129:].sum())
@@ -0,0 +1,32 @@
+from pathlib import Path
+from unittest import TestCase
+
+from config.settings import BASE_DIR
+from retrieval_qa_with_source.domain.valueobject.corpusdataloader import (
+    CorpusDataloader,
+)
+
+
+class TestCorpusDataloader(TestCase):
+    def setUp(self):
+        self.directory = str(
+            Path(BASE_DIR) / "retrieval_qa_with_source/tests/domain/valueobject"
+        )
+
+    def test_all_pdfs_in_directory_are_chunked(self):
+        dataloader = CorpusDataloader(self.directory, max_workers=2)
+        self.assertEqual(2, len(dataloader.file_paths))
+
+        # 18ページ + 6ページ。長いページはさらに千切られるのでチャンク数はページ数以上になる
+        self.assertLessEqual(24, len(dataloader.data))
+        attrs = {x.metadata["attr"] for x in dataloader.data}
+        self.assertIn("doj_cloud_act_white_paper_2019_04_10.pdf", attrs)
+        self.assertTrue(all("ページ" in x.metadata["source"] for x in dataloader.data))
+
+    def test_fingerprint_depends_on_chunk_settings(self):
+        default = CorpusDataloader(self.directory)
+        smaller = CorpusDataloader(self.directory, chunk_size=300, chunk_overlap=50)
+        self.assertEqual(
+            default.fingerprint, CorpusDataloader(self.directory).fingerprint
+        )
+        self.assertNotEqual(default.fingerprint, smaller.fingerprint)
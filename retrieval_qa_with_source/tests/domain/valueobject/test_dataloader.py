@@ -0,0 +1,95 @@
+from typing import List
+from unittest import TestCase
+
+from langchain.schema import Document
+
+from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
+
+
+class TextDataloader(Dataloader):
+    @property
+    def data(self) -> List[Document]:
+        return list(self._chunk(self.pages))
+
+    @property
+    def fingerprint(self) -> str:
+        return self.chunk_settings
+
+    def __init__(self, pages: list[str], chunk_size: int, chunk_overlap: int):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.pages = [
+            Document(
+                page_content=text, metadata={"source": f"sample.pdf {i + 1}ページ"}
+            )
+            for i, text in enumerate(pages)
+        ]
+
+    def _load(self):
+        pass
+
+    def _split(self):
+        pass
+
+
+class TestDataloaderChunk(TestCase):
+    def test_chunks_keep_page_source(self):
+        dataloader = TextDataloader(
+            ["少子化社会対策白書 " * 50, "", "short page"],
+            chunk_size=40,
+            chunk_overlap=10,
+        )
+        chunks = dataloader.data
+
+        self.assertLess(2, len(chunks))
+        self.assertEqual("sample.pdf 3ページ", chunks[-1].metadata["source"])
+        self.assertEqual("short page", chunks[-1].page_content)
+        self.assertNotIn(
+            "sample.pdf 2ページ", {x.metadata["source"] for x in chunks}
+        )  # 空ページはチャンクにしない
+
+    def test_chunks_fit_in_token_budget_without_broken_characters(self):
+        text = (
+            "令和4年版少子化社会対策白書。結婚・出産の希望が叶わない現状がある。" * 30
+        )
+        dataloader = TextDataloader([text], chunk_size=50, chunk_overlap=10)
+
+        for chunk in dataloader.data:
+            # 切り出した文字列を再エンコードすると境界で1トークン程度ずれることがある
+            self.assertLessEqual(
+                len(dataloader.tokenizer.encode_ordinary(chunk.page_content)), 51
+            )
+            self.assertNotIn("�", chunk.page_content)
+            self.assertIn(chunk.page_content, text)
+
+    def test_chunks_cover_whole_page_with_overlap(self):
+        text = " ".join(f"word{i}" for i in range(500))
+        dataloader = TextDataloader([text], chunk_size=64, chunk_overlap=16)
+        chunks = [x.page_content for x in dataloader.data]
+
+        self.assertTrue(text.startswith(chunks[0]))
+        self.assertTrue(text.endswith(chunks[-1]))
+        for previous, current in zip(chunks, chunks[1:]):
+            # 隣り合うチャンクは重なっている
+            self.assertIn(current[:10], previous)
+
+    def test_whitespace_only_page_yields_no_chunks(self):
+        dataloader = TextDataloader(
+            [" \n\n\t  \u3000\n", "本文"], chunk_size=40, chunk_overlap=10
+        )
+
+        self.assertEqual(["本文"], [x.page_content for x in dataloader.data])
+
+    def test_lone_surrogate_is_replaced_like_tiktoken(self):
+        text = "少子化\ud800対策 " * 40
+        dataloader = TextDataloader([text], chunk_size=20, chunk_overlap=5)
+        chunks = [x.page_content for x in dataloader.data]
+
+        expected = text.replace("\ud800", "\ufffd")
+        self.assertTrue(expected.startswith(chunks[0]))
+        self.assertTrue(expected.endswith(chunks[-1]))
+        for chunk in chunks:
+            self.assertIn(chunk, expected)
+
+    def test_overlap_must_be_smaller_than_chunk_size(self):
+        with self.assertRaises(ValueError):
+            TextDataloader(["text"], chunk_size=10, chunk_overlap=10)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from langchain.schema import Document
+
+from retrieval_qa_with_source.domain.valueobject.dataloader_cache import (
+    DataloaderCache,
+)
+
+
+class TestDataloaderCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.temp_dir.name) / "sample.pdf"
+        self.file_path.write_bytes(b"dummy")
+        self.load_count = 0
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _loader(self, text: str = "あいうえお"):
+        def load():
+            self.load_count += 1
+            return [
+                Document(page_content=text, metadata={"source": "sample.pdf 1ページ"})
+            ]
+
+        return load
+
+    def test_second_call_is_served_from_cache(self):
+        cache = DataloaderCache(max_bytes=1024 * 1024)
+        cache.get_or_load(str(self.file_path), self._loader())
+        documents = cache.get_or_load(str(self.file_path), self._loader())
+
+        self.assertEqual(1, self.load_count)
+        self.assertEqual("あいうえお", documents[0].page_content)
+        self.assertEqual(1, cache.stats().hits)
+        self.assertEqual(1, cache.stats().misses)
+
+    def test_modified_file_is_reloaded(self):
+        cache = DataloaderCache(max_bytes=1024 * 1024)
+        cache.get_or_load(str(self.file_path), self._loader())
+        self.file_path.write_bytes(b"replaced pdf")
+        os.utime(self.file_path, ns=(0, 0))
+        cache.get_or_load(str(self.file_path), self._loader())
+
+        self.assertEqual(2, self.load_count)
+        self.assertEqual(1, cache.stats().entries)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        other_path = Path(self.temp_dir.name) / "other.pdf"
+        other_path.write_bytes(b"dummy")
+        cache = DataloaderCache(max_bytes=100)
+        cache.get_or_load(str(self.file_path), self._loader("a" * 60))
+        cache.get_or_load(str(other_path), self._loader("b" * 60))
+
+        stats = cache.stats()
+        self.assertEqual(1, stats.entries)
+        self.assertEqual(1, stats.evictions)
+        self.assertLessEqual(stats.current_bytes, stats.max_bytes)
@@ -1,3 +1,4 @@
+from collections.abc import Iterator
 from pathlib import Path
 from unittest import TestCase
 
@@ -23,3 +24,17 @@ class TestPdfDataloader(TestCase):
         dataloader = PdfDataloader(str(file_path))
         self.assertEqual(6, len(dataloader.pages))
         print(dataloader.data)
+
+    def test_lazy_mode_yields_same_chunks(self):
+        file_path = (
+            Path(BASE_DIR)
+            / "retrieval_qa_with_source/tests/domain/valueobject/doj_cloud_act_white_paper_2019_04_10.pdf"
+        )
+        eager = PdfDataloader(str(file_path), cache=None)
+        lazy = PdfDataloader(str(file_path), lazy=True)
+
+        self.assertIsInstance(lazy.data, Iterator)
+        self.assertEqual(
+            [(x.page_content, x.metadata) for x in eager.data],
+            [(x.page_content, x.metadata) for x in lazy.data],
+        )
@@ -4,13 +4,34 @@ from django.contrib.auth.models import User
 from django.urls import reverse_lazy
 from django.views.generic import FormView
 
-from config.settings import BASE_DIR
+from config.settings import BASE_DIR, RETRIEVAL_CORPUS_DIR
+from retrieval_qa_with_source.domain.repository.chatlog import ChatLogRepository
+from retrieval_qa_with_source.domain.repository.vectorstore import (
+    VectorStoreRepository,
+)
 from retrieval_qa_with_source.domain.service.gptpdfservice import GptPdfService
+from retrieval_qa_with_source.domain.valueobject.corpusdataloader import (
+    CorpusDataloader,
+)
+from retrieval_qa_with_source.domain.valueobject.dataloader import Dataloader
+from retrieval_qa_with_source.domain.valueobject.page import ChatLogCursor
 from retrieval_qa_with_source.domain.valueobject.pdfdataloader import PdfDataloader
 from retrieval_qa_with_source.forms import UserTextForm
 from retrieval_qa_with_source.models import ChatLogsWithSource
 
 
+def parse_cursor(value: str | None) -> ChatLogCursor | None:
+    """
+    壊れた位置が渡されたら最後のページを表示する
+    """
+    if not value:
+        return None
+    try:
+        return ChatLogCursor.decode(value)
+    except ValueError:
+        return None
+
+
 class HomeView(FormView):
     template_name = "retrieval_qa_with_source/home.html"
     form_class = UserTextForm
@@ -19,9 +40,11 @@ class HomeView(FormView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         login_user = User.objects.get(pk=1)  # TODO: request.user.id
-        context["chat_logs"] = ChatLogsWithSource.objects.filter(
-            user=login_user
-        ).order_by("thread", "created_at")
+        page = ChatLogRepository.find_chatlog_page_by_user_id(
+            login_user.pk, before=parse_cursor(self.request.GET.get("before"))
+        )
+        context["chat_logs"] = page.rows
+        context["older_cursor"] = page.older.encode() if page.older else None
 
         return context
 
@@ -29,12 +52,22 @@ class HomeView(FormView):
         form_data = form.cleaned_data
         login_user = User.objects.get(pk=1)  # TODO: request.user.id
 
-        file_path = (
-            Path(BASE_DIR)
-            / "retrieval_qa_with_source/tests/domain/valueobject/令和4年版少子化社会対策白書全体版（PDF版）.pdf"
-        )
+        dataloader: Dataloader
+        vectorstore_repository = None
+        if RETRIEVAL_CORPUS_DIR:
+            # コーパスの取り込みは ingest_corpus で行う。リクエストの中では取り込み済みのインデックスを読むだけ
+            dataloader = CorpusDataloader(RETRIEVAL_CORPUS_DIR)
+            vectorstore_repository = VectorStoreRepository(read_only=True)
+        else:
+            file_path = (
+                Path(BASE_DIR)
+                / "retrieval_qa_with_source/tests/domain/valueobject/令和4年版少子化社会対策白書全体版（PDF版）.pdf"
+            )
+            dataloader = PdfDataloader(str(file_path))
         chat_history = []  # TODO: 過去ログを含めるかどうかは要判断
-        gpt_pdf_service = GptPdfService(PdfDataloader(str(file_path)))
+        gpt_pdf_service = GptPdfService(
+            dataloader, vectorstore_repository=vectorstore_repository
+        )
         result = gpt_pdf_service.gpt_answer(form_data["question"], chat_history)
         # TODO: うまく改行できてねーなー（一番下にスクロールするのもつけたほうがいいかも...っていうかAjaxだよ）
         source_documents = "<br>".join(